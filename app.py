@@ -4,24 +4,29 @@ Interactive search with AI chatbot assistance
 """
 
 import streamlit as st
-import chromadb
-from chromadb.config import Settings
 from pathlib import Path
 import sys
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import os
 
 PROJECT_ROOT = Path(__file__).parent.absolute()
+DB_PATH = PROJECT_ROOT / "data" / "vector_db"
 
 sys.path.append(str(PROJECT_ROOT / 'scripts'))
 
+# Only light modules are imported up front: chromadb and the search engine load
+# on a background thread (start_search_engine), pandas and plotly in the pages
+# that draw tables and charts
 try:
-    from search_utils import SmartSearch
-except ImportError:
-    st.error(" Cannot import search_utils. Make sure scripts/search_utils.py exists!")
+    from drug_filters import DrugFilter
+    from intent_router import IntentRouter
+    from assistant import generate_response_stream
+    from instrumentation import metrics
+    from startup import BackgroundLoader
+    from snapshots import SnapshotWatcher, current_snapshot
+except ImportError as e:
+    st.error(f" Cannot import {e.name or 'a required module'}: {e}. Make sure the scripts/ directory "
+             "is complete and the requirements are installed.")
     st.stop()
 
 st.set_page_config(
@@ -62,274 +67,152 @@ if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'search_results' not in st.session_state:
     st.session_state.search_results = None
+if 'last_trace' not in st.session_state:
+    st.session_state.last_trace = None
+
+def open_search_engine(db_path, snapshot=None):
+    """Open the collections and build SmartSearch (runs on the loader thread), from a snapshot if given"""
+    from search_utils import SmartSearch
+    from vector_backend import open_collections
+    
+    if snapshot is not None:
+        db_path = snapshot.vector_db
+    drug_collection, disease_collection = open_collections(db_path)
+    
+    # SEARCH_BACKEND=numpy serves similarity queries from the in-process embedding matrices,
+    # SEARCH_BACKEND=quantized from int8 or PQ codes of them (SEARCH_QUANTIZATION=int8|pq)
+    backend = os.environ.get("SEARCH_BACKEND", "chroma")
+    backend_options = {}
+    if backend == "quantized":
+        backend_options['quantization'] = os.environ.get("SEARCH_QUANTIZATION", "int8")
+    if snapshot is not None:
+        # Every artifact is read from the snapshot directory
+        backend_options.update(snapshot.search_options(backend))
+    smart_search = SmartSearch(
+        drug_collection,
+        disease_collection,
+        backend=backend,
+        embedding_cache_path=PROJECT_ROOT / "data" / "cache" / "query_embeddings.npz",
+        **backend_options
+    )
+    
+    return drug_collection, disease_collection, smart_search
+
+def database_available():
+    return DB_PATH.exists() or current_snapshot() is not None
 
 @st.cache_resource
+def start_search_engine():
+    """
+    Start loading the database in the background, once per server process, then warm it up
+    With published snapshots (scripts/snapshots.py) the active one is served, and a newly
+    activated snapshot is loaded in the background and swapped in without a restart
+    """
+    warm_up = lambda engine: engine[2].warm_up()
+    if current_snapshot() is not None:
+        return SnapshotWatcher(lambda snapshot: open_search_engine(DB_PATH, snapshot), warm_up=warm_up)
+    return BackgroundLoader(lambda: open_search_engine(DB_PATH), warm_up=warm_up)
+
 def load_database():
-    """Load ChromaDB database (cached)"""
-    
-    db_path = PROJECT_ROOT / "data" / "vector_db"
+    """ChromaDB collections and SmartSearch, waiting for the background load if it is still running"""
     
-    if not db_path.exists():
+    if not database_available():
         st.error(f" Database not found!")
-        st.error(f"Expected location: `{db_path}`")
+        st.error(f"Expected location: `{DB_PATH}`")
         
         st.info("###  Setup Steps:")
         st.code("""
             # Run these commands from your project root:
             cd """ + str(PROJECT_ROOT) + """
 
-            python scripts/01_download_data.py
-            python scripts/02_collect_metadata.py
-            python scripts/03_enrich_metadata.py
-            python scripts/04_create_embeddings.py
-            python scripts/05_setup_vector_db.py
+            python scripts/ingest.py
                     """, language="bash")
         
         st.stop()
     
-    try:
-        client = chromadb.PersistentClient(
-            path=str(db_path),
-            settings=Settings(anonymized_telemetry=False)
-        )
-        
-        drug_collection = client.get_collection("drugs")
-        disease_collection = client.get_collection("diseases")
-        
-        smart_search = SmartSearch(drug_collection, disease_collection)
-        
-        return drug_collection, disease_collection, smart_search
+    loader = start_search_engine()
+    if not loader.ready():
+        with st.spinner(" Loading the search index..."):
+            loader.wait()
     
-    except Exception as e:
-        st.error(f" Error loading database: {str(e)}")
+    if loader.error is not None:
+        # Retry on the next rerun instead of caching the failure
+        start_search_engine.clear()
+        st.error(f" Error loading database: {str(loader.error)}")
         st.stop()
-
-def generate_smart_response(user_input, smart_search, drug_collection, disease_collection):
-    """Generate intelligent responses based on user input"""
-    import re
-    
-    user_lower = user_input.lower().strip()
-    
-    filler_words = ['what', 'is', 'a', 'an', 'the', 'about', 'tell', 'me', 'can', 'you', 'help', 'with', 'for']
-    words = user_lower.split()
-    clean_words = [w for w in words if w not in filler_words]
-    clean_query = ' '.join(clean_words)
-    
-    disease_patterns = {
-        'alzheimer': {
-            'keywords': ['alzheimer', 'alzhimer', 'alziehmer', 'alzheimers', 'dementia', 'memory loss', 'cognitive decline'],
-            'search_query': "Alzheimer's disease neurodegeneration cognitive decline dementia brain memory",
-            'display_name': "Alzheimer's disease"
-        },
-        'diabetes': {
-            'keywords': ['diabetes', 'diabetic', 'diabetis', 'sugar', 'insulin', 'glucose'],
-            'search_query': "diabetes mellitus insulin glucose blood sugar metabolic",
-            'display_name': "Diabetes"
-        },
-        'cancer': {
-            'keywords': ['cancer', 'tumor', 'carcinoma', 'malignant', 'oncology'],
-            'search_query': "cancer carcinoma tumor malignant neoplasm oncology",
-            'display_name': "Cancer"
-        },
-        'heart': {
-            'keywords': ['heart', 'cardiac', 'cardiovascular', 'coronary', 'myocardial'],
-            'search_query': "heart disease cardiovascular coronary cardiac myocardial",
-            'display_name': "Heart Disease"
-        },
-        'parkinson': {
-            'keywords': ['parkinson', 'parkinsons', 'tremor', 'movement disorder'],
-            'search_query': "Parkinson's disease movement disorder tremor dopamine",
-            'display_name': "Parkinson's disease"
-        },
-        'depression': {
-            'keywords': ['depression', 'depressed', 'sad', 'mood disorder', 'mental health'],
-            'search_query': "depression mental health mood disorder psychiatric",
-            'display_name': "Depression"
-        },
-        'hypertension': {
-            'keywords': ['hypertension', 'high blood pressure', 'blood pressure'],
-            'search_query': "hypertension high blood pressure cardiovascular",
-            'display_name': "Hypertension"
-        },
-        'asthma': {
-            'keywords': ['asthma', 'breathing', 'respiratory', 'airway'],
-            'search_query': "asthma respiratory breathing airway inflammation",
-            'display_name': "Asthma"
-        },
-        'arthritis': {
-            'keywords': ['arthritis', 'joint pain', 'rheumatoid', 'osteoarthritis'],
-            'search_query': "arthritis joint inflammation pain rheumatoid",
-            'display_name': "Arthritis"
-        }
-    }
     
-    if any(phrase in user_lower for phrase in ['what is', 'what are', 'tell me about', 'explain', 'define']):
-        for disease_key, disease_info in disease_patterns.items():
-            for keyword in disease_info['keywords']:
-                if keyword in user_lower:
-                    disease_name = disease_info['display_name']
-                    
-                    descriptions = {
-                        "Alzheimer's disease": "**Alzheimer's disease** is a progressive neurodegenerative disorder that affects memory, thinking, and behavior. It's the most common cause of dementia.",
-                        "Diabetes": "**Diabetes** is a metabolic disorder characterized by high blood sugar levels. Type 2 diabetes involves insulin resistance.",
-                        "Cancer": "**Cancer** is a group of diseases involving abnormal cell growth with the potential to invade or spread to other parts of the body.",
-                        "Heart Disease": "**Heart disease** refers to conditions that affect the heart, including coronary artery disease, heart attacks, and heart failure.",
-                        "Parkinson's disease": "**Parkinson's disease** is a progressive nervous system disorder that affects movement, causing tremors, stiffness, and balance problems.",
-                        "Depression": "**Depression** is a mental health disorder characterized by persistent feelings of sadness, loss of interest, and low energy.",
-                        "Hypertension": "**Hypertension** (high blood pressure) is a condition where the force of blood against artery walls is consistently too high.",
-                        "Asthma": "**Asthma** is a chronic respiratory condition causing inflammation and narrowing of airways, leading to breathing difficulties.",
-                        "Arthritis": "**Arthritis** is inflammation of the joints, causing pain and stiffness. Common types include osteoarthritis and rheumatoid arthritis."
-                    }
-                    
-                    response = descriptions.get(disease_name, f"**{disease_name}** is a medical condition.")
-                    response += f"\n\n**Potential drug candidates for {disease_name}:**\n\n"
-                    
-                    results = smart_search.search_drugs_fuzzy(disease_info['search_query'], top_k=5)
-                    
-                    for r in results[:5]:
-                        response += f"**{r['rank']}. {r['drug_name']}** - {r['confidence']}% confidence\n"
-                    
-                    response += f"\n Use the ** Smart Search** tab to explore more treatment options for {disease_name}!"
-                    return response
-    
-    for disease_key, disease_info in disease_patterns.items():
-        for keyword in disease_info['keywords']:
-            if keyword in clean_query or keyword in user_lower:
-                results = smart_search.search_drugs_fuzzy(disease_info['search_query'], top_k=5)
-                
-                disease_name = disease_info['display_name']
-                response = f"**Drug candidates for {disease_name}:**\n\n"
-                
-                for r in results[:5]:
-                    response += f"**{r['rank']}. {r['drug_name']}** - Confidence: {r['confidence']}%\n"
-                    
-                    mw = r['molecular_weight']
-                    if isinstance(mw, (int, float)) and mw > 0:
-                        response += f"   • Molecular Weight: {mw:.2f}\n"
-                    response += f"   • Drug-like: {'' if r['passes_lipinski'] else ''}\n"
-                    response += f"   • BBB Permeable: {'' if r['bbb_permeable'] else ''}\n\n"
-                
-                response += f"\n Try the ** Smart Search** tab for detailed results with charts!"
-                return response
-    
-    drug_names_common = [
-        'aspirin', 'ibuprofen', 'metformin', 'paracetamol', 'acetaminophen',
-        'insulin', 'atorvastatin', 'lisinopril', 'amlodipine', 'metoprolol',
-        'omeprazole', 'simvastatin', 'losartan', 'gabapentin', 'sertraline'
-    ]
-    
-    for drug in drug_names_common:
-        if drug in user_lower:
-            exact_match, suggestions = smart_search.find_drug(drug)
-            
-            if exact_match:
-                drug_result = drug_collection.get(
-                    where={"drug_name": exact_match},
-                    include=["embeddings"]
-                )
-                
-                if drug_result['ids'] and len(drug_result['ids']) > 0:
-                    results = disease_collection.query(
-                        query_embeddings=[drug_result['embeddings'][0]],
-                        n_results=5
-                    )
-                    
-                    response = f"**Potential uses for {exact_match}:**\n\n"
-                    
-                    for i, (metadata, distance) in enumerate(zip(
-                        results['metadatas'][0],
-                        results['distances'][0]
-                    ), 1):
-                        confidence = (1 - distance) * 100
-                        response += f"{i}. **{metadata['disease_name']}** - {confidence:.1f}% confidence\n"
-                    
-                    response += "\n Use the ** Smart Search** tab to explore more!"
-                    return response
-    
-    if any(word in user_lower for word in ['how', 'explain', 'tell']):
-        if 'drug repurposing' in user_lower or 'repurpose' in user_lower or 'work' in user_lower:
-            return """**About Drug Repurposing:**
-
-Drug repurposing (or repositioning) is finding new therapeutic uses for existing drugs. 
-
-**Why it matters:**
--  **Faster** - Years instead of decades
--  **Cheaper** - Millions vs billions of dollars  
--  **Safer** - Drugs already passed safety trials
--  **AI-powered** - Finds hidden connections in data
-
-**How this system works:**
-1. Drugs and diseases are converted to AI embeddings (vectors)
-2. Similar vectors = similar biological properties
-3. Search finds the best drug-disease matches
-4. Confidence scores show how strong the match is
-
-**Try it yourself:**
-- Type "diabetes" or "alzheimer" to find drug candidates
-- Type a drug name to find new uses
-- Use the  Smart Search tab for detailed results!"""
-        
-        elif 'use' in user_lower or 'help' in user_lower:
-            return """**How to use this system:**
-
-** Smart Search Tab:**
-- Find drugs for diseases
-- Find diseases for drugs  
-- Find similar drugs
-- Case-insensitive & fuzzy matching!
-
-** AI Assistant (here!):**
-- Ask about diseases: *"What is Alzheimer's?"*
-- Ask about drugs: *"What can Metformin treat?"*
-- Get drug suggestions: *"Drugs for diabetes"*
-
-** Analytics Tab:**
-- View database statistics
-- See drug property distributions
+    return loader.value
 
-** Database Explorer:**
-- Browse all drugs and diseases
+@st.cache_resource(max_entries=2)
+def load_intent_router(_smart_search, version):
+    """Intent router over every drug name in the collection (rebuilt when the data version or the engine changes)"""
+    return IntentRouter(_smart_search.drug_names)
 
-**Example questions:**
-- "What drugs help with Alzheimer's?"
-- "What is diabetes?"
-- "What can Aspirin be used for?"
-- "Drugs for heart disease"
+def generate_smart_response(user_input, smart_search, drug_collection, disease_collection):
+    """Generate intelligent responses based on user input"""
+    return "".join(generate_smart_response_stream(user_input, smart_search, drug_collection, disease_collection))
 
-Try asking about any disease!"""
-    
-    if len(clean_words) <= 3:  
-        for disease_key, disease_info in disease_patterns.items():
-            for keyword in disease_info['keywords']:
-                if keyword in user_lower or user_lower in keyword:
-                    results = smart_search.search_drugs_fuzzy(disease_info['search_query'], top_k=5)
-                    
-                    disease_name = disease_info['display_name']
-                    response = f"**Searching for drugs to treat {disease_name}...**\n\n"
-                    
-                    for r in results[:5]:
-                        response += f"**{r['rank']}. {r['drug_name']}** - {r['confidence']}% confidence\n"
-                    
-                    response += f"\n Want to know more about {disease_name}? Ask: *'What is {disease_name}?'*"
-                    return response
-    
-    return """I'm here to help with drug repurposing! 
+def generate_smart_response_stream(user_input, smart_search, drug_collection, disease_collection):
+    """Generate the response in chunks for st.write_stream (see scripts/assistant.py)"""
+    # A swapped-in snapshot is a new engine; its id stays unique while a cached router holds it
+    router = load_intent_router(smart_search, (id(smart_search), smart_search.version))
+    return generate_response_stream(user_input, smart_search, router)
 
-**I can answer:**
-- "What drugs treat Alzheimer's?" 
-- "What is diabetes?"
-- "What can Metformin be used for?"
-- "Drugs for heart disease"
-- "Tell me about drug repurposing"
+def drug_filter_controls(key_prefix):
+    """Property filter widgets, returns the DrugFilter they describe"""
+    choices = {"Any": None, "Yes": True, "No": False}
+    fcol1, fcol2, fcol3 = st.columns(3)
+    with fcol1:
+        bbb_choice = st.selectbox("BBB permeable", list(choices), key=f"{key_prefix}_bbb")
+        lipinski_choice = st.selectbox("Passes Lipinski", list(choices), key=f"{key_prefix}_lipinski")
+    with fcol2:
+        mw_range = st.slider("Molecular weight (Da)", 0, 1000, (0, 1000), step=10, key=f"{key_prefix}_mw")
+    with fcol3:
+        min_trials = st.number_input("Min. clinical trials", min_value=0, value=0, step=1, key=f"{key_prefix}_trials")
+    
+    return DrugFilter(
+        bbb_permeable=choices[bbb_choice],
+        passes_lipinski=choices[lipinski_choice],
+        min_molecular_weight=mw_range[0] if mw_range[0] > 0 else None,
+        max_molecular_weight=mw_range[1] if mw_range[1] < 1000 else None,
+        min_clinical_trials=min_trials,
+    )
 
-**Or just type:**
-- Disease name: *"alzheimer"*, *"cancer"*, *"diabetes"*
-- Drug name: *"aspirin"*, *"metformin"*
+EXPLORER_PAGE_SIZES = [25, 50, 100, 250]
 
-**Pro tip:** The ** Smart Search** tab gives you detailed results with molecular properties and confidence scores!
+def explorer_table(view, key, noun, text, sort_columns, columns, mask=None, column_config=None):
+    """
+    One page of an ExplorerView (scripts/metadata_snapshot.py) as a single dataframe,
+    with sort and paging controls; only the visible rows are sent to the browser
+    """
+    scol1, scol2, scol3, scol4 = st.columns([2, 1, 1, 1])
+    with scol1:
+        sort_label = st.selectbox("Sort by", list(sort_columns), key=f"{key}_sort")
+    with scol2:
+        descending = st.checkbox("Descending", key=f"{key}_descending")
+    with scol3:
+        page_size = st.selectbox("Rows per page", EXPLORER_PAGE_SIZES, index=1, key=f"{key}_page_size")
+    
+    rows = view.select(text, mask, sort_columns[sort_label], descending)
+    pages = max(1, -(-len(rows) // page_size))
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        # A narrower filter left the current page out of range
+        st.session_state[f"{key}_page"] = pages
+    with scol4:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+    
+    first = (page - 1) * page_size
+    st.write(f"Showing {min(first + 1, len(rows))}-{min(first + page_size, len(rows))} of {len(rows)} matching {noun} ({len(view)} in total)")
+    st.dataframe(
+        view.page(rows, page - 1, page_size, columns),
+        use_container_width=True,
+        hide_index=True,
+        column_config=column_config
+    )
 
-Try asking about a disease or drug!"""
-drug_collection, disease_collection, smart_search = load_database()
+if database_available():
+    # Loading starts before anything is drawn, the page chrome renders meanwhile
+    start_search_engine()
 
 st.markdown('<h1 class="main-header">🧬 Drug Repurposing AI</h1>', unsafe_allow_html=True)
 st.markdown("### Discover new therapeutic uses for existing drugs using AI")
@@ -341,7 +224,10 @@ with st.sidebar:
         "Choose a feature:",
         [" Smart Search", " AI Assistant", " Analytics", " Database Explorer"]
     )
-    
+
+drug_collection, disease_collection, smart_search = load_database()
+
+with st.sidebar:
     st.markdown("---")
     
     drug_count = drug_collection.count()
@@ -359,6 +245,9 @@ with st.sidebar:
     """)
 
 if page == " Smart Search":
+    import pandas as pd
+    import plotly.express as px
+    
     st.header(" Intelligent Drug Search")
     
     col1, col2 = st.columns([2, 1])
@@ -382,67 +271,89 @@ if page == " Smart Search":
             key="disease_search"
         )
         
+        with st.expander(" Property filters"):
+            drug_filter = drug_filter_controls("filter")
+            st.caption("Filters are applied during ranking, so you still get the top matches among the drugs that pass. Drugs with unknown values are excluded by a filter on that property.")
+        
+        hybrid = st.checkbox(
+            "Also match keywords (formulas, InChIKeys, trial titles)",
+            key="hybrid_search",
+            help="Combines semantic search with a BM25 keyword index using reciprocal rank fusion"
+        )
+        
         if st.button(" Search", type="primary", use_container_width=True):
             if query:
-                with st.spinner(" AI is analyzing..."):
-                    results = smart_search.search_drugs_fuzzy(query, top_k=top_k)
+                with st.spinner(" AI is analyzing..."), metrics.trace("Drugs for a Disease") as trace:
+                    st.session_state.last_trace = trace
+                    if hybrid:
+                        results = smart_search.search_drugs_hybrid(query, top_k=top_k, filters=drug_filter)
+                    else:
+                        results = smart_search.search_drugs_fuzzy(query, top_k=top_k, filters=drug_filter)
                     st.session_state.search_results = results
                     
                     if results:
                         st.success(f" Found {len(results)} potential drug candidates!")
                         
-                        for result in results:
-                            confidence = result['confidence']
+                        with metrics.span("render_results"):
+                            for result in results:
+                                confidence = result['confidence']
                             
-                            if confidence >= 75:
-                                conf_class = "confidence-high"
-                            elif confidence >= 60:
-                                conf_class = "confidence-medium"
-                            else:
-                                conf_class = "confidence-low"
+                                if confidence >= 75:
+                                    conf_class = "confidence-high"
+                                elif confidence >= 60:
+                                    conf_class = "confidence-medium"
+                                else:
+                                    conf_class = "confidence-low"
                             
-                            with st.expander(f"{result['rank']}. {result['drug_name']} - {confidence}% confidence"):
-                                col1, col2, col3 = st.columns(3)
+                                with st.expander(f"{result['rank']}. {result['drug_name']} - {confidence}% confidence"):
+                                    col1, col2, col3 = st.columns(3)
+                                
+                                    with col1:
+                                        st.metric("Confidence Score", f"{confidence}%")
+                                        st.caption(f"Rank: #{result['rank']}")
                                 
-                                with col1:
-                                    st.metric("Confidence Score", f"{confidence}%")
-                                    st.caption(f"Rank: #{result['rank']}")
+                                    with col2:
+                                        mw = result['molecular_weight']
+                                        mw_display = f"{mw:.2f}" if isinstance(mw, (int, float)) and mw > 0 else "N/A"
+                                        st.metric("Molecular Weight", mw_display)
+                                        st.caption(f"Clinical Trials: {result['clinical_trials']}")
                                 
-                                with col2:
-                                    mw = result['molecular_weight']
-                                    mw_display = f"{mw:.2f}" if isinstance(mw, (int, float)) and mw > 0 else "N/A"
-                                    st.metric("Molecular Weight", mw_display)
-                                    st.caption(f"Clinical Trials: {result['clinical_trials']}")
+                                    with col3:
+                                        lipinski = " Yes" if result['passes_lipinski'] else " No"
+                                        bbb = " Yes" if result['bbb_permeable'] else " No"
+                                        st.metric("Drug-like", lipinski)
+                                        st.caption(f"BBB Permeable: {bbb}")
                                 
-                                with col3:
-                                    lipinski = " Yes" if result['passes_lipinski'] else " No"
-                                    bbb = " Yes" if result['bbb_permeable'] else " No"
-                                    st.metric("Drug-like", lipinski)
-                                    st.caption(f"BBB Permeable: {bbb}")
+                                    if result.get('match'):
+                                        match = {'both': "keyword + semantic", 'lexical': "keyword", 'semantic': "semantic"}[result['match']]
+                                        st.caption(f"Matched by: {match}")
                                 
-                                if result['pubchem_cid'] and result['pubchem_cid'] != "unknown":
-                                    st.markdown(f"[ View on PubChem](https://pubchem.ncbi.nlm.nih.gov/compound/{result['pubchem_cid']})")
+                                    if result['pubchem_cid'] and result['pubchem_cid'] != "unknown":
+                                        st.markdown(f"[ View on PubChem](https://pubchem.ncbi.nlm.nih.gov/compound/{result['pubchem_cid']})")
                         
-                        st.markdown("---")
-                        st.subheader(" Confidence Distribution")
+                        with metrics.span("render_chart"):
+                            st.markdown("---")
+                            st.subheader(" Confidence Distribution")
                         
-                        df = pd.DataFrame(results)
-                        fig = px.bar(
-                            df.head(10),
-                            x='drug_name',
-                            y='confidence',
-                            color='confidence',
-                            color_continuous_scale='Viridis',
-                            title='Top 10 Drug Candidates by Confidence'
-                        )
-                        fig.update_layout(xaxis_tickangle=-45)
-                        st.plotly_chart(fig, use_container_width=True)
+                            df = pd.DataFrame(results)
+                            fig = px.bar(
+                                df.head(10),
+                                x='drug_name',
+                                y='confidence',
+                                color='confidence',
+                                color_continuous_scale='Viridis',
+                                title='Top 10 Drug Candidates by Confidence'
+                            )
+                            fig.update_layout(xaxis_tickangle=-45)
+                            st.plotly_chart(fig, use_container_width=True)
+                    elif drug_filter:
+                        st.warning("No drugs match these filters. Try relaxing them!")
                     else:
                         st.warning("No results found. Try a different query!")
             else:
                 st.warning(" Please enter a search query!!")
     
-    elif search_type == " Diseases for a Drug":
+    elif search_type == "Diseases for a Drug":
         drug_query = st.text_input(
             " Enter drug name:",
             placeholder="e.g., aspirin, metformin, ibuprofen...",
@@ -451,39 +362,30 @@ if page == " Smart Search":
         
         if st.button(" Search", type="primary", use_container_width=True):
             if drug_query:
-                with st.spinner(" Searching..."):
+                with st.spinner(" Searching..."), metrics.trace("Diseases for a Drug") as trace:
+                    st.session_state.last_trace = trace
                     exact_match, suggestions = smart_search.find_drug(drug_query)
                     
                     if exact_match:
-                        drug_result = drug_collection.get(
-                            where={"drug_name": exact_match},
-                            include=["embeddings"]
-                        )
+                        results = smart_search.diseases_for_drug(exact_match, top_k=top_k)
                         
-                        if drug_result['ids'] and len(drug_result['ids']) > 0:
-                            results = disease_collection.query(
-                                query_embeddings=[drug_result['embeddings'][0]],
-                                n_results=top_k
-                            )
+                        if results:
+                            st.success(f" Found {len(results)} potential applications for **{exact_match}**")
                             
-                            st.success(f" Found {len(results['metadatas'][0])} potential applications for **{exact_match}**")
-                            
-                            for i, (metadata, distance) in enumerate(zip(
-                                results['metadatas'][0],
-                                results['distances'][0]
-                            ), 1):
-                                confidence = (1 - distance) * 100
+                            with metrics.span("render_results"):
+                                for result in results:
+                                    confidence = result['confidence']
                                 
-                                with st.expander(f"{i}. {metadata['disease_name']} - {confidence:.1f}% confidence"):
-                                    col1, col2 = st.columns(2)
+                                    with st.expander(f"{result['rank']}. {result['disease_name']} - {confidence:.1f}% confidence"):
+                                        col1, col2 = st.columns(2)
                                     
-                                    with col1:
-                                        st.metric("Confidence", f"{confidence:.1f}%")
-                                        st.caption(f"EFO ID: {metadata['efo_id']}")
+                                        with col1:
+                                            st.metric("Confidence", f"{confidence:.1f}%")
+                                            st.caption(f"EFO ID: {result['efo_id']}")
                                     
-                                    with col2:
-                                        st.metric("Known Drugs", metadata['known_drugs_count'])
-                                        st.caption(f"Associated Targets: {metadata['targets_count']}")
+                                        with col2:
+                                            st.metric("Known Drugs", result['known_drugs_count'])
+                                            st.caption(f"Associated Targets: {result['targets_count']}")
                     
                     elif suggestions:
                         st.warning(f" Drug '{drug_query}' not found. Did you mean:")
@@ -501,38 +403,48 @@ if page == " Smart Search":
             key="similar_search"
         )
         
+        structural_weight = 0.0
+        if smart_search.fingerprints is not None:
+            structural_weight = st.slider(
+                "Structural similarity weight",
+                min_value=0.0, max_value=1.0, value=0.0, step=0.1,
+                help="Blend in chemical-structure similarity (Tanimoto over Morgan fingerprints): "
+                     "0 ranks by description embeddings only, 1 by structure only",
+                key="structural_weight"
+            )
+        
         if st.button(" Find Similar", type="primary", use_container_width=True):
             if drug_query:
-                with st.spinner("🔍 Searching..."):
+                with st.spinner("🔍 Searching..."), metrics.trace("Similar Drugs") as trace:
+                    st.session_state.last_trace = trace
                     exact_match, suggestions = smart_search.find_drug(drug_query)
                     
                     if exact_match:
-                        drug_result = drug_collection.get(
-                            where={"drug_name": exact_match},
-                            include=["embeddings"]
-                        )
+                        results = smart_search.similar_drugs(exact_match, top_k=top_k, structural_weight=structural_weight)
                         
-                        if drug_result['ids'] and len(drug_result['ids']) > 0:
-                            results = drug_collection.query(
-                                query_embeddings=[drug_result['embeddings'][0]],
-                                n_results=top_k + 1
-                            )
-                            
+                        if results:
                             st.success(f" Drugs similar to **{exact_match}**:")
                             
-                            # Skip first result (the drug itself)
-                            for i, (metadata, distance) in enumerate(zip(
-                                results['metadatas'][0][1:],
-                                results['distances'][0][1:]
-                            ), 1):
-                                similarity = (1 - distance) * 100
-                                
-                                st.write(f"{i}. **{metadata['drug_name']}** - Similarity: {similarity:.1f}%")
+                            with metrics.span("render_results"):
+                                for result in results:
+                                    line = f"{result['rank']}. **{result['drug_name']}** - Similarity: {result['confidence']:.1f}%"
+                                    if result.get('structural_similarity') is not None:
+                                        line += f" · Structure: {result['structural_similarity']:.1f}%"
+                                    st.write(line)
                     
                     elif suggestions:
                         st.warning(f" Drug '{drug_query}' not found. Did you mean:")
                         for sug in suggestions:
                             st.write(f"- {sug}")
+    
+    last_trace = st.session_state.last_trace
+    if last_trace is not None and last_trace.total_ms is not None:
+        with st.expander(" Debug: timing breakdown of the last search"):
+            st.caption(f"{last_trace.name} - {last_trace.total_ms:.1f} ms in total")
+            breakdown = pd.DataFrame(last_trace.breakdown())
+            if not breakdown.empty:
+                breakdown['span'] = ['  ' * depth + name for name, depth in zip(breakdown['span'], breakdown['depth'])]
+                st.dataframe(breakdown.drop(columns=['depth']), use_container_width=True, hide_index=True)
 
 elif page == " AI Assistant":
     st.header(" AI Drug Repurposing Assistant")
@@ -540,6 +452,7 @@ elif page == " AI Assistant":
     
     user_input = st.text_input("Ask a question:", placeholder="e.g., What drugs could help with Alzheimer's?")
     
+    pending_question = None
     if st.button("Send", type="primary"):
         if user_input:
             st.session_state.chat_history.append({
@@ -547,14 +460,7 @@ elif page == " AI Assistant":
                 'content': user_input,
                 'timestamp': datetime.now()
             })
-            
-            response = generate_smart_response(user_input, smart_search, drug_collection, disease_collection)
-            
-            st.session_state.chat_history.append({
-                'role': 'assistant',
-                'content': response,
-                'timestamp': datetime.now()
-            })
+            pending_question = user_input
     
     st.markdown("---")
     for msg in st.session_state.chat_history:
@@ -566,89 +472,124 @@ elif page == " AI Assistant":
         st.caption(msg['timestamp'].strftime("%H:%M:%S"))
         st.markdown("---")
     
+    if pending_question:
+        # The answer streams in below the question while retrieval is still running
+        st.markdown(f"**🤖 AI Assistant:**")
+        response = st.write_stream(
+            generate_smart_response_stream(pending_question, smart_search, drug_collection, disease_collection)
+        )
+        
+        st.session_state.chat_history.append({
+            'role': 'assistant',
+            'content': response,
+            'timestamp': datetime.now()
+        })
+        st.caption(st.session_state.chat_history[-1]['timestamp'].strftime("%H:%M:%S"))
+        st.markdown("---")
+    
     if st.session_state.chat_history:
         if st.button("🗑️ Clear Chat History"):
             st.session_state.chat_history = []
             st.rerun()
 
 elif page == " Analytics":
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     st.header(" Database Analytics")
     
-    all_drugs = drug_collection.get(include=["metadatas"])
-    drugs_df = pd.DataFrame(all_drugs['metadatas'])
+    snapshot = smart_search.metadata_snapshot()
     
     col1, col2 = st.columns(2)
     
     with col1:
-        if 'passes_lipinski' in drugs_df.columns:
-            lipinski_counts = drugs_df['passes_lipinski'].value_counts()
+        lipinski_counts = snapshot.value_counts['passes_lipinski']
+        if lipinski_counts:
             fig = px.pie(
-                values=lipinski_counts.values,
-                names=['Passes Lipinski' if lipinski_counts.index[i] else 'Fails Lipinski' for i in range(len(lipinski_counts))],
+                values=list(lipinski_counts.values()),
+                names=['Passes Lipinski' if passes else 'Fails Lipinski' for passes in lipinski_counts],
                 title='Drug-Likeness Distribution'
             )
             st.plotly_chart(fig, use_container_width=True)
     
     with col2:
-        if 'bbb_permeable' in drugs_df.columns:
-            bbb_counts = drugs_df['bbb_permeable'].value_counts()
+        bbb_counts = snapshot.value_counts['bbb_permeable']
+        if bbb_counts:
             fig = px.pie(
-                values=bbb_counts.values,
-                names=['BBB Permeable' if bbb_counts.index[i] else 'Not BBB Permeable' for i in range(len(bbb_counts))],
+                values=list(bbb_counts.values()),
+                names=['BBB Permeable' if permeable else 'Not BBB Permeable' for permeable in bbb_counts],
                 title='Blood-Brain Barrier Permeability'
             )
             st.plotly_chart(fig, use_container_width=True)
     
-    if 'molecular_weight' in drugs_df.columns:
-        drugs_df['molecular_weight'] = pd.to_numeric(drugs_df['molecular_weight'], errors='coerce')
-        valid_mw = drugs_df[drugs_df['molecular_weight'] > 0]
-        
-        if len(valid_mw) > 0:
-            fig = px.histogram(
-                valid_mw,
-                x='molecular_weight',
-                nbins=30,
-                title='Molecular Weight Distribution'
-            )
-            st.plotly_chart(fig, use_container_width=True)
+    if snapshot.molecular_weight_histogram is not None:
+        counts, edges = snapshot.molecular_weight_histogram
+        fig = go.Figure(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=edges[1:] - edges[:-1]
+        ))
+        fig.update_layout(
+            title='Molecular Weight Distribution',
+            xaxis_title='molecular_weight',
+            yaxis_title='count',
+            bargap=0
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
 else:
     st.header(" Database Explorer")
     
+    snapshot = smart_search.metadata_snapshot()
+    
     tab1, tab2 = st.tabs([" Drugs", " Diseases"])
     
     with tab1:
         st.subheader("All Drugs in Database")
-        all_drugs = drug_collection.get(include=["metadatas"])
-        drugs_list = [m.get('drug_name', 'Unknown') for m in all_drugs['metadatas']]
         
         search_filter = st.text_input(" Filter drugs:", placeholder="Type to filter...")
+        with st.expander(" Property filters"):
+            drug_filter = drug_filter_controls("explorer")
         
-        if search_filter:
-            filtered = [d for d in drugs_list if search_filter.lower() in d.lower()]
-        else:
-            filtered = drugs_list
-        
-        st.write(f"Showing {len(filtered)} of {len(drugs_list)} drugs")
-        
-        cols = st.columns(3)
-        for i, drug in enumerate(sorted(filtered)):
-            cols[i % 3].write(f"• {drug}")
+        explorer_table(
+            snapshot.drug_view, "explorer_drugs", "drugs", search_filter,
+            sort_columns={
+                "Name": "drug_name",
+                "Molecular weight": "molecular_weight",
+                "Clinical trials": "clinical_trials_count",
+                "BBB permeable": "bbb_permeable",
+                "Passes Lipinski": "passes_lipinski",
+            },
+            columns=['drug_name', 'molecular_weight', 'bbb_permeable', 'passes_lipinski', 'clinical_trials_count', 'pubchem_cid'],
+            mask=snapshot.drug_properties.mask(drug_filter),
+            column_config={
+                'drug_name': st.column_config.TextColumn("Drug"),
+                'molecular_weight': st.column_config.NumberColumn("Molecular weight (Da)", format="%.1f"),
+                'bbb_permeable': st.column_config.TextColumn("BBB permeable"),
+                'passes_lipinski': st.column_config.TextColumn("Passes Lipinski"),
+                'clinical_trials_count': st.column_config.NumberColumn("Clinical trials"),
+                'pubchem_cid': st.column_config.NumberColumn("PubChem CID", format="%d"),
+            }
+        )
     
     with tab2:
         st.subheader("All Diseases in Database")
-        all_diseases = disease_collection.get(include=["metadatas"])
-        disease_list = [m.get('disease_name', 'Unknown') for m in all_diseases['metadatas']]
         
         search_filter = st.text_input(" Filter diseases:", placeholder="Type to filter...", key="disease_filter")
         
-        if search_filter:
-            filtered = [d for d in disease_list if search_filter.lower() in d.lower()]
-        else:
-            filtered = disease_list
-        
-        st.write(f"Showing {len(filtered)} of {len(disease_list)} diseases")
-        
-        cols = st.columns(2)
-        for i, disease in enumerate(sorted(filtered)):
-            cols[i % 2].write(f"• {disease}")
+        explorer_table(
+            snapshot.disease_view, "explorer_diseases", "diseases", search_filter,
+            sort_columns={
+                "Name": "disease_name",
+                "Targets": "targets_count",
+                "Known drugs": "known_drugs_count",
+            },
+            columns=['disease_name', 'efo_id', 'targets_count', 'known_drugs_count', 'description'],
+            column_config={
+                'disease_name': st.column_config.TextColumn("Disease"),
+                'efo_id': st.column_config.TextColumn("EFO id"),
+                'targets_count': st.column_config.NumberColumn("Targets"),
+                'known_drugs_count': st.column_config.NumberColumn("Known drugs"),
+                'description': st.column_config.TextColumn("Description", width="large"),
+            }
+        )
@@ -0,0 +1,190 @@
+"""
+Memory and recall@k of the quantized search backend
+
+    python benchmarks/quantization_report.py                       # exported drug embeddings
+    python benchmarks/quantization_report.py --synthetic 200000    # random unit vectors
+    python benchmarks/quantization_report.py --methods int8 pq:48 pq:96 --rerank 0 10 20
+
+Every configuration is compared with exact float32 search over the same
+rows (NumpyBackend's ranking). Queries are the disease embeddings plus a
+sample of drug embeddings, or random unit vectors with --synthetic. For each
+quantization the report gives the bytes held in memory per row, and then
+per re-rank factor the recall@k, the largest and mean confidence difference
+between the i-th exact and the i-th quantized result (what a user sees change
+at each rank), and the median query latency. A factor of 0 ranks on
+the codes alone, without re-ranking. Results are written to
+benchmarks/results/quantization.json.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).parent.absolute()
+PROJECT_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+from quantized_index import PQ_SUBSPACES, RERANK_FACTOR, QuantizedIndex  # noqa: E402
+from vector_backend import EMBEDDINGS_DIR, EmbeddingMatrix, QuantizedMatrix, top_k_smallest  # noqa: E402
+
+RESULTS_PATH = BENCH_DIR / "results" / "quantization.json"
+
+
+def confidence(distance):
+    """Result confidence as SmartSearch reports it"""
+    return round((1 - float(distance)) * 100, 1)
+
+
+def load_corpus(args):
+    """(matrix, queries) from the exported embeddings or generated unit vectors"""
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        matrix = rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        return matrix, queries
+
+    embeddings_dir = Path(args.embeddings_dir)
+    matrix_path = embeddings_dir / "drug_embeddings.npy"
+    if not matrix_path.exists():
+        sys.exit(f"{matrix_path} not found: start the numpy backend once to export it, or use --synthetic")
+    matrix = np.load(matrix_path, mmap_mode='r')
+    sample = np.sort(rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False))
+    queries = [np.asarray(matrix[sample], dtype=np.float32)]
+    disease_path = embeddings_dir / "disease_embeddings.npy"
+    if disease_path.exists():
+        queries.insert(0, np.load(disease_path).astype(np.float32))
+    return matrix, np.concatenate(queries)
+
+
+def parse_method(spec):
+    """'int8' or 'pq[:subspaces]' -> (label, method, subspaces)"""
+    method, _, subspaces = spec.partition(":")
+    subspaces = int(subspaces) if subspaces else PQ_SUBSPACES
+    return (f"pq{subspaces}" if method == "pq" else method), method, subspaces
+
+
+def timed_top_k(store, queries, k):
+    """(indices, distances, p50 ms) answering one query at a time, as the app does"""
+    indices, distances, samples = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        i, d = store.top_k(query[None], k)
+        samples.append((time.perf_counter() - start) * 1000)
+        indices.append(i[0])
+        distances.append(d[0])
+    return indices, distances, round(statistics.median(samples), 3)
+
+
+def compare(exact_indices, exact_distances, indices, distances, k):
+    """
+    (recall@k, largest and mean confidence difference per rank): rank i of the
+    quantized results against rank i of the exact ones, so a row missed or
+    moved shows up as the confidence shown at that rank changing
+    """
+    recalls, deltas = [], []
+    for ref_rows, ref_dists, rows, dists in zip(exact_indices, exact_distances, indices, distances):
+        recalls.append(len(set(ref_rows.tolist()) & set(rows.tolist())) / max(len(ref_rows), 1))
+        deltas.extend(abs(confidence(ref) - confidence(d)) for ref, d in zip(ref_dists, dists))
+    deltas = deltas or [0.0]
+    return round(float(np.mean(recalls)), 4), round(max(deltas), 3), round(float(np.mean(deltas)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings-dir", default=str(EMBEDDINGS_DIR))
+    parser.add_argument("--synthetic", type=int, metavar="N_ROWS", help="Evaluate on random unit vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled query rows")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--space", default="l2", choices=["l2", "cosine", "ip"])
+    parser.add_argument("--methods", nargs="+", default=["int8", "pq:48", "pq:96"], help="int8 or pq[:subspaces]")
+    parser.add_argument("--rerank", nargs="+", type=int, default=[0, 5, 10, RERANK_FACTOR],
+                        help="Re-rank factors to evaluate (0 = codes only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(RESULTS_PATH))
+    args = parser.parse_args()
+
+    matrix, queries = load_corpus(args)
+    ids = list(range(len(matrix)))
+    exact = EmbeddingMatrix(matrix, ids, None, args.space)
+    exact_indices, exact_distances, exact_ms = timed_top_k(exact, queries, args.k)
+    float_bytes = matrix.shape[1] * 4
+    print(f"{len(matrix)} rows x {matrix.shape[1]} dims, {len(queries)} queries, k={args.k}, space={args.space}")
+    print(f"float32: {float_bytes} bytes/row, {matrix.nbytes / 2**20:.1f} MB, p50 {exact_ms:.3f} ms\n")
+    print(f"{'index':<8} {'bytes/row':>9} {'MB':>8} {'ratio':>6} {'build s':>8} {'rerank':>7} "
+          f"{'recall@k':>9} {'max dconf':>10} {'mean dconf':>10} {'p50 ms':>8}")
+
+    results = []
+    for spec in args.methods:
+        label, method, subspaces = parse_method(spec)
+        start = time.perf_counter()
+        index = QuantizedIndex.build(matrix, method, subspaces, seed=args.seed)
+        build_seconds = time.perf_counter() - start
+        store = QuantizedMatrix(matrix, ids, None, args.space, index=index)
+        entry = {
+            'index': label,
+            'bytes_per_row': round(index.nbytes / len(matrix), 1),
+            'memory_mb': round(index.nbytes / 2**20, 2),
+            'compression': round(float_bytes * len(matrix) / index.nbytes, 1),
+            'build_seconds': round(build_seconds, 2),
+            'rerank': [],
+        }
+        for factor in args.rerank:
+            if factor:
+                store.rerank_factor = factor
+                indices, distances, p50 = timed_top_k(store, queries, args.k)
+            else:
+                # Ranked on the codes alone
+                indices, distances, samples = [], [], []
+                for query in queries:
+                    query = query[None]
+                    started = time.perf_counter()
+                    rows = index.candidates(query, args.k, args.space)[0]
+                    order, dists = top_k_smallest(index.approximate_distances(query, args.space, rows), args.k)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    indices.append(rows[order[0]])
+                    distances.append(dists[0])
+                p50 = round(statistics.median(samples), 3)
+            recall, max_delta, mean_delta = compare(exact_indices, exact_distances, indices, distances, args.k)
+            entry['rerank'].append({
+                'factor': factor, 'recall_at_k': recall, 'max_confidence_delta': max_delta,
+                'mean_confidence_delta': mean_delta, 'p50_ms': p50,
+            })
+            print(f"{label:<8} {entry['bytes_per_row']:>9.1f} {entry['memory_mb']:>8.2f} {entry['compression']:>5.1f}x "
+                  f"{entry['build_seconds']:>8.2f} {factor or 'none':>7} {recall:>9.4f} {max_delta:>10.3f} "
+                  f"{mean_delta:>10.3f} {p50:>8.3f}")
+        results.append(entry)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': 'synthetic' if args.synthetic else 'exported',
+            'rows': len(matrix),
+            'dim': int(matrix.shape[1]),
+            'queries': len(queries),
+            'k': args.k,
+            'space': args.space,
+        },
+        'float32': {'bytes_per_row': float_bytes, 'memory_mb': round(matrix.nbytes / 2**20, 2), 'p50_ms': exact_ms},
+        'indexes': results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
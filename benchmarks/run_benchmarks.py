@@ -0,0 +1,440 @@
+"""
+Benchmark harness for SmartSearch and the app's data paths
+
+    python benchmarks/run_benchmarks.py                           # shipped data/vector_db
+    python benchmarks/run_benchmarks.py --synthetic 100000        # generated 100k-drug corpus
+    python benchmarks/run_benchmarks.py --save-baseline           # store results as the baseline
+
+Every operation is timed call by call. p50/p95/p99 latency, throughput and
+the process peak RSS after it are written as JSON, then compared with the
+stored baseline for the same corpus and backend (p50/p95 ratios). With
+--fail-on-regression the exit status is 1 when any operation got slower
+than --threshold.
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import platform
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).parent.absolute()
+PROJECT_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+from assistant import generate_response  # noqa: E402
+from intent_router import IntentRouter  # noqa: E402
+from search_utils import SmartSearch  # noqa: E402
+
+RESULTS_PATH = BENCH_DIR / "results" / "latest.json"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+
+DISEASE_QUERIES = [
+    "alzheimer", "diabetes mellitus", "breast cancer", "heart failure", "parkinson",
+    "depression", "hypertension", "asthma", "rheumatoid arthritis", "multiple sclerosis",
+]
+ASSISTANT_MESSAGES = {
+    'disease_info': "What is Alzheimer's disease?",
+    'disease_drugs': "drugs for diabetes",
+    'drug_uses': "What can {drug} be used for?",
+    'about_repurposing': "how does drug repurposing work",
+    'fallback': "good morning",
+}
+
+
+class HashEmbeddingFunction:
+    """
+    Deterministic stand-in for the sentence-transformer model on synthetic
+    corpora (no model download); real runs use the collection's own model
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+    @staticmethod
+    def name():
+        return "benchmark-hash"
+
+    def get_config(self):
+        return {'dim': self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbeddingFunction(config.get('dim', 384))
+
+    def is_legacy(self):
+        return False
+
+
+# --- corpora ---------------------------------------------------------------
+
+SYLLABLES = ["ab", "ac", "al", "am", "an", "ar", "az", "ba", "be", "ci", "co", "da", "de", "di", "fe",
+             "fi", "ga", "ge", "la", "le", "li", "lo", "ma", "me", "mi", "mo", "na", "ne", "ni", "no",
+             "pa", "pe", "pi", "pro", "ra", "re", "ri", "ro", "sa", "se", "ta", "te", "ti", "to", "tra",
+             "va", "ve", "vi", "xa", "zo"]
+SUFFIXES = ["mab", "nib", "pril", "sartan", "olol", "azole", "statin", "mycin", "cillin", "vir",
+            "dipine", "tide", "parin", "oxacin", "afil", "lukast", "tinib", "zepam", "dronate", "gliptin"]
+
+
+def synthetic_names(count, rng, suffixes=SUFFIXES):
+    """count distinct drug-like upper-case names"""
+    names = set()
+    while len(names) < count:
+        stem = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        name = (stem + rng.choice(suffixes)).upper()
+        if rng.random() < 0.1:
+            name += " " + rng.choice(["HYDROCHLORIDE", "SODIUM", "ACETATE", "SULFATE"])
+        names.add(name)
+    return sorted(names)
+
+
+def build_synthetic_corpus(n_drugs, n_diseases, seed=0, dim=384):
+    """In-memory Chroma collections with random embeddings and realistic-looking metadata"""
+    import chromadb
+    from chromadb.config import Settings
+
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    embedding_function = HashEmbeddingFunction(dim)
+    for name in ("drugs", "diseases"):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    drugs = client.create_collection("drugs", embedding_function=embedding_function)
+    diseases = client.create_collection("diseases", embedding_function=embedding_function)
+
+    drug_names = synthetic_names(n_drugs, rng)
+    disease_names = [f"{name.title()} syndrome" for name in synthetic_names(n_diseases, rng, ["itis", "osis", "emia", "opathy"])]
+
+    def add(collection, prefix, metadatas):
+        vectors = np_rng.standard_normal((len(metadatas), dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        batch = 5000
+        for start in range(0, len(metadatas), batch):
+            stop = start + batch
+            collection.add(
+                ids=[f"{prefix}_{i}" for i in range(start, min(stop, len(metadatas)))],
+                embeddings=vectors[start:stop],
+                metadatas=metadatas[start:stop],
+            )
+
+    add(drugs, "drug", [
+        {
+            'drug_name': name,
+            'pubchem_cid': rng.randint(1, 10_000_000),
+            'molecular_weight': round(rng.uniform(100, 900), 2),
+            'passes_lipinski': rng.random() < 0.7,
+            'bbb_permeable': rng.random() < 0.4,
+            'clinical_trials_count': rng.randint(0, 50),
+        }
+        for name in drug_names
+    ])
+    add(diseases, "disease", [
+        {'disease_name': name, 'efo_id': f"EFO_{i:07d}", 'targets_count': rng.randint(0, 500),
+         'known_drugs_count': rng.randint(0, 80)}
+        for i, name in enumerate(disease_names)
+    ])
+    return drugs, diseases
+
+
+# --- queries ---------------------------------------------------------------
+
+def typo(name, rng):
+    """name with one character substituted, dropped or swapped"""
+    letters = [c for c in name]
+    i = rng.randrange(1, max(len(letters) - 1, 2))
+    kind = rng.choice(("substitute", "drop", "swap"))
+    if kind == "substitute":
+        letters[i] = rng.choice(string.ascii_uppercase)
+    elif kind == "drop":
+        del letters[i]
+    elif i + 1 < len(letters):
+        letters[i], letters[i + 1] = letters[i + 1], letters[i]
+    return "".join(letters)
+
+
+def name_queries(names, count, rng):
+    """Exact, substring and typo queries over names"""
+    picked = [rng.choice(names) for _ in range(count)]
+    substrings = []
+    for name in picked:
+        if len(name) > 6:
+            start = rng.randrange(1, len(name) - 5)
+            substrings.append(name[start:start + 5].lower())
+        else:
+            substrings.append(name[1:].lower())
+    return {
+        'exact': [n.lower() for n in picked],
+        'substring': substrings,
+        'typo': [typo(n, rng).lower() for n in picked],
+    }
+
+
+# --- measurement -----------------------------------------------------------
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def single_sample(seconds):
+    """Stats for an operation that is timed once (start-up, index builds)"""
+    ms = round(seconds * 1000, 4)
+    return {'calls': 1, 'p50_ms': ms, 'p95_ms': ms, 'p99_ms': ms, 'mean_ms': ms,
+            'throughput_per_s': None, 'peak_rss_mb': peak_rss_mb()}
+
+
+def measure(func, inputs, setup=None, warmup=1):
+    """Time func(x) for every x in inputs (setup() runs untimed before each call)"""
+    for x in inputs[:warmup]:
+        if setup:
+            setup()
+        func(x)
+
+    gc.collect()
+    timings = []
+    wall = 0.0
+    for x in inputs:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func(x)
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        wall += elapsed
+
+    ms = np.array(timings) * 1000
+    return {
+        'calls': len(timings),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'throughput_per_s': round(len(timings) / wall, 2) if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_suite(smart_search, n_queries, seed=0, only=None):
+    """Run every benchmark against smart_search, returns {operation: stats}"""
+    rng = random.Random(seed)
+    results = {}
+
+    def wanted(name):
+        return not only or any(pattern in name for pattern in only)
+
+    def record(name, stats):
+        results[name] = stats
+        print(f"{name:<36} p50 {stats['p50_ms']:>10.3f} ms   p95 {stats['p95_ms']:>10.3f} ms   "
+              f"p99 {stats['p99_ms']:>10.3f} ms   {stats['throughput_per_s'] or 0:>10.1f}/s")
+
+    def bench(name, func, inputs, setup=None, warmup=1):
+        if wanted(name):
+            record(name, measure(func, inputs, setup, warmup))
+
+    def once(name, func):
+        """Time a single call (index builds) when selected; returns its result either way"""
+        start = time.perf_counter()
+        value = func()
+        if wanted(name):
+            record(name, single_sample(time.perf_counter() - start))
+        return value
+
+    def cold():
+        smart_search.result_cache.clear()
+
+    def very_cold():
+        smart_search.result_cache.clear()
+        smart_search.embedding_cache.clear()
+
+    drug_queries = name_queries(smart_search.drug_names, n_queries, rng)
+    disease_queries = name_queries(smart_search.disease_names, n_queries, rng)
+    for kind in ('exact', 'substring', 'typo'):
+        bench(f"find_drug.{kind}", smart_search.find_drug, drug_queries[kind])
+    for kind in ('exact', 'substring', 'typo'):
+        bench(f"find_disease.{kind}", smart_search.find_disease, disease_queries[kind])
+
+    disease_texts = [DISEASE_QUERIES[i % len(DISEASE_QUERIES)] + f" {i}" for i in range(n_queries)]
+    bench("search_drugs_fuzzy.uncached", lambda q: smart_search.search_drugs_fuzzy(q, 10), disease_texts, very_cold)
+    # Cached variants are primed with the full query set first
+    bench("search_drugs_fuzzy.embedding_cached", lambda q: smart_search.search_drugs_fuzzy(q, 10), disease_texts,
+          cold, warmup=len(disease_texts))
+    bench("search_drugs_fuzzy.result_cached", lambda q: smart_search.search_drugs_fuzzy(q, 10), disease_texts,
+          warmup=len(disease_texts))
+
+    # Exact disease names are answered from the precomputed disease profiles, without embedding
+    bench("search_drugs_fuzzy.disease_profile", lambda q: smart_search.search_drugs_fuzzy(q, 10),
+          disease_queries['exact'], very_cold)
+
+    batches = [disease_texts[i:i + 32] for i in range(0, len(disease_texts), 32)] or [disease_texts]
+    bench("search_drugs_batch.32", lambda qs: smart_search.search_drugs_batch(qs, 10), batches, very_cold)
+
+    anchors = [rng.choice(smart_search.drug_names) for _ in range(n_queries)]
+    bench("diseases_for_drug", lambda d: smart_search.diseases_for_drug(d, 10), anchors, cold)
+    bench("similar_drugs", lambda d: smart_search.similar_drugs(d, 10), anchors, cold)
+
+    router = once("intent_router.build", lambda: IntentRouter(smart_search.drug_names))
+    for intent, template in ASSISTANT_MESSAGES.items():
+        messages = [template.format(drug=rng.choice(smart_search.drug_names).lower()) for _ in range(n_queries)]
+        bench(f"assistant.{intent}", lambda m: generate_response(m, smart_search, router), messages, cold)
+
+    def rebuild_snapshot(_):
+        smart_search._snapshot = None
+        return smart_search.metadata_snapshot()
+
+    bench("analytics.metadata_snapshot", rebuild_snapshot, list(range(max(3, n_queries // 20))))
+
+    # One Database Explorer page: name filter, property sort, 50 visible rows
+    view = smart_search.metadata_snapshot().drug_view
+    filters = [rng.choice(smart_search.drug_names)[:rng.randint(1, 4)] for _ in range(n_queries)]
+    bench("explorer.drug_page", lambda text: view.page(view.select(text, sort_by='molecular_weight'), 0, 50), filters)
+    return results
+
+
+# --- baseline --------------------------------------------------------------
+
+def compare(results, baseline, threshold):
+    """Print p50/p95 ratios against baseline, return the regressed operation names"""
+    if baseline is None:
+        print("\nNo baseline to compare against (run with --save-baseline to store one)")
+        return []
+
+    keys = ('corpus', 'backend', 'n_drugs', 'n_diseases')
+    if any(baseline['meta'].get(k) != results['meta'].get(k) for k in keys):
+        recorded = ", ".join(f"{k}={baseline['meta'].get(k)}" for k in keys)
+        print(f"\nBaseline was recorded for a different configuration ({recorded}), not comparing")
+        return []
+
+    print(f"\n{'operation':<36} {'p50 ratio':>10} {'p95 ratio':>10}")
+    regressed = []
+    for name, stats in results['operations'].items():
+        base = baseline['operations'].get(name)
+        if not base:
+            print(f"{name:<36} {'new':>10} {'new':>10}  (not in the baseline, rerun with --save-baseline)")
+            continue
+        if not base['p50_ms'] or not base['p95_ms']:
+            continue
+        p50 = stats['p50_ms'] / base['p50_ms']
+        p95 = stats['p95_ms'] / base['p95_ms']
+        flag = ""
+        if p50 > 1 + threshold and p95 > 1 + threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<36} {p50:>10.2f} {p95:>10.2f}{flag}")
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, metavar="N_DRUGS", help="Benchmark a generated corpus of N drugs")
+    parser.add_argument("--synthetic-diseases", type=int, default=1000, help="Diseases in the generated corpus")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy", "quantized"])
+    parser.add_argument("--queries", type=int, default=200, help="Calls per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="Run only operations whose name contains one of these")
+    parser.add_argument("--output", default=str(RESULTS_PATH))
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="smartsearch-bench-"))
+    options = {}
+    if args.synthetic:
+        print(f"Building synthetic corpus: {args.synthetic} drugs, {args.synthetic_diseases} diseases")
+        drug_collection, disease_collection = build_synthetic_corpus(args.synthetic, args.synthetic_diseases, args.seed)
+        # Keep the generated corpus' artifacts away from data/processed
+        options = {'scores_dir': work_dir / "precomputed", 'metadata_store_dir': None,
+                   'disease_profiles_dir': work_dir / "disease_profiles"}
+        if args.backend in ("numpy", "quantized"):
+            options['embeddings_dir'] = work_dir / "embeddings"
+        if args.backend == "quantized":
+            options['quantized_dir'] = work_dir / "quantized"
+        corpus = "synthetic"
+    else:
+        from vector_backend import open_collections
+        drug_collection, disease_collection = open_collections()
+        corpus = "shipped"
+
+    start = time.perf_counter()
+    smart_search = SmartSearch(drug_collection, disease_collection, backend=args.backend, **options)
+    startup_ms = (time.perf_counter() - start) * 1000
+    print(f"SmartSearch ready in {startup_ms:.0f} ms "
+          f"({len(smart_search.drug_names)} drugs, {len(smart_search.disease_names)} diseases)\n")
+
+    operations = {'smart_search.init': single_sample(startup_ms / 1000)}
+    operations.update(run_suite(smart_search, args.queries, args.seed, args.only))
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': corpus,
+            'backend': args.backend,
+            'n_drugs': len(smart_search.drug_names),
+            'n_diseases': len(smart_search.disease_names),
+            'queries': args.queries,
+        },
+        'operations': operations,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nPeak RSS {results['peak_rss_mb']} MB, results written to {output}")
+
+    baseline = None
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists():
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    regressed = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+
+    if regressed and args.fail_on_regression:
+        print(f"\n{len(regressed)} operation(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
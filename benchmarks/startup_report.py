@@ -0,0 +1,205 @@
+"""
+Cold-start report for the Streamlit app and the search engine
+
+    python benchmarks/startup_report.py                     # shipped data/vector_db
+    python benchmarks/startup_report.py --synthetic 100000  # generated corpus
+    python benchmarks/startup_report.py --target-ms 1500 --fail-over-target
+
+Import times are measured in fresh interpreters (median of --repeat runs):
+the modules app.py imports up front (what stands between a cold process and
+the first rendered page), then per page the modules that page imports on
+top of those, and the heavy modules on their own. The imports are read from
+app.py itself, so the report follows the app as it changes. The search
+engine is then built the way the app's background loader builds it, and its
+load and warm-up are timed separately. Results go to
+benchmarks/results/startup.json. With --fail-over-target the exit status is
+1 when the first-paint path is slower than --target-ms.
+"""
+
+import argparse
+import ast
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent.absolute()
+PROJECT_ROOT = BENCH_DIR.parent
+APP_PATH = PROJECT_ROOT / "app.py"
+RESULTS_PATH = BENCH_DIR / "results" / "startup.json"
+
+# Measured on their own as well, whether or not app.py imports them up front
+HEAVY_MODULES = ["numpy", "pandas", "plotly.express", "plotly.graph_objects", "chromadb", "search_utils"]
+
+
+def _imported(node):
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    if isinstance(node, ast.ImportFrom) and node.module and not node.level:
+        return [node.module]
+    return []
+
+
+def app_imports(path=APP_PATH):
+    """
+    (up-front modules, {page: modules}) of app.py: module-level imports
+    (including those in a top-level try), and the imports at the top of each
+    branch of the `if page == ...` chain
+    """
+    tree = ast.parse(Path(path).read_text())
+    upfront, pages = [], {}
+    for node in tree.body:
+        if isinstance(node, ast.Try):
+            for child in node.body:
+                upfront.extend(_imported(child))
+        elif isinstance(node, ast.If):
+            branch = node
+            while isinstance(branch, ast.If):
+                test = branch.test
+                if isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == 'page' \
+                        and isinstance(test.comparators[0], ast.Constant):
+                    modules = [name for child in branch.body for name in _imported(child)]
+                    if modules:
+                        pages[test.comparators[0].value.strip()] = modules
+                branch = branch.orelse[0] if len(branch.orelse) == 1 and isinstance(branch.orelse[0], ast.If) else None
+        else:
+            upfront.extend(_imported(node))
+    return list(dict.fromkeys(upfront)), pages
+
+
+def time_imports(modules, preload=(), repeat=3):
+    """Median ms to import modules in a fresh interpreter, after untimed imports of preload"""
+    code = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {str(PROJECT_ROOT / 'scripts')!r})\n"
+        + "".join(f"import {name}\n" for name in preload)
+        + "start = time.perf_counter()\n"
+        + "".join(f"import {name}\n" for name in modules)
+        + "print((time.perf_counter() - start) * 1000)\n"
+    )
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return round(statistics.median(samples), 1)
+
+
+def interpreter_startup_ms(repeat=3):
+    """Median ms for a bare `python -c pass`"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 1)
+
+
+def engine_startup(synthetic=None, synthetic_diseases=1000, seed=0):
+    """Build SmartSearch on a BackgroundLoader like app.py does; returns (load ms, warm-up ms, warm-up error)"""
+    sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+    from search_utils import SmartSearch
+    from startup import BackgroundLoader
+
+    if synthetic:
+        sys.path.insert(0, str(BENCH_DIR))
+        from run_benchmarks import build_synthetic_corpus
+
+        drug_collection, disease_collection = build_synthetic_corpus(synthetic, synthetic_diseases, seed)
+        work_dir = Path(tempfile.mkdtemp(prefix="smartsearch-startup-"))
+        # Keep the generated corpus' artifacts away from data/processed
+        options = {'scores_dir': work_dir / "precomputed", 'metadata_store_dir': None,
+                   'lexical_index_dir': work_dir / "lexical_index", 'disease_profiles_dir': work_dir / "disease_profiles"}
+        factory = lambda: SmartSearch(drug_collection, disease_collection, **options)  # noqa: E731
+    else:
+        from vector_backend import open_collections
+
+        def factory():
+            drug_collection, disease_collection = open_collections()
+            return SmartSearch(drug_collection, disease_collection)
+
+    loader = BackgroundLoader(factory, warm_up=lambda smart_search: smart_search.warm_up())
+    loader.result()
+    loader.wait_warm()
+    error = None if loader.warm_up_error is None else repr(loader.warm_up_error)
+    return round(loader.load_seconds * 1000, 1), round(loader.warm_up_seconds * 1000, 1), error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, metavar="N_DRUGS", help="Time the engine on a generated corpus")
+    parser.add_argument("--synthetic-diseases", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per import measurement")
+    parser.add_argument("--skip-engine", action="store_true", help="Only measure imports")
+    parser.add_argument("--target-ms", type=float, default=1500.0,
+                        help="Budget for interpreter start + app.py's up-front imports")
+    parser.add_argument("--fail-over-target", action="store_true")
+    parser.add_argument("--output", default=str(RESULTS_PATH))
+    args = parser.parse_args()
+
+    upfront, pages = app_imports()
+    interpreter = interpreter_startup_ms(args.repeat)
+    upfront_ms = time_imports(upfront, repeat=args.repeat)
+    first_paint = round(interpreter + upfront_ms, 1)
+
+    print(f"{'interpreter start':<40} {interpreter:>9.1f} ms")
+    print(f"{'app.py up-front imports':<40} {upfront_ms:>9.1f} ms   ({', '.join(upfront)})")
+    print(f"{'first paint path':<40} {first_paint:>9.1f} ms   target {args.target_ms:.0f} ms")
+
+    page_ms = {}
+    for page, modules in pages.items():
+        page_ms[page] = time_imports(modules, preload=upfront, repeat=args.repeat)
+        print(f"{'  + page ' + page:<40} {page_ms[page]:>9.1f} ms   ({', '.join(modules)})")
+
+    module_ms = {}
+    for name in HEAVY_MODULES:
+        module_ms[name] = time_imports([name], repeat=args.repeat)
+        print(f"{'  import ' + name:<40} {module_ms[name]:>9.1f} ms")
+
+    engine = None
+    if not args.skip_engine:
+        load_ms, warm_up_ms, error = engine_startup(args.synthetic, args.synthetic_diseases)
+        engine = {'load_ms': load_ms, 'warm_up_ms': warm_up_ms, 'warm_up_error': error}
+        print(f"{'search engine load (background)':<40} {load_ms:>9.1f} ms")
+        print(f"{'search engine warm-up (background)':<40} {warm_up_ms:>9.1f} ms" + (f"   failed: {error}" if error else ""))
+
+    over_target = first_paint > args.target_ms
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': 'synthetic' if args.synthetic else 'shipped',
+            'n_drugs': args.synthetic,
+            'repeat': args.repeat,
+        },
+        'interpreter_ms': interpreter,
+        'upfront_imports': upfront,
+        'upfront_imports_ms': upfront_ms,
+        'first_paint_ms': first_paint,
+        'target_ms': args.target_ms,
+        'over_target': over_target,
+        'page_imports_ms': page_ms,
+        'module_imports_ms': module_ms,
+        'engine': engine,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if over_target:
+        print(f"First paint path {first_paint:.0f} ms is over the {args.target_ms:.0f} ms target")
+        if args.fail_over_target:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Artifact directories that are published whole, never file by file
+
+The metadata store, keyword indexes, disease profiles, precomputed scores,
+fingerprint index and quantized codes are each written into a fresh staging
+directory inside their artifact directory. Publishing renames it to a new
+generation g<time>-<pid> and atomically replaces the CURRENT file that names
+the live generation. Readers resolve CURRENT once and open every file from
+that one generation, so they never see a mix of two builds. Concurrent
+writers each publish a complete generation and CURRENT names one of them.
+The generation before the newest is kept for readers that are still opening
+it; older generations are removed. A directory written before generations
+existed (files directly inside it) is still read, and is cleared by its
+first publish.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+CURRENT = "CURRENT"
+KEEP_GENERATIONS = 2
+
+_GENERATION = re.compile(r"g\d{20}-")
+
+
+def resolve_artifact_dir(directory):
+    """The directory to open files from: the generation CURRENT names, or directory itself without one"""
+    directory = Path(directory)
+    try:
+        name = (directory / CURRENT).read_text().strip()
+    except OSError:
+        return directory
+    return directory / name if name else directory
+
+
+def _generations(directory):
+    return sorted(entry.name for entry in os.scandir(directory) if entry.is_dir() and _GENERATION.match(entry.name))
+
+
+def _prune(directory):
+    """Remove all but the newest generations (and the live one), and files of the flat layout"""
+    keep = set(_generations(directory)[-KEEP_GENERATIONS:]) | {resolve_artifact_dir(directory).name}
+    for entry in os.scandir(directory):
+        # Dot-prefixed staging directories and CURRENT.* files belong to writers still at work
+        if entry.name in keep or entry.name == CURRENT or entry.name.startswith((".", f"{CURRENT}.")):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def publish_artifact_dir(directory):
+    """
+    Context manager yielding an empty staging directory to write an artifact
+    into; when the block completes it becomes directory's live generation,
+    when it raises it is discarded
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=directory))
+    try:
+        yield staging
+        name = f"g{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}"
+        os.rename(staging, directory / name)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # A newer generation finished renaming first, its writer points CURRENT at it
+    if name >= _generations(directory)[-1]:
+        pointer = directory / f"{CURRENT}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(pointer, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, directory / CURRENT)
+    _prune(directory)
@@ -0,0 +1,150 @@
+"""
+AI assistant responses, independent of the Streamlit UI so they can also be
+benchmarked and served elsewhere
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from intent_router import DISEASE_DESCRIPTIONS, DISEASE_PATTERNS
+
+
+def generate_response(user_input, smart_search, router):
+    """Whole response for user_input, see generate_response_stream"""
+    return "".join(generate_response_stream(user_input, smart_search, router))
+
+
+def generate_response_stream(user_input, smart_search, router):
+    """
+    Generate the response in chunks (for st.write_stream), routing user_input
+    with an intent_router.IntentRouter
+    Retrieval runs in a worker thread while the static text is yielded
+    """
+    intent = router.route(user_input)
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if intent['disease']:
+            disease_info = DISEASE_PATTERNS[intent['disease']]
+            disease_name = disease_info['display_name']
+            pending = executor.submit(smart_search.search_drugs_fuzzy, disease_info['search_query'], 5)
+        elif intent['intent'] == 'drug_uses':
+            pending = executor.submit(smart_search.diseases_for_drug, intent['drug'], 5)
+        
+        if intent['intent'] == 'disease_info':
+            yield DISEASE_DESCRIPTIONS.get(disease_name, f"**{disease_name}** is a medical condition.")
+            yield f"\n\n**Potential drug candidates for {disease_name}:**\n\n"
+            
+            for r in pending.result()[:5]:
+                yield f"**{r['rank']}. {r['drug_name']}** - {r['confidence']}% confidence\n"
+            
+            yield f"\n Use the ** Smart Search** tab to explore more treatment options for {disease_name}!"
+            return
+        
+        if intent['intent'] == 'disease_drugs':
+            yield f"**Drug candidates for {disease_name}:**\n\n"
+            
+            for r in pending.result()[:5]:
+                chunk = f"**{r['rank']}. {r['drug_name']}** - Confidence: {r['confidence']}%\n"
+                
+                mw = r['molecular_weight']
+                if isinstance(mw, (int, float)) and mw > 0:
+                    chunk += f"   • Molecular Weight: {mw:.2f}\n"
+                chunk += f"   • Drug-like: {'' if r['passes_lipinski'] else ''}\n"
+                chunk += f"   • BBB Permeable: {'' if r['bbb_permeable'] else ''}\n\n"
+                yield chunk
+            
+            yield f"\n Try the ** Smart Search** tab for detailed results with charts!"
+            return
+        
+        if intent['intent'] == 'drug_uses':
+            results = pending.result()
+            
+            if results:
+                yield f"**Potential uses for {intent['drug']}:**\n\n"
+                
+                for r in results:
+                    yield f"{r['rank']}. **{r['disease_name']}** - {r['confidence']:.1f}% confidence\n"
+                
+                yield "\n Use the ** Smart Search** tab to explore more!"
+                return
+        
+        if intent['intent'] == 'disease_partial':
+            yield f"**Searching for drugs to treat {disease_name}...**\n\n"
+            
+            for r in pending.result()[:5]:
+                yield f"**{r['rank']}. {r['drug_name']}** - {r['confidence']}% confidence\n"
+            
+            yield f"\n Want to know more about {disease_name}? Ask: *'What is {disease_name}?'*"
+            return
+    
+    yield static_response(intent)
+
+
+def static_response(intent):
+    """Responses that need no retrieval"""
+    if intent['intent'] == 'about_repurposing':
+        return """**About Drug Repurposing:**
+
+Drug repurposing (or repositioning) is finding new therapeutic uses for existing drugs. 
+
+**Why it matters:**
+-  **Faster** - Years instead of decades
+-  **Cheaper** - Millions vs billions of dollars  
+-  **Safer** - Drugs already passed safety trials
+-  **AI-powered** - Finds hidden connections in data
+
+**How this system works:**
+1. Drugs and diseases are converted to AI embeddings (vectors)
+2. Similar vectors = similar biological properties
+3. Search finds the best drug-disease matches
+4. Confidence scores show how strong the match is
+
+**Try it yourself:**
+- Type "diabetes" or "alzheimer" to find drug candidates
+- Type a drug name to find new uses
+- Use the  Smart Search tab for detailed results!"""
+    
+    if intent['intent'] == 'how_to_use':
+        return """**How to use this system:**
+
+** Smart Search Tab:**
+- Find drugs for diseases
+- Find diseases for drugs  
+- Find similar drugs
+- Case-insensitive & fuzzy matching!
+
+** AI Assistant (here!):**
+- Ask about diseases: *"What is Alzheimer's?"*
+- Ask about drugs: *"What can Metformin treat?"*
+- Get drug suggestions: *"Drugs for diabetes"*
+
+** Analytics Tab:**
+- View database statistics
+- See drug property distributions
+
+** Database Explorer:**
+- Browse all drugs and diseases
+
+**Example questions:**
+- "What drugs help with Alzheimer's?"
+- "What is diabetes?"
+- "What can Aspirin be used for?"
+- "Drugs for heart disease"
+
+Try asking about any disease!"""
+    
+    return """I'm here to help with drug repurposing! 
+
+**I can answer:**
+- "What drugs treat Alzheimer's?" 
+- "What is diabetes?"
+- "What can Metformin be used for?"
+- "Drugs for heart disease"
+- "Tell me about drug repurposing"
+
+**Or just type:**
+- Disease name: *"alzheimer"*, *"cancer"*, *"diabetes"*
+- Drug name: *"aspirin"*, *"metformin"*
+
+**Pro tip:** The ** Smart Search** tab gives you detailed results with molecular properties and confidence scores!
+
+Try asking about a disease or drug!"""
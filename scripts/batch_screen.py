@@ -0,0 +1,465 @@
+"""
+Offline batch screening: disease queries in, ranked drug candidates out
+
+    python scripts/batch_screen.py data/raw/diseases_curated.csv --out screens/curated.jsonl
+    python scripts/batch_screen.py queries.jsonl --out screens/hits.parquet --top-k 50 --bbb true --mw-max 500
+    python scripts/batch_screen.py queries.csv --out screens/curated.jsonl --resume
+
+Queries are streamed from a CSV file (one query per row, from --query-column
+or the first of query/disease/disease_name/name) or a JSON-lines file (one
+object per line, same keys, or a bare string). They are read in chunks and
+screened by SmartSearch on a process pool. The shared files (embedding
+export, disease profiles, keyword index) are built once before the workers
+start; each worker then opens the database once, and each chunk becomes one
+batched embedding call and one similarity query (search_drugs_batch), or
+one hybrid search per query with --mode hybrid. The numpy backend is the
+default, because a chunk then costs a single matrix product per worker.
+
+Results are written in input order as they arrive, one row per (query,
+candidate). JSONL output is appended line by line. Parquet output is a
+directory of part files, written every --flush-rows rows. At most
+2 x --workers chunks are in flight, so memory stays bounded on any input
+size. Progress is checkpointed next to the output (<out>.progress.json).
+--resume skips the queries already written and drops anything written after
+the last checkpoint. It refuses a checkpoint written with other settings
+(input, columns, filters, database, backend and its options). A throughput
+report is printed at the end and written with --report.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+from drug_filters import DrugFilter
+from vector_backend import BACKENDS, VECTOR_DB_DIR, open_collections
+
+QUERY_COLUMNS = ("query", "disease", "disease_name", "name")
+ID_COLUMNS = ("query_id", "id", "efo_id")
+MODES = ("semantic", "hybrid")
+
+# Output columns and their Parquet types; hybrid mode adds the last three
+COLUMNS = {
+    'query_id': 'string',
+    'query': 'string',
+    'rank': 'int32',
+    'drug_name': 'string',
+    'confidence': 'float64',
+    'molecular_weight': 'float64',
+    'bbb_permeable': 'bool',
+    'passes_lipinski': 'bool',
+    'clinical_trials': 'int64',
+    'pubchem_cid': 'int64',
+}
+HYBRID_COLUMNS = {'hybrid_score': 'float64', 'lexical_score': 'float64', 'match': 'string'}
+
+
+def read_queries(path, query_column=None, id_column=None):
+    """
+    Yield {'query_id', 'query'} records from a CSV or JSONL file, streaming;
+    rows without query text are skipped, ids default to the row number
+    """
+    path = Path(path)
+    with open(path, newline='') as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson", ".json"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for number, row in enumerate(rows):
+            if isinstance(row, str):
+                row = {'query': row}
+            if query_column is None:
+                query_column = next((c for c in QUERY_COLUMNS if c in row), None)
+                if query_column is None:
+                    raise ValueError(f"{path}: no query column, expected one of {QUERY_COLUMNS} or --query-column")
+                if id_column is None:
+                    id_column = next((c for c in ID_COLUMNS if c in row), None)
+            query = str(row.get(query_column) or '').strip()
+            if not query:
+                continue
+            query_id = row.get(id_column) if id_column else None
+            yield {'query_id': str(number if query_id in (None, '') else query_id), 'query': query}
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _number(value, cast=float):
+    try:
+        return None if value is None or isinstance(value, bool) else cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _boolean(value):
+    return None if value is None else bool(value)
+
+
+def result_rows(record, candidates, mode="semantic"):
+    """Output rows for one query's candidates, typed as in COLUMNS (unknown values become None)"""
+    rows = []
+    for candidate in candidates:
+        row = {
+            'query_id': record['query_id'],
+            'query': record['query'],
+            'rank': candidate['rank'],
+            'drug_name': candidate['drug_name'],
+            'confidence': candidate['confidence'],
+            'molecular_weight': _number(candidate.get('molecular_weight')),
+            'bbb_permeable': _boolean(candidate.get('bbb_permeable')),
+            'passes_lipinski': _boolean(candidate.get('passes_lipinski')),
+            'clinical_trials': _number(candidate.get('clinical_trials'), int),
+            'pubchem_cid': _number(candidate.get('pubchem_cid'), int),
+        }
+        if mode == "hybrid":
+            row.update({key: candidate.get(key) for key in HYBRID_COLUMNS})
+        rows.append(row)
+    return rows
+
+
+def open_engine(db_path=VECTOR_DB_DIR, backend="numpy", **backend_options):
+    """SmartSearch over the persisted collections, without a result cache (every query is new)"""
+    from search_utils import SmartSearch
+
+    drug_collection, disease_collection = open_collections(db_path)
+    return SmartSearch(drug_collection, disease_collection, backend=backend, result_cache_size=0, **backend_options)
+
+
+def prepare_artifacts(engine_factory, mode="semantic"):
+    """
+    Build the files every worker's engine would otherwise build at the same
+    time: the backend's embedding export (and quantized codes), the disease
+    profiles and, for hybrid mode, the drug keyword index
+    """
+    engine = engine_factory()
+    engine.disease_profiles()
+    if mode == "hybrid":
+        engine.lexical_index("drugs")
+
+
+# The worker process' SmartSearch, built once by _init_worker
+_engine = None
+
+
+def _init_worker(engine_factory):
+    global _engine
+    _engine = engine_factory()
+
+
+def screen_chunk(chunk, top_k, filters=None, mode="semantic"):
+    """(output rows, search seconds) for a chunk of query records, on this process' engine"""
+    start = time.perf_counter()
+    queries = [record['query'] for record in chunk]
+    if mode == "hybrid":
+        results = [_engine.search_drugs_hybrid(query, top_k, filters) for query in queries]
+    else:
+        results = _engine.search_drugs_batch(queries, top_k, filters=filters)
+    rows = [row for record, candidates in zip(chunk, results) for row in result_rows(record, candidates, mode)]
+    return rows, time.perf_counter() - start
+
+
+def _replace_json(path, payload):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class JsonlWriter:
+    """Rows appended as JSON lines; a checkpoint is the flushed byte length"""
+
+    def __init__(self, path, state=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if state:
+            # Drop whatever was written after the last checkpoint
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(state['bytes'])
+            self.file.seek(state['bytes'])
+        else:
+            self.file = open(self.path, 'wb')
+
+    def write(self, rows):
+        self.file.write(b''.join(json.dumps(row).encode() + b'\n' for row in rows))
+
+    def full(self):
+        # Cheap to checkpoint, so after every chunk
+        return True
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'bytes': self.file.tell()}
+
+    def close(self):
+        state = self.checkpoint()
+        self.file.close()
+        return state
+
+
+class ParquetWriter:
+    """Rows buffered and written as numbered part files; a checkpoint is the part count"""
+
+    def __init__(self, directory, columns, flush_rows=100_000, state=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow (or write .jsonl)")
+        self._pq = pq
+        self.schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns.items()])
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_rows = flush_rows
+        self.parts = state['parts'] if state else 0
+        # Parts beyond the checkpoint were written after it and are redone
+        for path in self.directory.glob("part-*.parquet"):
+            if int(path.stem.split("-")[1]) >= self.parts:
+                path.unlink()
+        self.buffer = []
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+
+    def full(self):
+        return len(self.buffer) >= self.flush_rows
+
+    def checkpoint(self):
+        if self.buffer:
+            import pyarrow as pa
+
+            table = pa.Table.from_pylist(self.buffer, schema=self.schema)
+            path = self.directory / f"part-{self.parts:05d}.parquet"
+            tmp_path = path.with_name(path.name + '.tmp')
+            self._pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+            self.parts += 1
+            self.buffer = []
+        return {'parts': self.parts}
+
+    def close(self):
+        return self.checkpoint()
+
+
+def progress_path(out):
+    return Path(str(Path(out)).rstrip("/") + ".progress.json")
+
+
+def screen(queries, writer, engine_factory, top_k=10, filters=None, mode="semantic",
+           chunk_size=64, workers=1, progress=None, done=0, rows_written=0, log_every=10):
+    """
+    Screen query records (already past the first `done`) into writer, checkpointing
+    progress (a callable taking queries_done, rows_written, writer state) as
+    results land; returns the throughput report
+    """
+    started = time.perf_counter()
+    first_result = None
+    search_seconds = 0.0
+    screened = 0
+    new_rows = 0
+    chunks_done = 0
+
+    def record(rows, seconds, size):
+        nonlocal first_result, search_seconds, screened, new_rows, chunks_done
+        if first_result is None:
+            first_result = time.perf_counter() - started - seconds
+        search_seconds += seconds
+        screened += size
+        new_rows += len(rows)
+        chunks_done += 1
+        writer.write(rows)
+        if progress and writer.full():
+            progress(done + screened, rows_written + new_rows, writer.checkpoint())
+        if log_every and chunks_done % log_every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"  screened {done + screened} queries ({screened / elapsed:.1f}/s), {rows_written + new_rows} rows")
+
+    pending = _chunks(queries, chunk_size)
+    if workers <= 1:
+        _init_worker(engine_factory)
+        for chunk in pending:
+            rows, seconds = screen_chunk(chunk, top_k, filters, mode)
+            record(rows, seconds, len(chunk))
+    else:
+        prepare_artifacts(engine_factory, mode)
+        # Spawned rather than forked: chromadb and the embedding model start threads
+        # on import, and a forked child can inherit their locks held
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(engine_factory,)) as executor:
+            # At most 2 * workers chunks in flight keeps memory bounded on large inputs;
+            # results are taken in submission order so the output follows the input
+            window = deque()
+            while True:
+                while len(window) < 2 * workers:
+                    chunk = next(pending, None)
+                    if chunk is None:
+                        break
+                    window.append((len(chunk), executor.submit(screen_chunk, chunk, top_k, filters, mode)))
+                if not window:
+                    break
+                size, future = window.popleft()
+                try:
+                    rows, seconds = future.result()
+                except BaseException:
+                    for _, queued in window:
+                        queued.cancel()
+                    raise
+                record(rows, seconds, size)
+
+    state = writer.close()
+    if progress:
+        progress(done + screened, rows_written + new_rows, state)
+
+    elapsed = time.perf_counter() - started
+    startup = first_result or 0.0
+    return {
+        'queries': screened,
+        'queries_total': done + screened,
+        'rows': new_rows,
+        'rows_total': rows_written + new_rows,
+        'seconds': round(elapsed, 3),
+        'startup_seconds': round(startup, 3),
+        'search_seconds': round(search_seconds, 3),
+        'queries_per_second': round(screened / elapsed, 2) if elapsed else None,
+        # Throughput once the engines were up
+        'steady_queries_per_second': round(screened / (elapsed - startup), 2) if elapsed > startup else None,
+        'rows_per_second': round(new_rows / elapsed, 2) if elapsed else None,
+        'workers': workers,
+        'chunk_size': chunk_size,
+    }
+
+
+def _flag(value):
+    if value is None:
+        return None
+    if value.lower() in ("true", "1", "yes"):
+        return True
+    if value.lower() in ("false", "0", "no"):
+        return False
+    raise argparse.ArgumentTypeError(f"expected true or false, got '{value}'")
+
+
+def run_settings(args, filters):
+    """Everything that changes the rows of a run; --resume only continues a checkpoint with the same settings"""
+    return {
+        'input': str(Path(args.input).resolve()),
+        'query_column': args.query_column,
+        'id_column': args.id_column,
+        'top_k': args.top_k,
+        'mode': args.mode,
+        'filters': filters.cache_key(),
+        'format': "parquet" if Path(args.out).suffix.lower() == ".parquet" else "jsonl",
+        'db_path': str(Path(args.db_path).resolve()),
+        'backend': args.backend,
+        'backend_options': backend_options(args),
+    }
+
+
+def backend_options(args):
+    if args.backend != "quantized":
+        return {}
+    return {'quantization': args.quantization, 'subspaces': args.subspaces, 'rerank_factor': args.rerank_factor}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSONL file of disease queries")
+    parser.add_argument("--out", required=True, help="Output .jsonl file, or .parquet directory of part files")
+    parser.add_argument("--query-column", help=f"Column/key with the query text (default: first of {QUERY_COLUMNS})")
+    parser.add_argument("--id-column", help=f"Column/key with a query id (default: first of {ID_COLUMNS}, else row number)")
+    parser.add_argument("--top-k", type=int, default=10, help="Candidates per query")
+    parser.add_argument("--mode", default="semantic", choices=MODES)
+    parser.add_argument("--bbb", type=_flag, help="Only BBB-permeable (true) or non-permeable (false) drugs")
+    parser.add_argument("--lipinski", type=_flag, help="Only drugs that pass (true) or fail (false) Lipinski")
+    parser.add_argument("--mw-min", type=float)
+    parser.add_argument("--mw-max", type=float)
+    parser.add_argument("--min-trials", type=int)
+    parser.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    parser.add_argument("--backend", default="numpy", choices=sorted(BACKENDS))
+    parser.add_argument("--quantization", default="int8", choices=["int8", "pq"], help="Codes of --backend quantized")
+    parser.add_argument("--subspaces", type=int, help="PQ bytes per row of --backend quantized")
+    parser.add_argument("--rerank-factor", type=int, help="Candidates re-ranked exactly per result of --backend quantized")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Queries per worker task")
+    parser.add_argument("--flush-rows", type=int, default=100_000, help="Rows per Parquet part file")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run into the same output")
+    parser.add_argument("--report", help="Also write the throughput report to this JSON file")
+    args = parser.parse_args()
+
+    filters = DrugFilter(
+        bbb_permeable=args.bbb, passes_lipinski=args.lipinski, min_molecular_weight=args.mw_min,
+        max_molecular_weight=args.mw_max, min_clinical_trials=args.min_trials,
+    )
+    out = Path(args.out)
+    parquet = out.suffix.lower() == ".parquet"
+    settings = run_settings(args, filters)
+
+    checkpoint_path = progress_path(out)
+    checkpoint = None
+    if args.resume and checkpoint_path.exists():
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['settings'] != settings:
+            raise SystemExit(f"{checkpoint_path} was written with other settings ({checkpoint['settings']}), "
+                             f"rerun them or start a new output")
+    elif out.exists() and any(out.iterdir() if out.is_dir() else [out]):
+        raise SystemExit(f"{out} already exists: pass --resume to continue it, or remove it")
+
+    done = checkpoint['queries_done'] if checkpoint else 0
+    state = checkpoint['writer'] if checkpoint else None
+    if parquet:
+        columns = {**COLUMNS, **HYBRID_COLUMNS} if args.mode == "hybrid" else COLUMNS
+        writer = ParquetWriter(out, columns, args.flush_rows, state)
+    else:
+        writer = JsonlWriter(out, state)
+
+    def progress(queries_done, rows_written, writer_state):
+        _replace_json(checkpoint_path, {
+            'settings': settings,
+            'queries_done': queries_done,
+            'rows_written': rows_written,
+            'writer': writer_state,
+            'updated_at': datetime.now().isoformat(),
+        })
+
+    queries = read_queries(args.input, args.query_column, args.id_column)
+    for _ in range(done):
+        next(queries, None)
+    if done:
+        print(f"Resuming after {done} queries")
+
+    engine_factory = partial(open_engine, args.db_path, args.backend, **backend_options(args))
+    report = screen(
+        queries, writer, engine_factory, top_k=args.top_k, filters=filters or None, mode=args.mode,
+        chunk_size=args.chunk_size, workers=args.workers, progress=progress, done=done,
+        rows_written=checkpoint['rows_written'] if checkpoint else 0,
+    )
+
+    print(f"Screened {report['queries']} queries ({report['queries_total']} in total) into {report['rows']} rows "
+          f"in {report['seconds']:.1f} s: {report['queries_per_second']} queries/s, "
+          f"{report['rows_per_second']} rows/s")
+    print(f"  engine startup {report['startup_seconds']:.1f} s, then {report['steady_queries_per_second']} queries/s "
+          f"on {report['workers']} worker(s); {report['search_seconds']:.1f} s spent searching")
+    print(f"Results in {out}")
+    if args.report:
+        _replace_json(Path(args.report), {'settings': settings, **report})
+
+
+if __name__ == "__main__":
+    main()
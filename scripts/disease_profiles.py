@@ -0,0 +1,219 @@
+"""
+Precomputed disease profile vectors, so a named disease is searched without embedding the query
+
+    python scripts/disease_profiles.py      # build (or rebuild) the profiles for data/vector_db
+
+A profile combines several vectors for one disease: its stored embedding,
+the expanded search text of the assistant's matching DISEASE_PATTERNS entry
+and that entry's keywords (synonyms and common misspellings), embedded once
+here. Every disease in the collection gets a profile, and so does every
+pattern, from its own texts plus the embeddings of the diseases it matches.
+Each profile is stored both as its components (multi-vector search keeps a
+drug's smallest distance to any of them) and as their centroid: the mean of
+the unit-length components, scaled back to their mean norm so distances
+stay comparable with a plain query embedding.
+
+Profiles are looked up by disease name, pattern key, display name or search
+text (case and whitespace insensitive); anything else is free text and is
+embedded as before. The directory is rebuilt when the disease collection or
+the embedding model changed since it was written.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+from datetime import datetime
+
+import numpy as np
+
+from artifact_dir import publish_artifact_dir, resolve_artifact_dir
+from embedding_cache import model_identity
+from intent_router import DISEASE_PATTERNS
+from metadata_snapshot import collection_version
+from metadata_store import METADATA_STORE_DIR, MetadataStore
+from vector_backend import PROJECT_ROOT, VECTOR_DB_DIR, open_collections, resolve_embedding_function
+
+DISEASE_PROFILES_DIR = PROJECT_ROOT / "data" / "processed" / "disease_profiles"
+
+MANIFEST = "manifest.json"
+CENTROIDS = "centroids.npy"
+VECTORS = "vectors.npy"
+OFFSETS = "offsets.npy"
+
+PROFILE_MODES = ("centroid", "multi")
+
+
+def normalize_alias(text):
+    """Lookup key of a profile name: lowercased, whitespace collapsed"""
+    return " ".join(str(text).lower().split())
+
+
+def profile_version(disease_collection, embedding_function, patterns=DISEASE_PATTERNS):
+    """Version the profiles of disease_collection are built for, changes with the model and the patterns too"""
+    digest = hashlib.sha1(json.dumps(patterns, sort_keys=True).encode()).hexdigest()[:12]
+    return (*collection_version(disease_collection), model_identity(embedding_function), digest)
+
+
+def profile_sources(disease_ids, disease_names, patterns=DISEASE_PATTERNS):
+    """
+    What every profile is built from, diseases first in row order, then the patterns:
+    list of {'name', 'key', 'aliases', 'rows' (stored disease embeddings), 'texts' (embedded here)}
+    """
+    matched = {}
+    texts_by_row = [[] for _ in disease_names]
+    for key, pattern in patterns.items():
+        keywords = re.compile(r"\b(?:%s)\b" % "|".join(re.escape(k.lower()) for k in pattern['keywords']))
+        matched[key] = [row for row, name in enumerate(disease_names) if keywords.search(name.lower())]
+        for row in matched[key]:
+            texts_by_row[row] += [pattern['search_query'], ", ".join(pattern['keywords'])]
+
+    sources = [
+        {'name': name, 'key': str(disease_id), 'aliases': [name], 'rows': [row], 'texts': texts_by_row[row]}
+        for row, (disease_id, name) in enumerate(zip(disease_ids, disease_names))
+    ]
+    for key, pattern in patterns.items():
+        sources.append({
+            'name': pattern['display_name'],
+            'key': key,
+            'aliases': [key, pattern['display_name'], pattern['search_query']],
+            'rows': matched[key],
+            'texts': [pattern['search_query'], ", ".join(pattern['keywords'])],
+        })
+    return sources
+
+
+def build_disease_profiles(directory, disease_ids, disease_names, disease_embeddings, embed, version=None,
+                           patterns=DISEASE_PATTERNS):
+    """
+    Write the profiles of the row-aligned disease_ids / disease_names /
+    disease_embeddings to directory, published as a whole (see artifact_dir.py)
+    so concurrent builders never mix their files; embed(texts) embeds the
+    expansion texts
+    """
+    sources = profile_sources(disease_ids, disease_names, patterns)
+    texts = list(dict.fromkeys(text for source in sources for text in source['texts']))
+    stored = np.asarray(disease_embeddings, dtype=np.float32)
+    embedded = np.asarray(embed(texts), dtype=np.float32) if texts else np.empty((0, stored.shape[1]), np.float32)
+    text_rows = {text: i for i, text in enumerate(texts)}
+
+    vectors, offsets, centroids = [], [0], []
+    aliases = {}
+    for profile, source in enumerate(sources):
+        components = np.concatenate([stored[source['rows']], embedded[[text_rows[t] for t in source['texts']]]])
+        norms = np.linalg.norm(components, axis=1, keepdims=True)
+        centroid = (components / np.maximum(norms, 1e-12)).mean(axis=0)
+        centroid *= norms.mean() / max(float(np.linalg.norm(centroid)), 1e-12)
+        vectors.append(components)
+        offsets.append(offsets[-1] + len(components))
+        centroids.append(centroid)
+        # Disease names take precedence over a pattern display name that spells the same
+        for alias in filter(None, map(normalize_alias, source['aliases'])):
+            aliases.setdefault(alias, profile)
+
+    manifest = {
+        'created_at': datetime.now().isoformat(),
+        'profiles': len(sources),
+        'vectors': offsets[-1],
+        'dim': int(stored.shape[1]),
+        'version': list(version) if version is not None else None,
+        'names': [source['name'] for source in sources],
+        'keys': [source['key'] for source in sources],
+        'aliases': aliases,
+    }
+    with publish_artifact_dir(directory) as staging:
+        np.save(staging / VECTORS, np.concatenate(vectors).astype(np.float32))
+        np.save(staging / OFFSETS, np.asarray(offsets, dtype=np.int64))
+        np.save(staging / CENTROIDS, np.asarray(centroids, dtype=np.float32))
+        with open(staging / MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def write_disease_profiles(disease_collection, directory=DISEASE_PROFILES_DIR, metadata_table=None, embed=None):
+    """
+    Build the profiles of disease_collection from its stored embeddings; names
+    are read from a current metadata_table (metadata_store.py) when given
+    embed: text embedding function, the collection's own by default
+    """
+    embedding_function = resolve_embedding_function(disease_collection)
+    if embed is None:
+        embed = embedding_function
+    if metadata_table is not None:
+        records = disease_collection.get(include=["embeddings"])
+        names = [name or '' for name in metadata_table.column('disease_name', records['ids'])]
+    else:
+        records = disease_collection.get(include=["metadatas", "embeddings"])
+        names = [m.get('disease_name', '') for m in records['metadatas']]
+    return build_disease_profiles(
+        directory, list(records['ids']), names, records['embeddings'], embed,
+        profile_version(disease_collection, embedding_function)
+    )
+
+
+class DiseaseProfiles:
+    """Memory-mapped disease profiles, see build_disease_profiles"""
+
+    def __init__(self, directory):
+        self.directory = resolve_artifact_dir(directory)
+        with open(self.directory / MANIFEST) as f:
+            self.manifest = json.load(f)
+        self.version = tuple(self.manifest['version']) if self.manifest.get('version') else None
+        self.names = self.manifest['names']
+        self.aliases = self.manifest['aliases']
+        self.centroids = np.load(self.directory / CENTROIDS, mmap_mode='r')
+        self.vectors = np.load(self.directory / VECTORS, mmap_mode='r')
+        self.offsets = np.load(self.directory / OFFSETS, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def open(cls, directory, version=None):
+        """The profiles in directory, None when they are missing, unreadable or built for another version"""
+        if not (resolve_artifact_dir(directory) / MANIFEST).exists():
+            return None
+        try:
+            profiles = cls(directory)
+        except (OSError, ValueError, KeyError):
+            return None
+        if version is not None and profiles.version != tuple(version):
+            return None
+        return profiles
+
+    def resolve(self, query):
+        """Profile number of a disease name, pattern key, display name or search text, else None"""
+        return self.aliases.get(normalize_alias(query))
+
+    def query_vectors(self, profile, mode="centroid"):
+        """(n, dim) query embeddings of a profile: its centroid, or with mode='multi' all its components"""
+        if mode == "multi":
+            return np.asarray(self.vectors[self.offsets[profile]:self.offsets[profile + 1]])
+        return np.asarray(self.centroids[profile:profile + 1])
+
+
+def load_disease_profiles(directory, disease_collection, metadata_table=None, embed=None):
+    """Open the profiles of disease_collection, building them first when they are missing or stale"""
+    version = profile_version(disease_collection, resolve_embedding_function(disease_collection))
+    profiles = DiseaseProfiles.open(directory, version)
+    if profiles is None:
+        write_disease_profiles(disease_collection, directory, metadata_table, embed)
+        profiles = DiseaseProfiles.open(directory)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    parser.add_argument("--out-dir", default=str(DISEASE_PROFILES_DIR), help="Where to write the profiles")
+    args = parser.parse_args()
+
+    _, disease_collection = open_collections(args.db_path)
+    store = MetadataStore.open(METADATA_STORE_DIR)
+    table = store.table_for("diseases", disease_collection) if store else None
+    manifest = write_disease_profiles(disease_collection, args.out_dir, table)
+    print(f"Wrote {manifest['profiles']} disease profiles ({manifest['vectors']} vectors) to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
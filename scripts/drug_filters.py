@@ -0,0 +1,194 @@
+"""
+Property filters for drug searches and the bitmap indexes that evaluate them
+
+    filters = DrugFilter(bbb_permeable=True, passes_lipinski=True, max_molecular_weight=500)
+    smart_search.search_drugs_fuzzy("alzheimer", top_k=10, filters=filters)
+
+The filter is applied while the top-k is selected, not to the returned top-k:
+the NumPy backend masks rows with PropertyBitmaps (one packed bitset per
+property value, sorted value arrays for the ranges), ChromaDB gets the
+equivalent `where` clause. A value that is missing never satisfies a
+constraint on it.
+"""
+
+import numpy as np
+
+
+class DrugFilter:
+    """Constraints on drug properties; None leaves a property unconstrained"""
+
+    def __init__(self, bbb_permeable=None, passes_lipinski=None, min_molecular_weight=None,
+                 max_molecular_weight=None, min_clinical_trials=None):
+        self.bbb_permeable = None if bbb_permeable is None else bool(bbb_permeable)
+        self.passes_lipinski = None if passes_lipinski is None else bool(passes_lipinski)
+        self.min_molecular_weight = None if min_molecular_weight is None else float(min_molecular_weight)
+        self.max_molecular_weight = None if max_molecular_weight is None else float(max_molecular_weight)
+        self.min_clinical_trials = int(min_clinical_trials) if min_clinical_trials else None
+
+    def _constraints(self):
+        return (self.bbb_permeable, self.passes_lipinski, self.min_molecular_weight,
+                self.max_molecular_weight, self.min_clinical_trials)
+
+    def __bool__(self):
+        return any(value is not None for value in self._constraints())
+
+    def __eq__(self, other):
+        return isinstance(other, DrugFilter) and self._constraints() == other._constraints()
+
+    def __hash__(self):
+        return hash(self._constraints())
+
+    def __repr__(self):
+        return f"DrugFilter({self.cache_key() or 'none'})"
+
+    def cache_key(self):
+        """Stable text form, '' for an empty filter (used in result cache keys)"""
+        parts = []
+        if self.bbb_permeable is not None:
+            parts.append(f"bbb={int(self.bbb_permeable)}")
+        if self.passes_lipinski is not None:
+            parts.append(f"lipinski={int(self.passes_lipinski)}")
+        if self.min_molecular_weight is not None or self.max_molecular_weight is not None:
+            parts.append(f"mw={self.min_molecular_weight}-{self.max_molecular_weight}")
+        if self.min_clinical_trials is not None:
+            parts.append(f"trials>={self.min_clinical_trials}")
+        return ";".join(parts)
+
+    def where(self):
+        """Equivalent ChromaDB `where` clause, None for an empty filter"""
+        clauses = []
+        if self.bbb_permeable is not None:
+            clauses.append({'bbb_permeable': {'$eq': self.bbb_permeable}})
+        if self.passes_lipinski is not None:
+            clauses.append({'passes_lipinski': {'$eq': self.passes_lipinski}})
+        if self.min_molecular_weight is not None:
+            clauses.append({'molecular_weight': {'$gte': self.min_molecular_weight}})
+        if self.max_molecular_weight is not None:
+            clauses.append({'molecular_weight': {'$lte': self.max_molecular_weight}})
+        if self.min_clinical_trials is not None:
+            clauses.append({'clinical_trials_count': {'$gte': self.min_clinical_trials}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+    def matches(self, metadata):
+        """Whether one metadata dict satisfies the filter"""
+        for key, wanted in (('bbb_permeable', self.bbb_permeable), ('passes_lipinski', self.passes_lipinski)):
+            if wanted is not None and metadata.get(key) is not wanted:
+                return False
+
+        mw = metadata.get('molecular_weight')
+        if self.min_molecular_weight is not None or self.max_molecular_weight is not None:
+            if not isinstance(mw, (int, float)) or isinstance(mw, bool):
+                return False
+            if self.min_molecular_weight is not None and mw < self.min_molecular_weight:
+                return False
+            if self.max_molecular_weight is not None and mw > self.max_molecular_weight:
+                return False
+
+        trials = metadata.get('clinical_trials_count')
+        if self.min_clinical_trials is not None:
+            if not isinstance(trials, (int, float)) or isinstance(trials, bool) or trials < self.min_clinical_trials:
+                return False
+        return True
+
+
+def _flags(values):
+    """True/False/None values -> (is True, is False) bool arrays"""
+    values = np.asarray(values, dtype=object)
+    return (
+        np.fromiter((v is True or v is np.True_ for v in values), dtype=bool, count=len(values)),
+        np.fromiter((v is False or v is np.False_ for v in values), dtype=bool, count=len(values)),
+    )
+
+
+def _numbers(values):
+    """Numeric values as float64 with NaN for anything missing"""
+    return np.fromiter(
+        (float(v) if isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)) else np.nan
+         for v in values),
+        dtype=np.float64, count=len(values)
+    )
+
+
+class _RangeIndex:
+    """Row order sorted by value, so a range lookup is two binary searches"""
+
+    def __init__(self, values):
+        present = np.flatnonzero(~np.isnan(values))
+        order = np.argsort(values[present], kind='stable')
+        self.rows = present[order]
+        self.values = values[present][order]
+
+    def rows_between(self, low=None, high=None):
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left')
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side='right')
+        return self.rows[start:stop]
+
+
+class PropertyBitmaps:
+    """
+    Packed bitsets (one bit per row) for the boolean drug properties and
+    range indexes for molecular weight and clinical trial counts, all
+    row-aligned with the metadata they were built from
+    """
+
+    def __init__(self, bbb_permeable, passes_lipinski, molecular_weight, clinical_trials):
+        self.size = len(molecular_weight)
+        self.bitmaps = {}
+        for key, values in (('bbb_permeable', bbb_permeable), ('passes_lipinski', passes_lipinski)):
+            is_true, is_false = _flags(values)
+            self.bitmaps[key, True] = np.packbits(is_true)
+            self.bitmaps[key, False] = np.packbits(is_false)
+        self.molecular_weight = _RangeIndex(_numbers(molecular_weight))
+        self.clinical_trials = _RangeIndex(_numbers(clinical_trials))
+
+    @classmethod
+    def from_metadatas(cls, metadatas):
+        """Build from a row-aligned sequence of metadata dicts"""
+        columns = {key: [] for key in ('bbb_permeable', 'passes_lipinski', 'molecular_weight', 'clinical_trials_count')}
+        for metadata in metadatas:
+            metadata = metadata or {}
+            for key, values in columns.items():
+                values.append(metadata.get(key))
+        return cls(columns['bbb_permeable'], columns['passes_lipinski'],
+                   columns['molecular_weight'], columns['clinical_trials_count'])
+
+    @classmethod
+    def from_table(cls, table, ids):
+        """Build from metadata store columns (metadata_store.MetadataTable) for the given row ids"""
+        return cls(table.column('bbb_permeable', ids), table.column('passes_lipinski', ids),
+                   table.column('molecular_weight', ids), table.column('clinical_trials_count', ids))
+
+    def __len__(self):
+        return self.size
+
+    def _range_bitmap(self, index, low, high):
+        bits = np.zeros(self.size, dtype=bool)
+        bits[index.rows_between(low, high)] = True
+        return np.packbits(bits)
+
+    def packed(self, drug_filter):
+        """Packed bitset of the rows passing drug_filter, None when it is empty"""
+        if not drug_filter:
+            return None
+        parts = [
+            self.bitmaps[key, wanted]
+            for key, wanted in (('bbb_permeable', drug_filter.bbb_permeable), ('passes_lipinski', drug_filter.passes_lipinski))
+            if wanted is not None
+        ]
+        if drug_filter.min_molecular_weight is not None or drug_filter.max_molecular_weight is not None:
+            parts.append(self._range_bitmap(
+                self.molecular_weight, drug_filter.min_molecular_weight, drug_filter.max_molecular_weight
+            ))
+        if drug_filter.min_clinical_trials is not None:
+            parts.append(self._range_bitmap(self.clinical_trials, drug_filter.min_clinical_trials, None))
+        return np.bitwise_and.reduce(parts) if len(parts) > 1 else parts[0]
+
+    def mask(self, drug_filter):
+        """Boolean row mask of the rows passing drug_filter, None when it is empty"""
+        packed = self.packed(drug_filter)
+        if packed is None:
+            return None
+        return np.unpackbits(packed, count=self.size).astype(bool)
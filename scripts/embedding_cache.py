@@ -0,0 +1,145 @@
+"""
+LRU cache of query embeddings, optionally persisted to disk
+"""
+
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def normalize_query(text):
+    """Cache key for a query: surrounding whitespace stripped, inner runs collapsed"""
+    return ' '.join(str(text).split())
+
+
+def model_identity(embedding_function):
+    """Stable identifier of the model behind an embedding function"""
+    cls = type(embedding_function)
+    model = getattr(embedding_function, 'model_name', None) or getattr(embedding_function, 'MODEL_NAME', None)
+    if model is None and callable(getattr(embedding_function, 'name', None)):
+        try:
+            model = embedding_function.name()
+        except Exception:
+            model = None
+    return f"{cls.__module__}.{cls.__name__}:{model or 'default'}"
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU map from normalized query text to its embedding, for one model
+
+    With a path, the cache is loaded from that .npz file on creation and written
+    back every `autosave_every` new entries and at interpreter exit, so a
+    restarted server comes up warm.
+    """
+
+    def __init__(self, model_id, maxsize=4096, path=None, autosave_every=64):
+        self.model_id = model_id
+        self.maxsize = maxsize
+        self.path = Path(path) if path else None
+        self.autosave_every = autosave_every
+
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        if self.path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, texts, embed):
+        """
+        Embeddings for texts as a float32 matrix; misses are embedded in one
+        call to embed(list_of_texts) and added to the cache
+        """
+        keys = [normalize_query(t) for t in texts]
+        found = {}
+        missing = {}
+
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is None:
+                    self.misses += 1
+                    missing[key] = None
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            missing = list(missing)
+
+        if missing:
+            vectors = np.asarray(embed(missing), dtype=np.float32)
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._entries[key] = vector
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                self._unsaved += len(missing)
+                autosave = self.path is not None and self._unsaved >= self.autosave_every
+            if autosave:
+                self.save()
+
+        return np.stack([found[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self):
+        """Hit/miss counters and current size, for sizing the cache"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self._unsaved = 0
+
+    def save(self):
+        """Write the cache to its .npz file (atomically), oldest entries first"""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._entries:
+                return
+            keys = list(self._entries)
+            vectors = np.stack(list(self._entries.values()))
+            self._unsaved = 0
+
+        with self._save_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, model_id=np.array(self.model_id), keys=np.array(keys, dtype=str), vectors=vectors)
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Load entries saved for the same model; files from another model are ignored"""
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data['model_id']) != self.model_id:
+                    return
+                keys, vectors = data['keys'], data['vectors']
+        except (OSError, ValueError, KeyError):
+            return
+
+        with self._lock:
+            for key, vector in list(zip(keys.tolist(), vectors))[-self.maxsize:]:
+                self._entries[key] = vector
@@ -0,0 +1,344 @@
+"""
+Offline stage: local chemistry enrichment with RDKit
+
+    python scripts/enrich_chemistry.py
+    python scripts/ingest.py        # loads the new values into the vector database
+
+Parses the stored InChI (or SMILES) of every drug in drugs_enriched.json with
+RDKit on a process pool, in chunks, and computes molecular weight, logP,
+H-bond donors/acceptors, TPSA, rotatable bonds, the Lipinski rule of five,
+a BBB permeability estimate and a Morgan fingerprint. Results are cached by
+InChIKey in data/processed/chemistry, so re-runs (and interrupted runs) only
+compute structures they have not seen. The descriptors are written back into
+drugs_enriched.json and drugs_enriched.csv, where ingest.py picks them up as
+metadata changes for the search cards and the Analytics page; the
+fingerprints become the structural similarity index (fingerprint_index.py).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fingerprint_index import FINGERPRINT_INDEX_DIR, build_fingerprint_index
+from vector_backend import PROJECT_ROOT
+
+DRUGS_JSON = PROJECT_ROOT / "data" / "processed" / "drugs_enriched.json"
+DRUGS_CSV = PROJECT_ROOT / "data" / "processed" / "drugs_enriched.csv"
+CHEMISTRY_DIR = PROJECT_ROOT / "data" / "processed" / "chemistry"
+
+DESCRIPTORS_FILE = "descriptors.json"
+FINGERPRINTS_FILE = "fingerprints.npy"
+FINGERPRINT_KEYS_FILE = "fingerprint_keys.json"
+
+MORGAN_RADIUS = 2
+MORGAN_BITS = 2048
+# Bump when the computed values change, cached results of older versions are recomputed
+DESCRIPTOR_VERSION = 1
+
+# Fields written into each drug record (and the matching drugs_enriched.csv columns)
+RECORD_FIELDS = ('molecular_weight', 'logp', 'h_bond_donors', 'h_bond_acceptors', 'tpsa',
+                 'rotatable_bonds', 'lipinski_violations', 'passes_lipinski', 'bbb_permeable')
+CSV_FIELDS = ('molecular_weight', 'logp', 'h_bond_donors', 'h_bond_acceptors', 'bbb_permeable', 'passes_lipinski')
+
+
+def structure_of(record):
+    """(cache key, InChI, SMILES) of a drug record; the key is its InChIKey when known"""
+    chemical = record.get('chemical_data') or {}
+    inchi = chemical.get('inchi') or record.get('inchi')
+    smiles = record.get('smiles') or chemical.get('smiles')
+    key = chemical.get('inchi_key') or record.get('inchi_key')
+    if not key and (inchi or smiles):
+        # No InChIKey recorded: key on the structure string itself
+        key = "sha1:" + hashlib.sha1((inchi or smiles).encode()).hexdigest()
+    return key, inchi, smiles
+
+
+# --- worker side ----------------------------------------------------------
+
+_generator = None
+
+
+def _init_worker():
+    from rdkit import RDLogger
+    RDLogger.DisableLog('rdApp.*')
+
+
+def compute_structure(inchi, smiles):
+    """(descriptors, packed Morgan fingerprint) of one structure; ({'error': ...}, None) if it does not parse"""
+    global _generator
+    from rdkit import Chem
+    from rdkit.Chem import Crippen, Descriptors, Lipinski, rdFingerprintGenerator, rdMolDescriptors
+
+    mol = Chem.MolFromInchi(inchi) if inchi else None
+    if mol is None and smiles:
+        mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return {'error': 'unparseable structure'}, None
+
+    mw = Descriptors.MolWt(mol)
+    logp = Crippen.MolLogP(mol)
+    donors = Lipinski.NumHDonors(mol)
+    acceptors = Lipinski.NumHAcceptors(mol)
+    tpsa = rdMolDescriptors.CalcTPSA(mol)
+    violations = int(mw > 500) + int(logp > 5) + int(donors > 5) + int(acceptors > 10)
+
+    descriptors = {
+        'molecular_weight': round(mw, 3),
+        'logp': round(logp, 3),
+        'h_bond_donors': int(donors),
+        'h_bond_acceptors': int(acceptors),
+        'tpsa': round(tpsa, 2),
+        'rotatable_bonds': int(Lipinski.NumRotatableBonds(mol)),
+        'lipinski_violations': violations,
+        # Rule of five: at most one violation
+        'passes_lipinski': violations <= 1,
+        # CNS heuristic (Pajouhesh & Lenz): small, not too polar, few donors
+        'bbb_permeable': bool(tpsa <= 90 and mw <= 450 and donors <= 3),
+        'inchi_key': Chem.MolToInchiKey(mol) or None,
+        'canonical_smiles': Chem.MolToSmiles(mol),
+    }
+
+    if _generator is None:
+        _generator = rdFingerprintGenerator.GetMorganGenerator(radius=MORGAN_RADIUS, fpSize=MORGAN_BITS)
+    fingerprint = np.packbits(_generator.GetFingerprintAsNumPy(mol).astype(bool))
+    return descriptors, fingerprint
+
+
+def compute_chunk(items):
+    """[(key, descriptors, fingerprint)] for a chunk of (key, inchi, smiles) items"""
+    return [(key, *compute_structure(inchi, smiles)) for key, inchi, smiles in items]
+
+
+# --- cache ----------------------------------------------------------------
+
+class ChemistryCache:
+    """
+    Descriptors and Morgan fingerprints keyed by InChIKey
+
+    descriptors.json maps key -> descriptors (or {'error': ...}); fingerprints.npy
+    holds the packed fingerprints, row-aligned with fingerprint_keys.json.
+    Saved atomically, and at most every `interval` seconds unless forced.
+    """
+
+    def __init__(self, directory=CHEMISTRY_DIR, interval=10.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.descriptors = {}
+        self.fingerprint_rows = {}
+        self._fingerprints = []
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        path = self.directory / DESCRIPTORS_FILE
+        if not path.exists():
+            return
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            with open(self.directory / FINGERPRINT_KEYS_FILE) as f:
+                keys = json.load(f)
+            fingerprints = np.load(self.directory / FINGERPRINTS_FILE)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != DESCRIPTOR_VERSION or fingerprints.shape[1:] != (MORGAN_BITS // 8,):
+            return
+        self.descriptors = data.get('records', {})
+        self._fingerprints = list(fingerprints[:len(keys)])
+        self.fingerprint_rows = {key: row for row, key in enumerate(keys[:len(fingerprints)])}
+
+    def __contains__(self, key):
+        return key in self.descriptors
+
+    def add(self, key, descriptors, fingerprint):
+        self.descriptors[key] = descriptors
+        if fingerprint is not None:
+            row = self.fingerprint_rows.get(key)
+            if row is None:
+                self.fingerprint_rows[key] = len(self._fingerprints)
+                self._fingerprints.append(fingerprint)
+            else:
+                self._fingerprints[row] = fingerprint
+        self._dirty = True
+
+    def fingerprint(self, key):
+        row = self.fingerprint_rows.get(key)
+        return None if row is None else self._fingerprints[row]
+
+    def save(self, force=False):
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < self.interval):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        keys = sorted(self.fingerprint_rows, key=self.fingerprint_rows.get)
+        matrix = np.array(self._fingerprints, dtype=np.uint8).reshape(-1, MORGAN_BITS // 8)
+
+        # Fingerprints first, descriptors last: a key only counts as cached once it is in descriptors.json
+        _replace(self.directory / FINGERPRINTS_FILE, lambda f: np.save(f, matrix), 'wb')
+        _replace(self.directory / FINGERPRINT_KEYS_FILE, lambda f: json.dump(keys, f))
+        _replace(
+            self.directory / DESCRIPTORS_FILE,
+            lambda f: json.dump({'version': DESCRIPTOR_VERSION, 'morgan_radius': MORGAN_RADIUS,
+                                 'morgan_bits': MORGAN_BITS, 'records': self.descriptors}, f)
+        )
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+
+def _replace(path, write, mode='w'):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def enrich_structures(items, cache, chunk_size=200, workers=None):
+    """
+    Compute every (key, inchi, smiles) item whose key is not cached yet, on a
+    process pool; returns how many were computed
+    """
+    todo = list({key: (key, inchi, smiles) for key, inchi, smiles in items if key and key not in cache}.values())
+    if not todo:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # At most 2 * workers chunks in flight keeps memory bounded on large runs
+        window = deque()
+        pending = _chunks(todo, chunk_size)
+        while True:
+            while len(window) < 2 * workers:
+                chunk = next(pending, None)
+                if chunk is None:
+                    break
+                window.append(executor.submit(compute_chunk, chunk))
+            if not window:
+                break
+
+            try:
+                results = window.popleft().result()
+            except BaseException:
+                for queued in window:
+                    queued.cancel()
+                cache.save(force=True)
+                raise
+
+            for key, descriptors, fingerprint in results:
+                cache.add(key, descriptors, fingerprint)
+            cache.save()
+            done += len(results)
+            print(f"  computed {done}/{len(todo)} structures")
+
+    cache.save(force=True)
+    return done
+
+
+def apply_descriptors(records, cache):
+    """Write cached descriptors into the records in place; returns the number of records filled"""
+    filled = 0
+    for record in records:
+        key = structure_of(record)[0]
+        descriptors = cache.descriptors.get(key) if key else None
+        if not descriptors or 'error' in descriptors:
+            continue
+        for field in RECORD_FIELDS:
+            record[field] = descriptors[field]
+        chemical = record.setdefault('chemical_data', {})
+        if not chemical.get('inchi_key') and descriptors.get('inchi_key'):
+            chemical['inchi_key'] = descriptors['inchi_key']
+        record['descriptor_source'] = 'rdkit'
+        filled += 1
+    return filled
+
+
+def update_csv(records, path=DRUGS_CSV):
+    """Fill the descriptor columns of drugs_enriched.csv from the records, matched by drug name"""
+    path = Path(path)
+    if not path.exists():
+        return
+    frame = pd.read_csv(path)
+    by_name = {record.get('drug_name'): record for record in records if record.get('descriptor_source') == 'rdkit'}
+    for field in CSV_FIELDS:
+        values = [by_name.get(name, {}).get(field) for name in frame['drug_name']]
+        current = frame[field] if field in frame.columns else pd.Series([None] * len(frame))
+        merged = pd.Series([new if new is not None else old for new, old in zip(values, current)], dtype=object)
+        if field in ('h_bond_donors', 'h_bond_acceptors'):
+            merged = pd.to_numeric(merged, errors='coerce').astype('Int64')
+        frame[field] = merged
+    _replace(path, lambda f: frame.to_csv(f, index=False))
+
+
+def write_fingerprint_index(records, cache, directory=FINGERPRINT_INDEX_DIR):
+    """Index the cached fingerprint of every named drug for structural similarity search"""
+    names, fingerprints, seen = [], [], set()
+    for record in records:
+        name = str(record.get('drug_name') or '').strip()
+        key = structure_of(record)[0]
+        fingerprint = cache.fingerprint(key) if key else None
+        if name and fingerprint is not None and name not in seen:
+            seen.add(name)
+            names.append(name)
+            fingerprints.append(fingerprint)
+    if not names:
+        return None
+    return build_fingerprint_index(
+        directory, names, np.array(fingerprints, dtype=np.uint8), MORGAN_BITS,
+        source={'fingerprint': 'morgan', 'radius': MORGAN_RADIUS, 'descriptor_version': DESCRIPTOR_VERSION}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drugs", default=str(DRUGS_JSON), help="drugs_enriched.json to enrich in place")
+    parser.add_argument("--csv", default=str(DRUGS_CSV), help="drugs_enriched.csv to update (skipped if missing)")
+    parser.add_argument("--cache-dir", default=str(CHEMISTRY_DIR), help="InChIKey-keyed descriptor/fingerprint cache")
+    parser.add_argument("--fingerprint-index", default=str(FINGERPRINT_INDEX_DIR),
+                        help="Where to write the structural similarity index")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Structures per worker task")
+    args = parser.parse_args()
+
+    try:
+        import rdkit  # noqa: F401
+    except ImportError:
+        raise SystemExit("RDKit is required for this stage: pip install rdkit")
+
+    with open(args.drugs) as f:
+        records = json.load(f)
+
+    items = [structure_of(record) for record in records]
+    with_structure = [item for item in items if item[0]]
+    cache = ChemistryCache(args.cache_dir)
+    cached = sum(1 for key in {item[0] for item in with_structure} if key in cache)
+
+    computed = enrich_structures(with_structure, cache, chunk_size=args.chunk_size, workers=args.workers)
+    filled = apply_descriptors(records, cache)
+    failed = sum(1 for key in {item[0] for item in with_structure} if 'error' in cache.descriptors.get(key, {}))
+
+    _replace(Path(args.drugs), lambda f: json.dump(records, f, indent=2))
+    update_csv(records, args.csv)
+    index = write_fingerprint_index(records, cache, args.fingerprint_index)
+
+    print(f"{len(records)} drugs: {len(with_structure)} with a structure ({computed} computed, "
+          f"{cached} cached, {failed} unparseable), {filled} records filled")
+    if index is not None:
+        print(f"Fingerprint index: {index['count']} drugs in {args.fingerprint_index}")
+    print("Run scripts/ingest.py to load the new values into the vector database")
+
+
+if __name__ == "__main__":
+    main()
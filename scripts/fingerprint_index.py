@@ -0,0 +1,271 @@
+"""
+Morgan fingerprint index and Tanimoto top-k search for structural similarity
+
+    python scripts/enrich_chemistry.py      # computes the fingerprints and writes this index
+
+Fingerprints are stored bit-packed as a (N, bits/64) uint64 matrix, rows
+sorted by popcount, next to the row popcounts, the drug names and, per bit,
+the rows that have it set (CSR postings). Tanimoto is
+common / (|a| + |b| - common), so only the common bit counts depend on the
+query. Morgan fingerprints are sparse: a query's set bits usually occur in
+a few percent of the rows, and summing their postings gives the common
+counts of every row that shares a bit (the rest score 0) without reading
+the matrix. Queries whose bits are common everywhere scan the matrix
+instead, in blocks: AND with the query words, then popcount (np.bitwise_count,
+or a 16-bit lookup table on older NumPy). As Tanimoto(a, b) never exceeds
+min(|a|, |b|) / max(|a|, |b|), only the popcount band that can still beat
+the k-th best score of a first pass around the query's popcount is scanned.
+"""
+
+import json
+from datetime import datetime
+
+import numpy as np
+
+from artifact_dir import publish_artifact_dir, resolve_artifact_dir
+from vector_backend import PROJECT_ROOT
+
+FINGERPRINT_INDEX_DIR = PROJECT_ROOT / "data" / "processed" / "fingerprint_index"
+
+MANIFEST = "manifest.json"
+FINGERPRINTS = "fingerprints.npy"
+POPCOUNTS = "popcounts.npy"
+BIT_OFFSETS = "bit_offsets.npy"
+BIT_ROWS = "bit_rows.npy"
+
+# Rows scored per block, bounds the temporary (block, words) arrays
+BLOCK_ROWS = 65536
+# Rows around the query's popcount scored first to find a k-th best score to prune with
+SEED_ROWS = 4096
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+
+
+def popcount_rows(words):
+    """Set bits per row of a (rows, words) uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    # SWAR popcount down to per-byte counts, then sum the bytes of each row
+    x = words - ((words >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return x.view(np.uint8).reshape(len(x), -1).sum(axis=1, dtype=np.int32)
+
+
+def set_bits(words):
+    """Bit positions set in one row of uint64 words (the numbering the postings use)"""
+    return np.flatnonzero(np.unpackbits(np.ascontiguousarray(words).view(np.uint8)))
+
+
+def build_fingerprint_index(directory, names, fingerprints, n_bits, source=None):
+    """
+    Write the index for names and their row-aligned fingerprints (np.packbits
+    uint8 rows or uint64 words) to directory, published as a whole (see
+    artifact_dir.py) so the names always match the rows they are read with
+    """
+    words = np.asarray(fingerprints)
+    if words.dtype != np.uint64:
+        words = np.ascontiguousarray(words, dtype=np.uint8)
+        if words.shape[1] % 8:
+            words = np.pad(words, ((0, 0), (0, 8 - words.shape[1] % 8)))
+        words = words.view(np.uint64)
+    words = words.reshape(len(names), -1)
+    popcounts = popcount_rows(words)
+    order = np.argsort(popcounts, kind='stable')
+    words, popcounts = words[order], popcounts[order]
+
+    # Per bit, the (popcount-ordered) rows that have it set
+    bit_rows, bit_ids = [], []
+    for start in range(0, len(words), BLOCK_ROWS):
+        block = np.unpackbits(words[start:start + BLOCK_ROWS].view(np.uint8), axis=1)
+        rows, bits = np.nonzero(block)
+        bit_rows.append((rows + start).astype(np.int32))
+        bit_ids.append(bits.astype(np.int32))
+    bit_rows = np.concatenate(bit_rows) if bit_rows else np.zeros(0, dtype=np.int32)
+    bit_ids = np.concatenate(bit_ids) if bit_ids else np.zeros(0, dtype=np.int32)
+    by_bit = np.argsort(bit_ids, kind='stable')
+    offsets = np.zeros(words.shape[1] * 64 + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bit_ids, minlength=words.shape[1] * 64), out=offsets[1:])
+
+    manifest = {
+        'created_at': datetime.now().isoformat(),
+        'count': len(names),
+        'bits': n_bits,
+        'source': source,
+        'names': [names[i] for i in order],
+    }
+    with publish_artifact_dir(directory) as staging:
+        np.save(staging / FINGERPRINTS, words)
+        np.save(staging / POPCOUNTS, popcounts)
+        np.save(staging / BIT_OFFSETS, offsets)
+        np.save(staging / BIT_ROWS, bit_rows[by_bit])
+        with open(staging / MANIFEST, 'w') as f:
+            json.dump(manifest, f)
+    return manifest
+
+
+class FingerprintIndex:
+    """Memory-mapped fingerprint index, see build_fingerprint_index"""
+
+    def __init__(self, directory=FINGERPRINT_INDEX_DIR):
+        self.directory = resolve_artifact_dir(directory)
+        with open(self.directory / MANIFEST) as f:
+            self.manifest = json.load(f)
+        self.names = self.manifest['names']
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        # Plain ndarray views of the maps: slicing np.memmap objects costs more than the lookups
+        self.fingerprints = np.asarray(np.load(self.directory / FINGERPRINTS, mmap_mode='r'))
+        self.popcounts = np.load(self.directory / POPCOUNTS)
+        self.bit_offsets = np.load(self.directory / BIT_OFFSETS)
+        self.bit_rows = np.asarray(np.load(self.directory / BIT_ROWS, mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    @classmethod
+    def load(cls, directory=FINGERPRINT_INDEX_DIR):
+        """The index, or None when it is missing or unreadable"""
+        if not (resolve_artifact_dir(directory) / MANIFEST).exists():
+            return None
+        try:
+            return cls(directory)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _tanimoto(self, query, query_count, rows):
+        """Tanimoto similarity of the query words to the rows (a slice or an index array)"""
+        common = np.concatenate([
+            popcount_rows(self.fingerprints[block] & query) for block in _blocks(rows)
+        ]) if _size(rows) else np.zeros(0, dtype=np.int32)
+        union = self.popcounts[rows] + query_count - common
+        return np.divide(common, union, out=np.zeros(len(common)), where=union > 0)
+
+    def similarity(self, name, others):
+        """Tanimoto similarity of the named fingerprint to each of others (None where a name is not indexed)"""
+        row = self.rows.get(name)
+        if row is None:
+            return [None] * len(others)
+        rows = [self.rows.get(other) for other in others]
+        known = np.array([r for r in rows if r is not None], dtype=np.int64)
+        scores = iter(self._tanimoto(self.fingerprints[row], int(self.popcounts[row]), known).tolist())
+        return [None if r is None else next(scores) for r in rows]
+
+    def _seed(self, query, query_count, wanted, min_similarity):
+        """
+        Score the rows with popcounts closest to the query's; returns (seed rows,
+        their scores, the k-th best of them as a threshold)
+        """
+        center = int(np.searchsorted(self.popcounts, query_count))
+        seed = slice(max(0, center - SEED_ROWS // 2), min(len(self.names), center + SEED_ROWS // 2))
+        scores = self._tanimoto(query, query_count, seed)
+        threshold = min_similarity
+        if len(scores) >= wanted:
+            threshold = max(threshold, float(np.partition(scores, len(scores) - wanted)[len(scores) - wanted]))
+        return np.arange(seed.start, seed.stop), scores, threshold
+
+    def _band(self, query_count, threshold):
+        """
+        Row range whose popcounts can reach the threshold:
+        Tanimoto(a, b) <= min(|a|, |b|) / max(|a|, |b|)
+        """
+        if threshold <= 0:
+            return 0, len(self.names)
+        start = int(np.searchsorted(self.popcounts, np.ceil(threshold * query_count - 1e-9), side='left'))
+        stop = int(np.searchsorted(self.popcounts, np.floor(query_count / threshold + 1e-9), side='right'))
+        return start, stop
+
+    def _band_postings(self, query, start, stop):
+        """Posting lists of the query's bits, cut to rows [start, stop)"""
+        lists = []
+        # Same dtype as the postings, searchsorted would otherwise convert each whole list
+        bounds = np.array((start, stop), dtype=self.bit_rows.dtype)
+        for bit in set_bits(query):
+            postings = self.bit_rows[self.bit_offsets[bit]:self.bit_offsets[bit + 1]]
+            lo, hi = np.searchsorted(postings, bounds)
+            lists.append(postings[lo:hi])
+        return lists
+
+    def _search_postings(self, query, query_count, threshold, start, stop, lists):
+        """(rows, scores) in rows [start, stop) that can reach the threshold, from the band's posting lists"""
+        if not lists:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        lists = sorted(lists, key=len)
+        total = sum(len(postings) for postings in lists)
+
+        # A row reaching the threshold shares at least min_common bits with the query
+        # (least for the smallest popcount in the band), so it is in one of the
+        # posting lists of the query's len(lists) - min_common + 1 rarest bits
+        smallest = int(self.popcounts[start]) if stop > start else query_count
+        min_common = max(1, int(np.ceil(threshold * (smallest + query_count) / (1 + threshold) - 1e-9)))
+        prefix = lists[:max(0, len(lists) - min_common + 1)]
+        if 10 * sum(len(postings) for postings in prefix) < total:
+            # Few candidates: verify each with the popcount engine
+            rows = np.unique(np.concatenate(prefix)) if prefix else np.zeros(0, dtype=np.int64)
+            return rows, self._tanimoto(query, query_count, rows)
+
+        common = np.bincount(np.concatenate(lists) - start, minlength=stop - start)
+        rows = np.flatnonzero(common)
+        common = common[rows]
+        rows += start
+        return rows, common / (self.popcounts[rows] + query_count - common)
+
+    def _search_scan(self, query, query_count, start, stop):
+        """(rows, scores) of rows [start, stop), scanned in blocks"""
+        return np.arange(start, stop), self._tanimoto(query, query_count, slice(start, stop))
+
+    def search(self, query, k=10, min_similarity=0.0, exclude=None):
+        """
+        Most similar fingerprints to query, a drug name or (bits/64,) uint64 words
+        exclude: name to leave out (the query drug itself)
+        Returns: list of (name, Tanimoto similarity), best first; [] for an unknown name
+        """
+        if isinstance(query, str):
+            row = self.rows.get(query)
+            if row is None:
+                return []
+            query = self.fingerprints[row]
+        query = np.asarray(query, dtype=np.uint64)
+        query_count = int(popcount_rows(query[None])[0])
+        n = len(self.names)
+        wanted = k + (exclude is not None)
+        if not n or k <= 0:
+            return []
+
+        seed_rows, seed_scores, threshold = self._seed(query, query_count, wanted, min_similarity)
+        start, stop = self._band(query_count, threshold)
+        lists = self._band_postings(query, start, stop)
+        # Postings beat reading the band's fingerprints unless most of its rows share most query bits
+        if sum(len(postings) for postings in lists) < (stop - start) * self.fingerprints.shape[1]:
+            rows, scores = self._search_postings(query, query_count, threshold, start, stop, lists)
+        else:
+            rows, scores = self._search_scan(query, query_count, start, stop)
+        rows, first = np.unique(np.concatenate([seed_rows, rows]), return_index=True)
+        scores = np.concatenate([seed_scores, scores])[first]
+
+        keep = (scores > 0) & (scores >= min_similarity)
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > wanted:
+            best = np.argpartition(-scores, wanted - 1)[:wanted]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        results = [(self.names[row], float(score)) for row, score in zip(rows[order], scores[order])]
+        return [(name, score) for name, score in results if name != exclude][:k]
+
+
+def _size(rows):
+    return rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+
+
+def _blocks(rows):
+    """rows (a slice or an index array) in pieces of at most BLOCK_ROWS"""
+    if isinstance(rows, slice):
+        for start in range(rows.start, rows.stop, BLOCK_ROWS):
+            yield slice(start, min(start + BLOCK_ROWS, rows.stop))
+    else:
+        for start in range(0, len(rows), BLOCK_ROWS):
+            yield rows[start:start + BLOCK_ROWS]
@@ -0,0 +1,463 @@
+"""
+Offline stage: incremental ingestion of drug and disease records into the vector database
+
+    python scripts/ingest.py
+
+Every record's embedding text and metadata are hashed separately and compared
+with the hashes stored at the last run. Only records whose text changed are
+re-embedded and upserted; metadata-only changes become cheap metadata updates,
+and records gone from the source files are deleted. Embedding runs batch-wise
+on a worker pool and the hashes are checkpointed as batches land, so an
+interrupted run picks up where it stopped when started again. Finally the
+compact metadata store (metadata_store.py) is rewritten from the collections,
+and with --snapshot the result is published as a new index snapshot that
+running servers swap to (snapshots.py).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from artifact_dir import resolve_artifact_dir
+from disease_profiles import DISEASE_PROFILES_DIR, write_disease_profiles
+from embedding_cache import model_identity
+from lexical_index import LEXICAL_INDEX_DIR, build_lexical_index, table_texts
+from metadata_snapshot import bump_content_generation, collection_version
+from metadata_store import METADATA_STORE_DIR, MetadataStore, write_metadata_store
+from precompute_scores import MANIFEST, PRECOMPUTED_DIR, build_score_matrix
+from quantized_index import refresh_index
+from snapshots import create_snapshot
+from vector_backend import (
+    ARTIFACT_PREFIX, EMBEDDINGS_DIR, NAME_KEY, PROJECT_ROOT, QUANTIZED_DIR, VECTOR_DB_DIR,
+    export_embeddings, open_collections, resolve_embedding_function
+)
+
+DRUGS_SOURCE = PROJECT_ROOT / "data" / "processed" / "drugs_enriched.json"
+DISEASES_SOURCE = PROJECT_ROOT / "data" / "processed" / "diseases_processed.csv"
+CHECKPOINT_PATH = VECTOR_DB_DIR / "ingest_checkpoint.json"
+
+
+def read_records(path):
+    """Records from a JSON list or a CSV file, as dicts"""
+    path = Path(path)
+    if path.suffix == '.csv':
+        return pd.read_csv(path).to_dict('records')
+    with open(path) as f:
+        return json.load(f)
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _int(value):
+    value = _number(value)
+    return int(value) if value is not None else None
+
+
+def _clean(metadata):
+    """Chroma metadata: plain Python scalars, missing values dropped"""
+    cleaned = {}
+    for key, value in metadata.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or (isinstance(value, float) and not math.isfinite(value)):
+            continue
+        cleaned[key] = value
+    return cleaned
+
+
+def drug_entry(record):
+    """(name, embedding text, metadata) for a drugs_enriched.json record"""
+    name = str(record.get('drug_name') or '').strip()
+    chemical = record.get('chemical_data') or {}
+    smiles = record.get('smiles') or chemical.get('smiles')
+    formula = chemical.get('molecular_formula')
+
+    parts = [f"Drug: {name}"]
+    if formula:
+        parts.append(f"Molecular formula: {formula}")
+    if smiles:
+        parts.append(f"SMILES: {smiles}")
+
+    trials = record.get('clinical_trials')
+    trials_count = trials.get('count') if isinstance(trials, dict) else record.get('clinical_trials_count')
+
+    metadata = _clean({
+        'drug_name': name,
+        'smiles': smiles,
+        'pubchem_cid': _int(record.get('pubchem_cid') or chemical.get('pubchem_cid')),
+        'molecular_weight': _number(record.get('molecular_weight') or chemical.get('molecular_weight')),
+        'passes_lipinski': record.get('passes_lipinski'),
+        'bbb_permeable': record.get('bbb_permeable'),
+        'clinical_trials_count': _int(trials_count) or 0,
+    })
+    return name, ". ".join(parts), metadata
+
+
+def disease_entry(record):
+    """(name, embedding text, metadata) for a diseases_processed record"""
+    name = str(record.get('disease_name') or '').strip()
+    description = record.get('description')
+    description = description.strip() if isinstance(description, str) else ''
+
+    text = f"Disease: {name}" + (f". {description}" if description else '')
+    metadata = _clean({
+        'disease_name': name,
+        'efo_id': record.get('efo_id'),
+        'targets_count': _int(record.get('targets_count')) or 0,
+        'known_drugs_count': _int(record.get('known_drugs_count')) or 0,
+        'description': description,
+    })
+    return name, text, metadata
+
+
+def _trial_title(trial):
+    if isinstance(trial, dict):
+        return trial.get('title') or trial.get('brief_title') or trial.get('briefTitle') or trial.get('official_title')
+    return trial if isinstance(trial, str) else None
+
+
+def drug_details(record):
+    """Fields kept in the metadata store only (not embedded, not in Chroma): chemistry, descriptors and trial titles"""
+    chemical = record.get('chemical_data') or {}
+    details = {key: chemical.get(key) or record.get(key) for key in ('molecular_formula', 'inchi', 'inchi_key')}
+    # RDKit descriptors from scripts/enrich_chemistry.py
+    details.update({key: _number(record.get(key)) for key in ('logp', 'tpsa')})
+    details.update({key: _int(record.get(key)) for key in ('h_bond_donors', 'h_bond_acceptors', 'rotatable_bonds')})
+
+    trials = record.get('clinical_trials')
+    titles = [_trial_title(trial) for trial in (trials.get('trials') or [])] if isinstance(trials, dict) else []
+    details['clinical_trial_titles'] = " | ".join(title.strip() for title in titles if title and title.strip()) or None
+    return _clean(details)
+
+
+ENTRY_BUILDERS = {"drugs": drug_entry, "diseases": disease_entry}
+DETAIL_BUILDERS = {"drugs": drug_details}
+
+
+def content_hash(value):
+    """Stable digest of a text or JSON-serializable value"""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def new_record_id(target, name):
+    """Deterministic id for a record the collection has not seen before"""
+    return f"{ARTIFACT_PREFIX[target]}_{hashlib.sha1(name.encode()).hexdigest()[:16]}"
+
+
+class Checkpoint:
+    """
+    Text and metadata hashes of every ingested record, per collection
+
+    Saved atomically, and at most every `interval` seconds unless forced.
+    Hashes from a different embedding model are discarded on load.
+    """
+
+    def __init__(self, path, model_id, interval=5.0):
+        self.path = Path(path)
+        self.model_id = model_id
+        self.interval = interval
+        self._hashes = {}
+        self._saved_at = 0.0
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('model_id') == self.model_id:
+            self._hashes = data.get('collections', {})
+
+    def records(self, target):
+        return self._hashes.setdefault(target, {})
+
+    def mark(self, target, record_id, text_hash, metadata_hash):
+        self.records(target)[record_id] = [text_hash, metadata_hash]
+        self._dirty = True
+
+    def forget(self, target, record_ids):
+        records = self.records(target)
+        for record_id in record_ids:
+            records.pop(record_id, None)
+        self._dirty = True
+
+    def save(self, force=False):
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < self.interval):
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'model_id': self.model_id, 'collections': self._hashes}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+
+def plan_changes(collection, target, entries, checkpoint, force=False):
+    """
+    Compare source entries with the collection and the checkpoint
+
+    Returns (to_embed, to_update, to_delete, unchanged) where the first two are
+    lists of (record_id, text, metadata, text_hash, metadata_hash) tuples;
+    with force every entry is re-embedded.
+    Existing ids are kept by matching record names, so rebuilt collections and
+    the precomputed scores keep pointing at the same records.
+    """
+    name_key = NAME_KEY[target]
+    stored = collection.get(include=["documents", "metadatas"])
+    stored_ids = list(stored['ids'])
+    stored_records = dict(zip(stored_ids, zip(stored['documents'] or [None] * len(stored_ids),
+                                              stored['metadatas'] or [None] * len(stored_ids))))
+
+    id_by_name = {}
+    for record_id in stored_ids:
+        metadata = stored_records[record_id][1] or {}
+        id_by_name.setdefault(metadata.get(name_key), record_id)
+
+    known = checkpoint.records(target)
+    to_embed, to_update = [], []
+    keep = set()
+    unchanged = 0
+
+    for name, text, metadata in entries:
+        record_id = id_by_name.get(name) or new_record_id(target, name)
+        keep.add(record_id)
+        text_hash, metadata_hash = content_hash(text), content_hash(metadata)
+        item = (record_id, text, metadata, text_hash, metadata_hash)
+
+        if force or record_id not in stored_records:
+            to_embed.append(item)
+            continue
+
+        hashes = known.get(record_id)
+        if hashes is None:
+            # Ingested before checkpoints existed: compare what the collection stores
+            document, stored_metadata = stored_records[record_id]
+            hashes = [content_hash(document) if document is not None else None,
+                      content_hash(stored_metadata or {})]
+
+        if hashes[0] != text_hash:
+            to_embed.append(item)
+        elif hashes[1] != metadata_hash:
+            to_update.append(item)
+        else:
+            unchanged += 1
+            if record_id not in known:
+                checkpoint.mark(target, record_id, text_hash, metadata_hash)
+
+    to_delete = [record_id for record_id in stored_ids if record_id not in keep]
+    return to_embed, to_update, to_delete, unchanged
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingest_collection(collection, target, entries, checkpoint, batch_size=256, workers=4,
+                      force=False, dry_run=False):
+    """Bring one collection in line with entries; returns counts per kind of change"""
+    to_embed, to_update, to_delete, unchanged = plan_changes(collection, target, entries, checkpoint, force)
+    stats = {'embedded': len(to_embed), 'updated': len(to_update),
+             'deleted': len(to_delete), 'unchanged': unchanged}
+    if dry_run:
+        return stats
+    if not (to_embed or to_update or to_delete):
+        return stats
+
+    try:
+        _write_changes(collection, target, to_embed, to_update, to_delete, checkpoint, batch_size, workers)
+    finally:
+        # Also after an interrupted run: whatever was written already changed the contents
+        bump_content_generation(collection)
+    return stats
+
+
+def _write_changes(collection, target, to_embed, to_update, to_delete, checkpoint, batch_size, workers):
+    for batch in _batches(to_update, batch_size):
+        collection.update(ids=[item[0] for item in batch], metadatas=[item[2] for item in batch])
+        for record_id, _, _, text_hash, metadata_hash in batch:
+            checkpoint.mark(target, record_id, text_hash, metadata_hash)
+        checkpoint.save()
+
+    embedding_function = resolve_embedding_function(collection)
+
+    def embed(batch):
+        return np.asarray(embedding_function([item[1] for item in batch]), dtype=np.float32)
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # At most 2 * workers batches in flight keeps memory bounded on large refreshes
+        window = deque()
+        pending = _batches(to_embed, batch_size)
+        while True:
+            while len(window) < 2 * workers:
+                batch = next(pending, None)
+                if batch is None:
+                    break
+                window.append((batch, executor.submit(embed, batch)))
+            if not window:
+                break
+
+            batch, future = window.popleft()
+            try:
+                embeddings = future.result()
+            except BaseException:
+                for _, queued in window:
+                    queued.cancel()
+                checkpoint.save(force=True)
+                raise
+
+            collection.upsert(
+                ids=[item[0] for item in batch],
+                embeddings=embeddings,
+                documents=[item[1] for item in batch],
+                metadatas=[item[2] for item in batch],
+            )
+            for record_id, _, _, text_hash, metadata_hash in batch:
+                checkpoint.mark(target, record_id, text_hash, metadata_hash)
+            checkpoint.save()
+
+            done += len(batch)
+            print(f"  {target}: embedded {done}/{len(to_embed)}")
+
+    # Deletions go last so an interrupted run never leaves records missing
+    for batch in _batches(to_delete, batch_size):
+        collection.delete(ids=batch)
+        checkpoint.forget(target, batch)
+    checkpoint.save(force=True)
+
+
+def load_entries(target, path):
+    """
+    Source entries for target, one per distinct non-empty name (last record wins),
+    and the store-only details of each name
+    """
+    build = ENTRY_BUILDERS[target]
+    build_details = DETAIL_BUILDERS.get(target)
+    entries, details = {}, {}
+    for record in read_records(path):
+        name, text, metadata = build(record)
+        if name:
+            entries[name] = (name, text, metadata)
+            if build_details is not None:
+                details[name] = build_details(record)
+    return list(entries.values()), details
+
+
+def write_store(collections, details, directory=METADATA_STORE_DIR):
+    """Write the metadata store from the collections' records plus the store-only details"""
+    tables, versions = {}, {}
+    for target, collection in collections.items():
+        records = collection.get(include=["metadatas"])
+        name_key = NAME_KEY[target]
+        target_details = details.get(target, {})
+        metadatas = [
+            {**target_details.get((metadata or {}).get(name_key), {}), **(metadata or {})}
+            for metadata in records['metadatas']
+        ]
+        tables[target] = (records['ids'], metadatas)
+        versions[target] = collection_version(collection)
+    return write_metadata_store(directory, tables, versions)
+
+
+def write_lexical_indexes(collections, store, directory=LEXICAL_INDEX_DIR):
+    """Rebuild the BM25 keyword indexes (lexical_index.py) from the metadata store"""
+    for target, collection in collections.items():
+        table = store.table_for(target, collection)
+        ids = [str(record_id) for record_id in table.ids]
+        build_lexical_index(
+            Path(directory) / target, ids, table_texts(target, table, ids),
+            (*collection_version(collection), "store")
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    parser.add_argument("--drugs", default=str(DRUGS_SOURCE), help="Drug records (JSON or CSV)")
+    parser.add_argument("--diseases", default=str(DISEASES_SOURCE), help="Disease records (JSON or CSV)")
+    parser.add_argument("--checkpoint", default=None, help="Hash checkpoint file (default: inside --db-path)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Records embedded per batch")
+    parser.add_argument("--workers", type=int, default=4, help="Embedding batches computed in parallel")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and re-embed everything")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--no-precompute", action="store_true", help="Skip rebuilding precomputed scores")
+    parser.add_argument("--snapshot", action="store_true", help="Publish the result as a new index snapshot")
+    args = parser.parse_args()
+
+    collections = dict(zip(("drugs", "diseases"), open_collections(args.db_path, create=True)))
+    sources = {"drugs": args.drugs, "diseases": args.diseases}
+
+    model_id = model_identity(resolve_embedding_function(collections["drugs"]))
+    checkpoint = Checkpoint(args.checkpoint or Path(args.db_path) / CHECKPOINT_PATH.name, model_id)
+
+    changed = []
+    details = {}
+    for target, collection in collections.items():
+        entries, details[target] = load_entries(target, sources[target])
+        stats = ingest_collection(
+            collection, target, entries, checkpoint, batch_size=args.batch_size,
+            workers=args.workers, force=args.full, dry_run=args.dry_run
+        )
+        print(f"{target}: {stats['embedded']} embedded, {stats['updated']} metadata updated, "
+              f"{stats['deleted']} deleted, {stats['unchanged']} unchanged")
+        if stats['embedded'] or stats['updated'] or stats['deleted']:
+            changed.append(target)
+
+    if args.dry_run:
+        return
+
+    store = MetadataStore.open(METADATA_STORE_DIR)
+    if changed or store is None or any(store.table_for(t, c) is None for t, c in collections.items()):
+        manifest = write_store(collections, details)
+        print(f"Wrote metadata store ({manifest['tables']['drugs']['count']} drugs, "
+              f"{manifest['tables']['diseases']['count']} diseases) to {METADATA_STORE_DIR}")
+        write_lexical_indexes(collections, MetadataStore.open(METADATA_STORE_DIR))
+        print(f"Rebuilt keyword indexes in {LEXICAL_INDEX_DIR}")
+
+    # Keep the NumPy backend's matrices and the precomputed scores in step with the collections
+    for target in changed:
+        prefix = ARTIFACT_PREFIX[target]
+        export_embeddings(collections[target], prefix, EMBEDDINGS_DIR)
+        matrix = np.load(EMBEDDINGS_DIR / f"{prefix}_embeddings.npy", mmap_mode='r')
+        if refresh_index(QUANTIZED_DIR, prefix, matrix) is not None:
+            print(f"Rebuilt quantized {target} codes in {QUANTIZED_DIR}")
+    if changed and not args.no_precompute and (resolve_artifact_dir(PRECOMPUTED_DIR) / MANIFEST).exists():
+        build_score_matrix(collections["drugs"], collections["diseases"], PRECOMPUTED_DIR,
+                           metadata_store=MetadataStore.open(METADATA_STORE_DIR))
+        print(f"Rebuilt precomputed scores in {PRECOMPUTED_DIR}")
+    if "diseases" in changed:
+        store = MetadataStore.open(METADATA_STORE_DIR)
+        write_disease_profiles(collections["diseases"], DISEASE_PROFILES_DIR,
+                               store.table_for("diseases", collections["diseases"]) if store else None)
+        print(f"Rebuilt disease profiles in {DISEASE_PROFILES_DIR}")
+
+    if args.snapshot:
+        snapshot = create_snapshot(args.db_path)
+        print(f"Published snapshot {snapshot.version} to {snapshot.path}, now active")
+
+
+if __name__ == "__main__":
+    main()
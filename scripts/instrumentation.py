@@ -0,0 +1,295 @@
+"""
+Lightweight instrumentation for SmartSearch and the app: timing spans,
+counters and histograms in one process-wide registry
+
+    from instrumentation import metrics
+
+    with metrics.trace("Drugs for a Disease") as trace:    # collects the spans below
+        with metrics.span("embed"):
+            ...
+    metrics.count("collection_calls_total", call="query", target="drugs")
+
+    metrics.prometheus_text()    # Prometheus text exposition format
+    metrics.snapshot()           # the same data as a dict
+
+SEARCH_METRICS=0 disables everything: span() and trace() hand out shared
+no-op context managers and count()/observe() return immediately.
+SEARCH_METRICS_LOG=<path> appends every finished trace to that file as a
+JSON line.
+"""
+
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Seconds, as Prometheus expects
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)], ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None when empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class Trace:
+    """Spans recorded while a trace was active, e.g. one user search"""
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.started_at = datetime.now()
+        self.total_ms = None
+        self._start = time.perf_counter()
+        self._depth = 0
+
+    def breakdown(self):
+        """Spans in start order as {'span', 'depth', 'start_ms', 'duration_ms'} dicts"""
+        return [
+            {'span': name, 'depth': depth, 'start_ms': round(start * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+            for name, depth, start, duration in sorted(self.spans, key=lambda span: (span[2], span[1]))
+        ]
+
+    def as_dict(self):
+        return {
+            'trace': self.name,
+            'started_at': self.started_at.isoformat(),
+            'total_ms': self.total_ms,
+            'spans': self.breakdown(),
+        }
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'trace', 'depth', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.depth = self.trace._depth
+            self.trace._depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe("span_duration_seconds", elapsed, span=self.name)
+        trace = self.trace
+        if trace is not None:
+            trace._depth -= 1
+            trace.spans.append((self.name, self.depth, self.start - trace._start, elapsed))
+        return False
+
+
+class _NullContext:
+    """Shared no-op span/trace used while metrics are disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class _TraceContext:
+    __slots__ = ('metrics', 'trace', 'token')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.trace = Trace(name)
+
+    def __enter__(self):
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current_trace.reset(self.token)
+        trace = self.trace
+        elapsed = time.perf_counter() - trace._start
+        trace.total_ms = round(elapsed * 1000, 3)
+        self.metrics.observe("trace_duration_seconds", elapsed, trace=trace.name)
+        self.metrics._finish_trace(trace)
+        return False
+
+
+class Metrics:
+    """Process-wide registry of counters, histograms and exported collector values"""
+
+    def __init__(self, enabled=True, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.last_trace = None
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Context manager timing a block into span_duration_seconds{span=name}"""
+        if not self.enabled:
+            return _NULL
+        return _Span(self, name)
+
+    def trace(self, name):
+        """Context manager collecting every span opened inside it (yields the Trace, or None when disabled)"""
+        if not self.enabled:
+            return _NULL
+        return _TraceContext(self, name)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register_collector(self, prefix, collect):
+        """Export collect() -> {name: number} as gauges <prefix>_<name> (e.g. cache stats)"""
+        self._collectors[prefix] = collect
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        self.last_trace = None
+
+    def _finish_trace(self, trace):
+        self.last_trace = trace
+        if self.log_path:
+            line = json.dumps(trace.as_dict())
+            with self._lock, open(self.log_path, 'a') as f:
+                f.write(line + "\n")
+
+    def _collected(self):
+        gauges = {}
+        for prefix, collect in list(self._collectors.items()):
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{prefix}_{name}"] = value
+        return gauges
+
+    def snapshot(self):
+        """Counters, histograms (with approximate p50/p95/p99) and gauges as plain data"""
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'p50': histogram.quantile(0.50),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {'enabled': self.enabled, 'counters': counters, 'histograms': histograms, 'gauges': self._collected()}
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, total in histogram.cumulative():
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {total}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for name, value in sorted(self._collected().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _env_enabled():
+    return os.environ.get("SEARCH_METRICS", "1").strip().lower() not in ("0", "false", "off", "no")
+
+
+metrics = Metrics(enabled=_env_enabled(), log_path=os.environ.get("SEARCH_METRICS_LOG") or None)
@@ -0,0 +1,211 @@
+"""
+Intent routing for the AI assistant
+
+All disease keywords, question phrases and drug names are compiled once into a
+single Aho-Corasick automaton, so classifying a message is one pass over its
+characters regardless of how many drugs are in the collection.
+"""
+
+from collections import deque
+
+DISEASE_PATTERNS = {
+    'alzheimer': {
+        'keywords': ['alzheimer', 'alzhimer', 'alziehmer', 'alzheimers', 'dementia', 'memory loss', 'cognitive decline'],
+        'search_query': "Alzheimer's disease neurodegeneration cognitive decline dementia brain memory",
+        'display_name': "Alzheimer's disease"
+    },
+    'diabetes': {
+        'keywords': ['diabetes', 'diabetic', 'diabetis', 'sugar', 'insulin', 'glucose'],
+        'search_query': "diabetes mellitus insulin glucose blood sugar metabolic",
+        'display_name': "Diabetes"
+    },
+    'cancer': {
+        'keywords': ['cancer', 'tumor', 'carcinoma', 'malignant', 'oncology'],
+        'search_query': "cancer carcinoma tumor malignant neoplasm oncology",
+        'display_name': "Cancer"
+    },
+    'heart': {
+        'keywords': ['heart', 'cardiac', 'cardiovascular', 'coronary', 'myocardial'],
+        'search_query': "heart disease cardiovascular coronary cardiac myocardial",
+        'display_name': "Heart Disease"
+    },
+    'parkinson': {
+        'keywords': ['parkinson', 'parkinsons', 'tremor', 'movement disorder'],
+        'search_query': "Parkinson's disease movement disorder tremor dopamine",
+        'display_name': "Parkinson's disease"
+    },
+    'depression': {
+        'keywords': ['depression', 'depressed', 'sad', 'mood disorder', 'mental health'],
+        'search_query': "depression mental health mood disorder psychiatric",
+        'display_name': "Depression"
+    },
+    'hypertension': {
+        'keywords': ['hypertension', 'high blood pressure', 'blood pressure'],
+        'search_query': "hypertension high blood pressure cardiovascular",
+        'display_name': "Hypertension"
+    },
+    'asthma': {
+        'keywords': ['asthma', 'breathing', 'respiratory', 'airway'],
+        'search_query': "asthma respiratory breathing airway inflammation",
+        'display_name': "Asthma"
+    },
+    'arthritis': {
+        'keywords': ['arthritis', 'joint pain', 'rheumatoid', 'osteoarthritis'],
+        'search_query': "arthritis joint inflammation pain rheumatoid",
+        'display_name': "Arthritis"
+    }
+}
+
+DISEASE_DESCRIPTIONS = {
+    "Alzheimer's disease": "**Alzheimer's disease** is a progressive neurodegenerative disorder that affects memory, thinking, and behavior. It's the most common cause of dementia.",
+    "Diabetes": "**Diabetes** is a metabolic disorder characterized by high blood sugar levels. Type 2 diabetes involves insulin resistance.",
+    "Cancer": "**Cancer** is a group of diseases involving abnormal cell growth with the potential to invade or spread to other parts of the body.",
+    "Heart Disease": "**Heart disease** refers to conditions that affect the heart, including coronary artery disease, heart attacks, and heart failure.",
+    "Parkinson's disease": "**Parkinson's disease** is a progressive nervous system disorder that affects movement, causing tremors, stiffness, and balance problems.",
+    "Depression": "**Depression** is a mental health disorder characterized by persistent feelings of sadness, loss of interest, and low energy.",
+    "Hypertension": "**Hypertension** (high blood pressure) is a condition where the force of blood against artery walls is consistently too high.",
+    "Asthma": "**Asthma** is a chronic respiratory condition causing inflammation and narrowing of airways, leading to breathing difficulties.",
+    "Arthritis": "**Arthritis** is inflammation of the joints, causing pain and stiffness. Common types include osteoarthritis and rheumatoid arthritis."
+}
+
+FILLER_WORDS = {'what', 'is', 'a', 'an', 'the', 'about', 'tell', 'me', 'can', 'you', 'help', 'with', 'for'}
+
+# Phrase groups, matched as plain substrings like disease keywords
+PHRASE_GROUPS = {
+    'question': ['what is', 'what are', 'tell me about', 'explain', 'define'],
+    'how': ['how', 'explain', 'tell'],
+    'repurposing': ['drug repurposing', 'repurpose', 'work'],
+    'usage': ['use', 'help'],
+}
+
+ALL_DISEASE_KEYWORDS = [
+    (keyword, key) for key, info in DISEASE_PATTERNS.items() for keyword in info['keywords']
+]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over many patterns, each carrying one or more payloads"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, pattern, payload):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), payload))
+        self._built = False
+
+    def build(self):
+        """Compute failure links breadth-first and merge suffix outputs"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """Yield (start, end, payload) for every pattern occurrence in text"""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in out[state]:
+                yield end - length, end, payload
+
+
+class IntentRouter:
+    """
+    Classify an assistant message in one pass over its text
+
+    route() returns {'intent', 'disease', 'drug'} where intent is one of
+    'disease_info', 'disease_drugs', 'drug_uses', 'about_repurposing',
+    'how_to_use', 'disease_partial' or 'fallback'.
+    """
+
+    def __init__(self, drug_names=()):
+        self.automaton = KeywordAutomaton()
+
+        for priority, (key, info) in enumerate(DISEASE_PATTERNS.items()):
+            for keyword in info['keywords']:
+                self.automaton.add(keyword, ('disease', priority, key))
+
+        for group, phrases in PHRASE_GROUPS.items():
+            for phrase in phrases:
+                self.automaton.add(phrase, ('phrase', group, None))
+
+        seen = set()
+        for name in drug_names:
+            key = (name or '').lower().strip()
+            if key and key not in seen and key not in FILLER_WORDS:
+                seen.add(key)
+                self.automaton.add(key, ('drug', len(key), name))
+
+        self.automaton.build()
+
+    @staticmethod
+    def _is_word(text, start, end):
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+    def route(self, user_input):
+        user_lower = user_input.lower().strip()
+
+        disease = None
+        drug = None
+        phrases = set()
+        for start, end, (kind, rank, value) in self.automaton.iter_matches(user_lower):
+            if kind == 'disease':
+                if disease is None or rank < disease[0]:
+                    disease = (rank, value)
+            elif kind == 'phrase':
+                phrases.add(rank)
+            elif self._is_word(user_lower, start, end):
+                # Prefer the longest drug name, then the earliest one
+                if drug is None or (rank, -start) > (drug[0], drug[1]):
+                    drug = (rank, -start, value)
+
+        disease_key = disease[1] if disease else None
+
+        if disease_key and 'question' in phrases:
+            return {'intent': 'disease_info', 'disease': disease_key, 'drug': None}
+        if disease_key:
+            return {'intent': 'disease_drugs', 'disease': disease_key, 'drug': None}
+        if drug:
+            return {'intent': 'drug_uses', 'disease': None, 'drug': drug[2]}
+        if 'how' in phrases:
+            if 'repurposing' in phrases:
+                return {'intent': 'about_repurposing', 'disease': None, 'drug': None}
+            if 'usage' in phrases:
+                return {'intent': 'how_to_use', 'disease': None, 'drug': None}
+
+        # Short partial input such as "alzh": the message is part of a keyword
+        clean_words = [w for w in user_lower.split() if w not in FILLER_WORDS]
+        if user_lower and len(clean_words) <= 3:
+            for keyword, key in ALL_DISEASE_KEYWORDS:
+                if user_lower in keyword:
+                    return {'intent': 'disease_partial', 'disease': key, 'drug': None}
+
+        return {'intent': 'fallback', 'disease': None, 'drug': None}
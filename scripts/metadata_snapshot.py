@@ -0,0 +1,251 @@
+"""
+Columnar snapshot of drug and disease metadata for the Analytics and Database Explorer pages
+
+pandas is imported where the frames are built, so importing this module (e.g.
+for collection_version) does not put pandas on the app's startup path.
+"""
+
+from bisect import bisect_right
+from functools import cached_property
+
+import numpy as np
+
+from drug_filters import PropertyBitmaps
+
+BOOL_CATEGORIES = [False, True]
+
+# Collection metadata key ingest bumps whenever it writes records
+GENERATION_KEY = "content_generation"
+
+
+def _live_metadata(collection):
+    """The collection's metadata as stored now; Collection.metadata is only read when it is opened"""
+    client = getattr(collection, '_client', None)
+    if client is None:
+        return getattr(collection, 'metadata', None) or {}
+    model = client.get_collection(collection.name, tenant=collection.tenant, database=collection.database)
+    return model.metadata or {}
+
+
+def content_generation(collection):
+    """Content generation ingest recorded on the collection, 0 when it never wrote one"""
+    return int(_live_metadata(collection).get(GENERATION_KEY, 0))
+
+
+def bump_content_generation(collection):
+    """
+    Record that collection's records were written, so collection_version changes
+    for metadata updates and in-place upserts too; returns the new generation
+    """
+    # hnsw:* settings are fixed at creation and modify() rejects them (the space stays in the configuration)
+    metadata = {key: value for key, value in _live_metadata(collection).items() if not key.startswith("hnsw:")}
+    metadata[GENERATION_KEY] = int(metadata.get(GENERATION_KEY, 0)) + 1
+    collection.modify(metadata=metadata)
+    return metadata[GENERATION_KEY]
+
+
+def collection_version(collection):
+    """
+    Cheap fingerprint of a collection's contents: its id, record count and
+    content generation, so it changes on every ingest that wrote records
+    """
+    return (str(getattr(collection, 'id', '')), collection.count(), content_generation(collection))
+
+
+def _numeric_column(frame, column):
+    """Column coerced to numbers (NaN where missing or unparseable)"""
+    import pandas as pd
+
+    if column not in frame.columns:
+        return pd.Series(np.nan, index=frame.index)
+    return pd.to_numeric(frame[column], errors='coerce')
+
+
+def _bool_column(values):
+    """Nullable boolean column stored as a two-category categorical (None -> NaN)"""
+    import pandas as pd
+
+    return pd.Categorical(
+        [v if isinstance(v, (bool, np.bool_)) else None for v in values],
+        categories=BOOL_CATEGORIES
+    )
+
+
+def build_drug_frame(metadatas):
+    """
+    Typed drug metadata frame: categoricals for booleans, float32 molecular weight
+    metadatas: list of metadata dicts, or a frame of the same columns (metadata store)
+    """
+    import pandas as pd
+
+    frame = pd.DataFrame(metadatas)
+    for column in ('drug_name', 'smiles'):
+        if column not in frame.columns:
+            frame[column] = None
+
+    frame['drug_name'] = frame['drug_name'].fillna('Unknown').astype(str)
+    frame['molecular_weight'] = _numeric_column(frame, 'molecular_weight').astype(np.float32)
+    frame['clinical_trials_count'] = _numeric_column(frame, 'clinical_trials_count').fillna(0).astype(np.int32)
+    frame['pubchem_cid'] = _numeric_column(frame, 'pubchem_cid').astype('Int64')
+    for column in ('passes_lipinski', 'bbb_permeable'):
+        frame[column] = _bool_column(frame[column] if column in frame.columns else [None] * len(frame))
+
+    return frame
+
+
+def build_disease_frame(metadatas):
+    """Typed disease metadata frame, from metadata dicts or a frame like build_drug_frame"""
+    import pandas as pd
+
+    frame = pd.DataFrame(metadatas)
+    if 'disease_name' not in frame.columns:
+        frame['disease_name'] = None
+
+    frame['disease_name'] = frame['disease_name'].fillna('Unknown').astype(str)
+    for column in ('targets_count', 'known_drugs_count'):
+        frame[column] = _numeric_column(frame, column).fillna(0).astype(np.int32)
+
+    return frame
+
+
+class ExplorerView:
+    """
+    Name-sorted view of a metadata frame for the Database Explorer: a name
+    filter, an optional row mask and a sort column select the rows, and only
+    the visible page is ever materialized.
+
+    The lowercased names are joined in name order into one NUL-separated text
+    with an array of start offsets, so a substring filter is a scan of that
+    text plus a binary search per hit, and its matches come out already in
+    name order. Property sort orders are computed once per column (missing
+    values last, ties in name order); a filtered sort is then a boolean mask
+    applied to the stored order, without sorting again.
+    """
+
+    def __init__(self, frame, name_column):
+        self.frame = frame
+        self.name_column = name_column
+        names = frame[name_column].to_numpy(dtype=object)
+        self.name_order = np.argsort(names, kind='stable')
+        self.name_rank = np.empty(len(names), dtype=np.int64)
+        self.name_rank[self.name_order] = np.arange(len(names))
+
+        lowered = [names[row].lower() for row in self.name_order]
+        self._text = "\0".join(lowered)
+        lengths = np.fromiter(map(len, lowered), dtype=np.int64, count=len(lowered)) + 1
+        self._starts = (np.cumsum(lengths) - lengths).tolist()
+        self._orders = {}
+        self._last_match = (None, None)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _name_positions(self, text):
+        """Name-order positions of the names containing text, None when text is empty"""
+        text = (text or '').lower().strip().replace("\0", "")
+        if not text:
+            return None
+        if self._last_match[0] == text:
+            return self._last_match[1]
+
+        positions = []
+        find, starts = self._text.find, self._starts
+        hit = find(text)
+        while hit != -1:
+            position = bisect_right(starts, hit) - 1
+            positions.append(position)
+            # Continue in the next name; a name is listed once however often it matches
+            hit = find(text, starts[position + 1]) if position + 1 < len(starts) else -1
+        positions = np.asarray(positions, dtype=np.int64)
+        self._last_match = (text, positions)
+        return positions
+
+    def _order(self, column, descending):
+        """All rows ordered by column, missing values last and ties in name order"""
+        key = (column, descending)
+        if key not in self._orders:
+            series = self.frame[column]
+            if series.dtype.name == 'category':
+                values = series.cat.codes.to_numpy().astype(np.float64)
+                values[values < 0] = np.nan
+            else:
+                values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(values)
+            values = np.where(missing, 0.0, -values if descending else values)
+            self._orders[key] = np.lexsort((self.name_rank, values, missing))
+        return self._orders[key]
+
+    def select(self, text="", mask=None, sort_by=None, descending=False):
+        """
+        Frame row positions whose name contains text (case-insensitive) and that
+        pass the boolean row mask, ordered by name or by the sort_by column
+        """
+        positions = self._name_positions(text)
+        if sort_by is None or sort_by == self.name_column:
+            rows = self.name_order if positions is None else self.name_order[positions]
+            if mask is not None:
+                rows = rows[mask[rows]]
+            return rows[::-1] if descending else rows
+
+        keep = np.ones(len(self), dtype=bool) if mask is None else mask.copy()
+        if positions is not None:
+            named = np.zeros(len(self), dtype=bool)
+            named[self.name_order[positions]] = True
+            keep &= named
+        order = self._order(sort_by, descending)
+        return order[keep[order]]
+
+    def page(self, rows, page, page_size, columns=None):
+        """Frame slice of one page of the selected rows (page counts from 0), limited to columns present"""
+        rows = rows[page * page_size:(page + 1) * page_size]
+        frame = self.frame.iloc[rows]
+        return frame if columns is None else frame[[column for column in columns if column in frame.columns]]
+
+
+class MetadataSnapshot:
+    """
+    Drug and disease metadata loaded once into typed frames, with the Analytics
+    aggregates precomputed. `version` identifies the collections it was built from.
+    """
+
+    HISTOGRAM_BINS = 30
+
+    def __init__(self, drug_metadatas, disease_metadatas, version=None):
+        self.version = version
+        self.drugs = build_drug_frame(drug_metadatas)
+        self.diseases = build_disease_frame(disease_metadatas)
+
+        self.value_counts = {
+            column: {
+                value: int(count)
+                for value, count in self.drugs[column].value_counts(dropna=True).items() if count
+            }
+            for column in ('passes_lipinski', 'bbb_permeable')
+        }
+
+        weights = self.drugs['molecular_weight'].to_numpy()
+        weights = weights[np.isfinite(weights) & (weights > 0)]
+        if len(weights):
+            self.molecular_weight_histogram = np.histogram(weights, bins=self.HISTOGRAM_BINS)
+        else:
+            self.molecular_weight_histogram = None
+
+    # The Explorer's indexes are built the first time the page is opened
+
+    @cached_property
+    def drug_view(self):
+        return ExplorerView(self.drugs, 'drug_name')
+
+    @cached_property
+    def disease_view(self):
+        return ExplorerView(self.diseases, 'disease_name')
+
+    @cached_property
+    def drug_properties(self):
+        """PropertyBitmaps over the drug frame, for DrugFilter masks"""
+        return PropertyBitmaps(
+            self.drugs['bbb_permeable'].to_numpy(dtype=object),
+            self.drugs['passes_lipinski'].to_numpy(dtype=object),
+            self.drugs['molecular_weight'].to_numpy(dtype=np.float64),
+            self.drugs['clinical_trials_count'].to_numpy()
+        )
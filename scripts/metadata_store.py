@@ -0,0 +1,288 @@
+"""
+Compact columnar store for drug and disease metadata
+
+One directory holds, per table, typed .npy columns with rows sorted by record
+id, plus one interned string dictionary (UTF-8 blob + offsets) that all string
+columns of the store point into. Everything is opened with mmap, so a lookup
+by id is a binary search and a handful of array reads - nothing is parsed up
+front. Written by ingest.py, read by SmartSearch and the search backends.
+"""
+
+import json
+from collections.abc import Sequence
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from artifact_dir import publish_artifact_dir, resolve_artifact_dir
+from metadata_snapshot import collection_version
+from vector_backend import PROJECT_ROOT
+
+METADATA_STORE_DIR = PROJECT_ROOT / "data" / "processed" / "metadata_store"
+
+MANIFEST = "manifest.json"
+STRINGS = "strings.bin"
+STRING_OFFSETS = "string_offsets.npy"
+IDS = "ids.npy"
+
+# Missing values: -1 string code, NaN float, INT_MISSING int, -1 bool
+INT_MISSING = np.iinfo(np.int64).min
+
+
+def _column_kind(values):
+    """Storage kind for a column from its non-missing Python values"""
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, (bool, np.bool_)) for v in present):
+        return 'bool'
+    if present and all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in present):
+        return 'int'
+    if present and all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in present):
+        return 'float'
+    return 'str'
+
+
+class _StringInterner:
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+
+    def code(self, value):
+        value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+def _encode_column(values, kind, interner):
+    if kind == 'str':
+        return np.array([-1 if v is None else interner.code(v) for v in values], dtype=np.int32)
+    if kind == 'bool':
+        return np.array([-1 if v is None else int(bool(v)) for v in values], dtype=np.int8)
+    if kind == 'int':
+        return np.array([INT_MISSING if v is None else int(v) for v in values], dtype=np.int64)
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def write_metadata_store(directory, tables, versions=None):
+    """
+    Write tables {name: (ids, metadatas)} to directory, published as a whole
+    (see artifact_dir.py) so readers never open columns of two different writes
+
+    versions: optional {name: collection_version(...)} recorded so readers can
+    tell whether the store still matches its collection.
+    """
+    with publish_artifact_dir(directory) as staging:
+        return _write_store(staging, tables, versions)
+
+
+def _write_store(directory, tables, versions):
+    interner = _StringInterner()
+    manifest = {'created_at': datetime.now().isoformat(), 'tables': {}}
+
+    for name, (ids, metadatas) in tables.items():
+        ids = [str(record_id) for record_id in ids]
+        order = np.argsort(np.array(ids, dtype=str), kind='stable')
+        ids = [ids[i] for i in order]
+        metadatas = [metadatas[i] or {} for i in order]
+
+        table_dir = directory / name
+        table_dir.mkdir()
+        np.save(table_dir / IDS, np.array(ids, dtype=str))
+
+        columns = {}
+        for column in dict.fromkeys(key for metadata in metadatas for key in metadata):
+            values = [metadata.get(column) for metadata in metadatas]
+            kind = _column_kind(values)
+            np.save(table_dir / f"{column}.npy", _encode_column(values, kind, interner))
+            columns[column] = kind
+
+        version = (versions or {}).get(name)
+        manifest['tables'][name] = {
+            'count': len(ids),
+            'columns': columns,
+            'version': list(version) if version is not None else None,
+        }
+
+    encoded = [s.encode('utf-8') for s in interner.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    with open(directory / STRINGS, 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(directory / STRING_OFFSETS, offsets)
+    with open(directory / MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+class StringTable:
+    """Interned strings, decoded one at a time or all at once on demand"""
+
+    def __init__(self, directory):
+        size = (directory / STRINGS).stat().st_size
+        self._blob = np.memmap(directory / STRINGS, dtype=np.uint8, mode='r') if size else np.empty(0, np.uint8)
+        self._offsets = np.load(directory / STRING_OFFSETS, mmap_mode='r')
+        self._decoded = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code):
+        if self._decoded is not None:
+            return self._decoded[code]
+        return self._blob[self._offsets[code]:self._offsets[code + 1]].tobytes().decode('utf-8')
+
+    def decode_all(self):
+        """Every string as an object array (cached), for whole-column reads"""
+        if self._decoded is None:
+            blob = self._blob.tobytes()
+            offsets = self._offsets.tolist()
+            self._decoded = np.array(
+                [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)] + [None],
+                dtype=object
+            )
+        return self._decoded
+
+
+class RecordView(Sequence):
+    """Lazy list of metadata dicts for a sequence of table rows, decoded on access"""
+
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordView(self.table, self.rows[index])
+        return self.table.record(self.rows[index])
+
+
+class MetadataTable:
+    """One table of the store: ids sorted for binary search, one array per column"""
+
+    def __init__(self, directory, info, strings):
+        self.directory = Path(directory)
+        self.kinds = info['columns']
+        self.version = tuple(info['version']) if info.get('version') else None
+        self.strings = strings
+        self.ids = np.load(self.directory / IDS, mmap_mode='r')
+        self.columns = {
+            column: np.load(self.directory / f"{column}.npy", mmap_mode='r') for column in self.kinds
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_of(self, ids):
+        """Row of every id (-1 when absent), one vectorized binary search"""
+        ids = np.asarray(ids, dtype=str)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        rows = np.minimum(rows, len(self.ids) - 1)
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def _value(self, column, row):
+        value = self.columns[column][row]
+        kind = self.kinds[column]
+        if kind == 'str':
+            return None if value < 0 else self.strings[int(value)]
+        if kind == 'bool':
+            return None if value < 0 else bool(value)
+        if kind == 'int':
+            return None if value == INT_MISSING else int(value)
+        return None if np.isnan(value) else float(value)
+
+    def record(self, row):
+        """Metadata dict of one row, missing values left out like in Chroma"""
+        if row < 0:
+            return {}
+        record = {}
+        for column in self.kinds:
+            value = self._value(column, row)
+            if value is not None:
+                record[column] = value
+        return record
+
+    def get(self, record_id, default=None):
+        """Metadata dict for one record id"""
+        row = int(self.rows_of([record_id])[0])
+        return self.record(row) if row >= 0 else default
+
+    def records(self, ids):
+        """Lazy metadata dicts for ids, in the order given"""
+        return RecordView(self, self.rows_of(ids))
+
+    def column(self, column, ids=None):
+        """
+        Decoded column (strings as objects, nullable ints/bools as objects with
+        None, floats with NaN), for all rows in id order or for the given ids
+        """
+        rows = None if ids is None else self.rows_of(ids)
+        n = len(self.ids) if rows is None else len(rows)
+        kind = self.kinds.get(column)
+        if kind is None or not len(self.ids):
+            return np.full(n, None, dtype=object)
+
+        values = np.asarray(self.columns[column] if rows is None else self.columns[column][np.maximum(rows, 0)])
+        if kind == 'str':
+            # Code -1 (missing) indexes the trailing None of decode_all()
+            decoded = self.strings.decode_all()[values]
+        elif kind == 'float':
+            decoded = values.astype(np.float64)
+        else:
+            missing = values == (INT_MISSING if kind == 'int' else -1)
+            decoded = (values.astype(bool) if kind == 'bool' else values).astype(object)
+            decoded[missing] = None
+
+        if rows is not None and (rows < 0).any():
+            decoded = decoded.astype(object) if kind == 'float' else decoded
+            decoded[rows < 0] = None
+        return decoded
+
+    def frame(self, ids=None):
+        """All columns as a DataFrame, for all rows or for the given ids"""
+        import pandas as pd
+
+        return pd.DataFrame({column: self.column(column, ids) for column in self.kinds})
+
+
+class MetadataStore:
+    """Opened metadata store directory; see write_metadata_store for the layout"""
+
+    def __init__(self, directory):
+        # Every file is read from the one generation that is live right now
+        self.directory = resolve_artifact_dir(directory)
+        with open(self.directory / MANIFEST) as f:
+            self.manifest = json.load(f)
+        self.strings = StringTable(self.directory)
+        self.tables = {
+            name: MetadataTable(self.directory / name, info, self.strings)
+            for name, info in self.manifest['tables'].items()
+        }
+
+    @classmethod
+    def open(cls, directory=METADATA_STORE_DIR):
+        """The store in directory, or None when there is none (or it is unreadable)"""
+        if directory is None or not (resolve_artifact_dir(directory) / MANIFEST).exists():
+            return None
+        try:
+            return cls(directory)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def table(self, name):
+        return self.tables.get(name)
+
+    def table_for(self, name, collection):
+        """The named table if it was written for the collection as it is now, else None"""
+        table = self.tables.get(name)
+        if table is None or table.version != collection_version(collection):
+            return None
+        return table
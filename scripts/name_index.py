@@ -0,0 +1,184 @@
+"""
+Prebuilt name index for fast exact, prefix, substring and typo-tolerant lookup
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+import numpy as np
+
+# Postings read for the typo-tolerant pass, rarest trigrams first; trigrams
+# shared by a large part of the names add little to the shortlist but cost the most
+FUZZY_POSTINGS_BUDGET = 20000
+
+
+def _grams(text, n=3):
+    """Character n-grams of text (empty for text shorter than n)"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NameIndex:
+    """
+    Character trigram inverted index plus a sorted key array for prefix search.
+
+    Every lookup returns ranked candidates with a score in [0, 1]:
+    exact (1.0) > prefix > substring > name contained in query > fuzzy.
+    An exact hit is returned on its own, without running the other passes.
+    """
+
+    GRAM = 3
+
+    def __init__(self, names):
+        self.names = []
+        self.keys = []
+        self._exact = {}
+        self._max_key_length = 0
+
+        for name in names:
+            if not name:
+                continue
+            key = name.lower().strip()
+            if key in self._exact:
+                continue
+            self._exact[key] = len(self.keys)
+            self.names.append(name)
+            self.keys.append(key)
+            self._max_key_length = max(self._max_key_length, len(key))
+
+        # Sorted keys act as a flattened trie: all keys sharing a prefix are contiguous
+        order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+        self._sorted_keys = [self.keys[i] for i in order]
+        self._sorted_ids = order
+
+        # Plain trigrams answer substring queries, padded ones drive typo tolerance
+        self._postings = defaultdict(list)
+        self._padded_postings = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for gram in _grams(key, self.GRAM):
+                self._postings[gram].append(i)
+            for gram in _grams(f"  {key} ", self.GRAM):
+                self._padded_postings[gram].append(i)
+        # Sorted id arrays, so postings are intersected and counted in NumPy
+        self._postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in self._postings.items()}
+        self._padded_postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in self._padded_postings.items()}
+        self._key_lengths = np.fromiter(map(len, self.keys), dtype=np.int32, count=len(self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, query):
+        """Exact case-insensitive lookup, returns the stored name or None"""
+        i = self._exact.get(query.lower().strip())
+        return None if i is None else self.names[i]
+
+    def search(self, query, limit=5, fuzzy_cutoff=0.6):
+        """
+        Rank names against query
+        Returns: list of {'name', 'score', 'match'} dicts, best first; just the
+        exact match when there is one
+        """
+        q = query.lower().strip()
+        if not q:
+            return []
+
+        if q in self._exact:
+            return [{'name': self.names[self._exact[q]], 'score': 1.0, 'match': 'exact'}]
+
+        scored = {}
+
+        def add(i, score, match):
+            if i not in scored or scored[i][0] < score:
+                scored[i] = (score, match)
+
+        for i in self._prefix_ids(q):
+            add(i, 0.8 + 0.19 * len(q) / len(self.keys[i]), 'prefix')
+
+        for i in self._substring_ids(q):
+            add(i, 0.7 + 0.09 * len(q) / len(self.keys[i]), 'substring')
+
+        for i in self._contained_ids(q):
+            add(i, 0.6 + 0.09 * len(self.keys[i]) / len(q), 'contained')
+
+        if not scored:
+            for i, ratio in self._fuzzy_ids(q, limit, fuzzy_cutoff):
+                add(i, 0.6 * ratio, 'fuzzy')
+
+        ranked = sorted(scored.items(), key=lambda item: (-item[1][0], self.keys[item[0]]))
+        return [
+            {'name': self.names[i], 'score': round(score, 4), 'match': match}
+            for i, (score, match) in ranked[:limit]
+        ]
+
+    def _prefix_ids(self, q):
+        start = bisect_left(self._sorted_keys, q)
+        end = bisect_left(self._sorted_keys, q + '\uffff', lo=start)
+        return self._sorted_ids[start:end]
+
+    def _substring_ids(self, q):
+        if len(q) < self.GRAM:
+            return [i for i, key in enumerate(self.keys) if q in key]
+
+        postings = [self._postings.get(gram) for gram in _grams(q, self.GRAM)]
+        if any(plist is None for plist in postings):
+            return []
+        postings.sort(key=len)
+        candidates = postings[0]
+        for plist in postings[1:]:
+            candidates = np.intersect1d(candidates, plist, assume_unique=True)
+            if not len(candidates):
+                return []
+        return [i for i in candidates.tolist() if q in self.keys[i]]
+
+    def _contained_ids(self, q):
+        """
+        Names that appear inside the query starting at a word, e.g. 'aspirin' in
+        'aspirin tablets': each word-aligned piece of the query up to the longest
+        name is looked up directly, so the work depends on the query, not the index
+        """
+        ids = []
+        for start in range(len(q)):
+            if start and q[start - 1].isalnum():
+                continue
+            for stop in range(start + 1, min(start + self._max_key_length, len(q)) + 1):
+                i = self._exact.get(q[start:stop])
+                if i is not None and stop - start < len(q):
+                    ids.append(i)
+        return ids
+
+    def _fuzzy_ids(self, q, limit, cutoff):
+        q_grams = _grams(f"  {q} ", self.GRAM)
+        postings = sorted((p for p in map(self._padded_postings.get, q_grams) if p is not None), key=len)
+        read, budget = [], FUZZY_POSTINGS_BUDGET
+        for plist in postings:
+            # The two rarest trigrams are always read, so every query gets a shortlist
+            if len(read) >= 2 and len(plist) > budget:
+                break
+            budget -= len(plist)
+            read.append(plist)
+        if not read:
+            return []
+        counts = np.bincount(np.concatenate(read), minlength=len(self.keys))
+        ids = np.flatnonzero(counts)
+        overlap = counts[ids]
+
+        # Shortlist by trigram Dice coefficient, then rescore with difflib
+        dice = 2 * overlap / (len(q_grams) + self._key_lengths[ids] + 1)
+        size = max(limit * 2, 10)
+        if len(ids) > size:
+            best = np.argpartition(-dice, size - 1)[:size]
+            ids, dice = ids[best], dice[best]
+        shortlist = ids[np.argsort(-dice, kind='stable')].tolist()
+
+        matches = []
+        matcher = SequenceMatcher()
+        matcher.set_seq2(q)
+        for i in shortlist:
+            matcher.set_seq1(self.keys[i])
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+                matches.append((i, ratio))
+        matches.sort(key=lambda m: -m[1])
+        return matches[:limit]
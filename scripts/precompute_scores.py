@@ -0,0 +1,195 @@
+"""
+Offline stage: precompute drug x disease similarity scores and drug neighbor lists
+
+The drug and disease sets only change when the vector database is rebuilt, so
+all drug-anchored lookups can be materialized once and served as O(1) reads
+from memory-mapped .npy files. Re-run after every data refresh:
+
+    python scripts/precompute_scores.py
+"""
+
+import argparse
+import json
+from datetime import datetime
+
+import numpy as np
+
+from artifact_dir import publish_artifact_dir, resolve_artifact_dir
+from metadata_snapshot import collection_version
+from metadata_store import METADATA_STORE_DIR, MetadataStore
+from vector_backend import (
+    EMBEDDINGS_DIR, NAME_KEY, PROJECT_ROOT, VECTOR_DB_DIR,
+    load_embedding_matrix, open_collections, top_k_smallest
+)
+
+PRECOMPUTED_DIR = PROJECT_ROOT / "data" / "processed" / "precomputed"
+
+MANIFEST = "manifest.json"
+DRUG_DISEASE_DISTANCES = "drug_disease_distances.npy"
+DRUG_DISEASE_TOPK = "drug_disease_topk.npy"
+DRUG_NEIGHBORS = "drug_neighbors.npy"
+DRUG_NEIGHBOR_DISTANCES = "drug_neighbor_distances.npy"
+
+
+def build_score_matrix(drug_collection, disease_collection, out_dir=PRECOMPUTED_DIR,
+                       neighbors=50, disease_top_k=100, chunk_size=1024,
+                       embeddings_dir=EMBEDDINGS_DIR, metadata_store=None):
+    """
+    Compute and write:
+      - the full drug x disease distance matrix (float32)
+      - per drug, the disease indices ordered by distance (top disease_top_k)
+      - per drug, its `neighbors` nearest other drugs and their distances
+    Distances use each collection's own space, exactly as a live query would.
+    Record names come from metadata_store (metadata_store.py) when it is current.
+    The files are published as a whole (see artifact_dir.py), so a reader never
+    pairs the manifest of one build with the arrays of another.
+    """
+    # Taken before reading, so records written meanwhile leave the scores stale rather than mislabeled
+    versions = [list(collection_version(drug_collection)), list(collection_version(disease_collection))]
+
+    tables = {}
+    if metadata_store is not None:
+        tables = {"drugs": metadata_store.table_for("drugs", drug_collection),
+                  "diseases": metadata_store.table_for("diseases", disease_collection)}
+    drugs = load_embedding_matrix(drug_collection, "drugs", embeddings_dir, tables.get("drugs"))
+    diseases = load_embedding_matrix(disease_collection, "diseases", embeddings_dir, tables.get("diseases"))
+    n_drugs, n_diseases = len(drugs), len(diseases)
+    disease_top_k = min(disease_top_k, n_diseases)
+    neighbors = min(neighbors, max(n_drugs - 1, 0))
+
+    with publish_artifact_dir(out_dir) as staging:
+        return _write_scores(staging, drugs, diseases, versions, neighbors, disease_top_k, chunk_size)
+
+
+def _write_scores(staging, drugs, diseases, versions, neighbors, disease_top_k, chunk_size):
+    n_drugs, n_diseases = len(drugs), len(diseases)
+
+    def open_array(filename, dtype, shape):
+        return np.lib.format.open_memmap(staging / filename, mode='w+', dtype=dtype, shape=shape)
+
+    arrays = {
+        DRUG_DISEASE_DISTANCES: open_array(DRUG_DISEASE_DISTANCES, np.float32, (n_drugs, n_diseases)),
+        DRUG_DISEASE_TOPK: open_array(DRUG_DISEASE_TOPK, np.int32, (n_drugs, disease_top_k)),
+        DRUG_NEIGHBORS: open_array(DRUG_NEIGHBORS, np.int32, (n_drugs, neighbors)),
+        DRUG_NEIGHBOR_DISTANCES: open_array(DRUG_NEIGHBOR_DISTANCES, np.float32, (n_drugs, neighbors)),
+    }
+
+    for start in range(0, n_drugs, chunk_size):
+        stop = min(start + chunk_size, n_drugs)
+        rows = np.asarray(drugs.matrix[start:stop], dtype=np.float32)
+
+        disease_distances = diseases.distances(rows)
+        arrays[DRUG_DISEASE_DISTANCES][start:stop] = disease_distances
+        arrays[DRUG_DISEASE_TOPK][start:stop] = top_k_smallest(disease_distances, disease_top_k)[0]
+
+        # A drug is never its own neighbor
+        drug_distances = drugs.distances(rows)
+        drug_distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        indices, distances = top_k_smallest(drug_distances, neighbors)
+        arrays[DRUG_NEIGHBORS][start:stop] = indices
+        arrays[DRUG_NEIGHBOR_DISTANCES][start:stop] = distances
+
+    for array in arrays.values():
+        array.flush()
+    arrays.clear()
+
+    manifest = {
+        'created_at': datetime.now().isoformat(),
+        'drug_count': n_drugs,
+        'disease_count': n_diseases,
+        'versions': versions,
+        'neighbors': neighbors,
+        'disease_top_k': disease_top_k,
+        'drug_space': drugs.space,
+        'disease_space': diseases.space,
+        'drug_names': [m.get(NAME_KEY["drugs"], '') for m in drugs.metadatas],
+        'disease_names': [m.get(NAME_KEY["diseases"], '') for m in diseases.metadatas],
+    }
+    with open(staging / MANIFEST, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+class ScoreMatrix:
+    """Read-only, memory-mapped view of the precomputed drug-anchored scores"""
+
+    def __init__(self, directory=PRECOMPUTED_DIR):
+        self.directory = resolve_artifact_dir(directory)
+        with open(self.directory / MANIFEST) as f:
+            self.manifest = json.load(f)
+
+        self.drug_names = self.manifest['drug_names']
+        self.disease_names = self.manifest['disease_names']
+        self.drug_rows = {name: i for i, name in enumerate(self.drug_names)}
+
+        self.disease_distances = np.load(self.directory / DRUG_DISEASE_DISTANCES, mmap_mode='r')
+        self.disease_topk = np.load(self.directory / DRUG_DISEASE_TOPK, mmap_mode='r')
+        self.neighbors = np.load(self.directory / DRUG_NEIGHBORS, mmap_mode='r')
+        self.neighbor_distances = np.load(self.directory / DRUG_NEIGHBOR_DISTANCES, mmap_mode='r')
+
+    @classmethod
+    def load(cls, directory=PRECOMPUTED_DIR, versions=None):
+        """
+        The precomputed scores, or None when they are missing or out of date
+        versions: (drug, disease) collection_version the scores must have been built for
+        """
+        if not (resolve_artifact_dir(directory) / MANIFEST).exists():
+            return None
+
+        scores = cls(directory)
+        if versions is not None and scores.manifest.get('versions') != [list(version) for version in versions]:
+            return None
+        return scores
+
+    def diseases_for_drug(self, drug_name, top_k=10):
+        """
+        Closest diseases to a drug
+        Returns: list of (disease_name, distance), or None if the drug is not covered
+        """
+        row = self.drug_rows.get(drug_name)
+        if row is None:
+            return None
+
+        distances = self.disease_distances[row]
+        if top_k <= self.disease_topk.shape[1]:
+            order = self.disease_topk[row, :top_k]
+        else:
+            order = np.argsort(distances, kind='stable')[:top_k]
+        return [(self.disease_names[i], float(distances[i])) for i in order]
+
+    def similar_drugs(self, drug_name, top_k=10):
+        """
+        Closest other drugs to a drug
+        Returns: list of (drug_name, distance), or None if the drug is not covered
+        or more neighbors are requested than were precomputed
+        """
+        row = self.drug_rows.get(drug_name)
+        if row is None or top_k > self.neighbors.shape[1]:
+            return None
+
+        return [
+            (self.drug_names[i], float(d))
+            for i, d in zip(self.neighbors[row, :top_k], self.neighbor_distances[row, :top_k])
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    parser.add_argument("--out-dir", default=str(PRECOMPUTED_DIR), help="Where to write the score files")
+    parser.add_argument("--neighbors", type=int, default=50, help="Nearest drugs kept per drug")
+    parser.add_argument("--disease-top-k", type=int, default=100, help="Ranked diseases kept per drug")
+    args = parser.parse_args()
+
+    drug_collection, disease_collection = open_collections(args.db_path)
+    manifest = build_score_matrix(
+        drug_collection, disease_collection, args.out_dir,
+        neighbors=args.neighbors, disease_top_k=args.disease_top_k,
+        metadata_store=MetadataStore.open(METADATA_STORE_DIR)
+    )
+    print(f"Wrote {manifest['drug_count']} x {manifest['disease_count']} drug-disease scores "
+          f"and {manifest['neighbors']} neighbors per drug to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Quantized embedding codes for the 'quantized' search backend
+
+    python scripts/quantized_index.py                        # int8 codes for drugs and diseases
+    python scripts/quantized_index.py --method pq --subspaces 48
+
+A float32 row costs 4 bytes per dimension. int8 scalar quantization keeps one
+byte per dimension, mapped back through a per-dimension center and scale.
+Product quantization (PQ) splits a row into subspaces and keeps, per
+subspace, the byte id of the nearest of 256 k-means centroids: 48 bytes for
+a 384-dim row, 32x less than float32. Queries stay float32 and are scored
+against the codes directly (asymmetric distance). For int8 codes that is one
+matrix product with the scaled query. For PQ codes it is a sum of
+per-subspace lookup tables of query x centroid dot products. Row norms are
+kept exactly, so only the dot products are approximate. QuantizedMatrix
+(vector_backend.py) re-ranks the best candidates on the float32 rows.
+
+Files per target in data/processed/quantized/<prefix>: codes.npy,
+quantizer.npz (center and scale, or codebooks, plus the row norms) and
+manifest.json, published together as one generation (see artifact_dir.py)
+so codes are never read with another build's quantizer. The codes are
+rebuilt on first use when the embedding matrix they came from changed. Codes
+written flat into data/processed/quantized by older versions are not read
+and are rebuilt the same way.
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from artifact_dir import publish_artifact_dir, resolve_artifact_dir
+from vector_backend import (
+    ARTIFACT_PREFIX, EMBEDDINGS_DIR, QUANTIZED_DIR, TARGETS, VECTOR_DB_DIR,
+    distances_from_dots, load_embedding_matrix, open_collections
+)
+
+METHODS = ("int8", "pq")
+# Bytes per row for PQ; must divide the embedding dimension (384 = 48 x 8)
+PQ_SUBSPACES = 48
+PQ_CENTROIDS = 256
+PQ_TRAIN_ROWS = 32768
+PQ_ITERATIONS = 15
+# Candidates re-ranked on the float32 rows per requested result
+RERANK_FACTOR = 20
+# Rows decoded or scored per block, bounds the temporary (block, dim) arrays
+CHUNK_ROWS = 16384
+# int8 rows converted to float32 at a time for scoring; small enough for the copy to stay in cache
+DECODE_ROWS = 1024
+
+MANIFEST = "manifest.json"
+CODES = "codes.npy"
+QUANTIZER = "quantizer.npz"
+
+
+class ScalarQuantizer:
+    """One int8 per dimension: row ~= center + scale * code"""
+
+    method = "int8"
+
+    def __init__(self, center, scale):
+        self.center = np.asarray(center, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, matrix):
+        low = np.full(matrix.shape[1], np.inf, dtype=np.float32)
+        high = np.full(matrix.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, len(matrix), CHUNK_ROWS):
+            block = np.asarray(matrix[start:start + CHUNK_ROWS], dtype=np.float32)
+            low = np.minimum(low, block.min(axis=0))
+            high = np.maximum(high, block.max(axis=0))
+        if not len(matrix):
+            low = high = np.zeros(matrix.shape[1], dtype=np.float32)
+        return cls((low + high) / 2, np.maximum((high - low) / 254, 1e-12))
+
+    def encode(self, rows):
+        codes = np.rint((np.asarray(rows, dtype=np.float32) - self.center) / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def dots(self, queries, codes):
+        """(queries, rows) approximate dot products of float queries with coded rows"""
+        # Converting a whole block with astype allocated and streamed a (block, dim)
+        # float32 copy per call, which made int8 slower than the float32 matrix.
+        # Small slices through one reused buffer keep the conversion in cache.
+        scaled = (queries * self.scale).T
+        dots = np.empty((len(codes), len(queries)), dtype=np.float32)
+        buffer = np.empty((min(len(codes), DECODE_ROWS), codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), DECODE_ROWS):
+            block = codes[start:start + DECODE_ROWS]
+            decoded = buffer[:len(block)]
+            np.copyto(decoded, block, casting='unsafe')
+            np.matmul(decoded, scaled, out=dots[start:start + len(block)])
+        return dots.T + (queries @ self.center)[:, None]
+
+    def arrays(self):
+        return {'center': self.center, 'scale': self.scale}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['center'], arrays['scale'])
+
+
+def _nearest_centroids(points, centroids):
+    """Index of the closest centroid (Euclidean) for every point"""
+    scores = np.einsum('ij,ij->i', centroids, centroids)[None, :] - 2.0 * (points @ centroids.T)
+    return scores.argmin(axis=1)
+
+
+def _kmeans(points, n_clusters, iterations, rng):
+    """Lloyd's k-means, empty clusters are re-seeded with random points"""
+    centroids = points[rng.choice(len(points), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest_centroids(points, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.stack(
+            [np.bincount(labels, weights=points[:, d], minlength=n_clusters) for d in range(points.shape[1])], axis=1
+        )
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids
+
+
+class ProductQuantizer:
+    """One uint8 centroid id per subspace: row ~= concatenation of the subspace centroids"""
+
+    method = "pq"
+
+    def __init__(self, codebooks):
+        # (subspaces, centroids, subspace dims)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+
+    @property
+    def subspaces(self):
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def fit(cls, matrix, subspaces=PQ_SUBSPACES, iterations=PQ_ITERATIONS, train_rows=PQ_TRAIN_ROWS, seed=0):
+        dim = matrix.shape[1]
+        if dim % subspaces:
+            raise ValueError(f"PQ subspaces ({subspaces}) must divide the embedding dimension ({dim})")
+        rng = np.random.default_rng(seed)
+        sample = np.arange(len(matrix))
+        if len(sample) > train_rows:
+            sample = np.sort(rng.choice(len(matrix), train_rows, replace=False))
+        train = np.asarray(matrix[sample], dtype=np.float32).reshape(len(sample), subspaces, dim // subspaces)
+        # Fewer centroids than PQ_CENTROIDS only for matrices with fewer rows
+        n_clusters = max(min(PQ_CENTROIDS, len(sample)), 1)
+        codebooks = np.zeros((subspaces, n_clusters, dim // subspaces), dtype=np.float32)
+        if len(sample):
+            for j in range(subspaces):
+                codebooks[j] = _kmeans(train[:, j], n_clusters, iterations, rng)
+        return cls(codebooks)
+
+    def encode(self, rows):
+        rows = np.asarray(rows, dtype=np.float32).reshape(len(rows), self.subspaces, -1)
+        codes = np.empty((len(rows), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            codes[:, j] = _nearest_centroids(rows[:, j], self.codebooks[j])
+        return codes
+
+    def dots(self, queries, codes):
+        """(queries, rows) approximate dot products of float queries with coded rows"""
+        # Per query and subspace, the dot product with each centroid
+        tables = np.einsum('qsd,scd->qsc', queries.reshape(len(queries), self.subspaces, -1), self.codebooks)
+        dots = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.subspaces):
+            dots += tables[:, j, codes[:, j]]
+        return dots
+
+    def arrays(self):
+        return {'codebooks': self.codebooks}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['codebooks'])
+
+
+QUANTIZERS = {ScalarQuantizer.method: ScalarQuantizer, ProductQuantizer.method: ProductQuantizer}
+
+
+def index_config(method, subspaces=PQ_SUBSPACES):
+    """What a persisted index must match to be reused"""
+    if method not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization '{method}', expected one of {sorted(QUANTIZERS)}")
+    return {'method': method, 'subspaces': subspaces} if method == "pq" else {'method': method}
+
+
+def source_signature(matrix):
+    """Identity of the float rows the codes were built from: shape, plus file size and mtime when memory-mapped"""
+    signature = {'rows': int(matrix.shape[0]), 'dim': int(matrix.shape[1])}
+    filename = getattr(matrix, 'filename', None)
+    if filename:
+        stat = os.stat(filename)
+        signature.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return signature
+
+
+def index_dir(directory, prefix):
+    """Directory holding the live generation of prefix's codes under directory"""
+    return resolve_artifact_dir(Path(directory) / prefix)
+
+
+class QuantizedIndex:
+    """Codes and exact squared norms of every row, scored against float queries"""
+
+    def __init__(self, quantizer, codes, sq_norms, manifest=None):
+        self.quantizer = quantizer
+        self.codes = codes
+        self.sq_norms = np.asarray(sq_norms, dtype=np.float32)
+        self.manifest = manifest or {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def config(self):
+        subspaces = getattr(self.quantizer, 'subspaces', PQ_SUBSPACES)
+        return index_config(self.quantizer.method, subspaces)
+
+    @property
+    def nbytes(self):
+        """Bytes held per process: the codes, the norms and the quantizer's tables"""
+        return int(self.codes.nbytes + self.sq_norms.nbytes + sum(a.nbytes for a in self.quantizer.arrays().values()))
+
+    @classmethod
+    def build(cls, matrix, method="int8", subspaces=PQ_SUBSPACES, seed=0):
+        """Quantize a (rows, dim) float matrix (array or memmap), block by block"""
+        if method == "pq":
+            quantizer = ProductQuantizer.fit(matrix, subspaces, seed=seed)
+        else:
+            index_config(method)
+            quantizer = ScalarQuantizer.fit(matrix)
+        width = quantizer.subspaces if method == "pq" else matrix.shape[1]
+        codes = np.empty((len(matrix), width), dtype=np.uint8 if method == "pq" else np.int8)
+        sq_norms = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), CHUNK_ROWS):
+            block = np.asarray(matrix[start:start + CHUNK_ROWS], dtype=np.float32)
+            codes[start:start + len(block)] = quantizer.encode(block)
+            sq_norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+        return cls(quantizer, codes, sq_norms)
+
+    def save(self, directory, prefix, source=None):
+        """Publish the codes, quantizer and manifest as one generation of directory/prefix"""
+        self.manifest = {
+            'created_at': datetime.now().isoformat(),
+            'config': self.config,
+            'count': len(self),
+            'bytes': self.nbytes,
+            'source': source,
+        }
+        with publish_artifact_dir(Path(directory) / prefix) as staging:
+            np.save(staging / CODES, self.codes)
+            np.savez(staging / QUANTIZER, sq_norms=self.sq_norms, **self.quantizer.arrays())
+            with open(staging / MANIFEST, 'w') as f:
+                json.dump(self.manifest, f, indent=2)
+        return self.manifest
+
+    @classmethod
+    def load(cls, directory, prefix):
+        """The persisted index, or None when it is missing"""
+        directory = index_dir(directory, prefix)
+        if not (directory / MANIFEST).exists():
+            return None
+        with open(directory / MANIFEST) as f:
+            manifest = json.load(f)
+        with np.load(directory / QUANTIZER) as arrays:
+            arrays = dict(arrays)
+        quantizer = QUANTIZERS[manifest['config']['method']].from_arrays(arrays)
+        # Loaded into memory: the codes are what the backend scores on every query
+        codes = np.load(directory / CODES)
+        return cls(quantizer, codes, arrays['sq_norms'], manifest)
+
+    def approximate_distances(self, queries, space, rows):
+        """(queries, rows) distances in a Chroma space from the codes of rows (a slice or index array)"""
+        sq_norms = self.sq_norms[rows]
+        dots = self.quantizer.dots(queries, self.codes[rows])
+        return distances_from_dots(dots, queries, space, sq_norms, np.sqrt(sq_norms))
+
+    def candidates(self, queries, n, space, rows=None):
+        """
+        Per query, the n rows (of rows, default all) with the smallest
+        approximate distances, unordered; scored block by block
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        total = len(self) if rows is None else len(rows)
+        n = min(n, total)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best = np.empty((len(queries), 0), dtype=np.float32)
+        if n <= 0:
+            return best_rows
+
+        for start in range(0, total, CHUNK_ROWS):
+            block = slice(start, min(start + CHUNK_ROWS, total)) if rows is None else rows[start:start + CHUNK_ROWS]
+            block_rows = np.arange(block.start, block.stop) if rows is None else block
+            merged = np.concatenate([best, self.approximate_distances(queries, space, block)], axis=1)
+            merged_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, (len(queries), len(block_rows)))], axis=1)
+            if merged.shape[1] > n:
+                keep = np.argpartition(merged, n - 1, axis=1)[:, :n]
+                merged = np.take_along_axis(merged, keep, axis=1)
+                merged_rows = np.take_along_axis(merged_rows, keep, axis=1)
+            best, best_rows = merged, merged_rows
+        return best_rows
+
+
+def load_or_build_index(directory, prefix, matrix, method="int8", subspaces=PQ_SUBSPACES):
+    """The persisted index for matrix, rebuilt (and saved) when missing, stale or of another config"""
+    signature = source_signature(matrix)
+    index = QuantizedIndex.load(directory, prefix)
+    if index is not None and index.manifest.get('source') == signature \
+            and index.manifest.get('config') == index_config(method, subspaces):
+        return index
+    index = QuantizedIndex.build(matrix, method, subspaces)
+    index.save(directory, prefix, source=signature)
+    return index
+
+
+def refresh_index(directory, prefix, matrix):
+    """Rebuild a persisted index with its own config after matrix changed; None when there is none"""
+    index = QuantizedIndex.load(directory, prefix)
+    if index is None:
+        return None
+    config = index.manifest['config']
+    return load_or_build_index(directory, prefix, matrix, config['method'], config.get('subspaces', PQ_SUBSPACES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    parser.add_argument("--embeddings-dir", default=str(EMBEDDINGS_DIR), help="Float32 matrices (exported if missing)")
+    parser.add_argument("--out-dir", default=str(QUANTIZED_DIR), help="Where to write the codes")
+    parser.add_argument("--method", default="int8", choices=METHODS)
+    parser.add_argument("--subspaces", type=int, default=PQ_SUBSPACES, help="PQ bytes per row")
+    args = parser.parse_args()
+
+    collections = dict(zip(TARGETS, open_collections(args.db_path)))
+    for target, collection in collections.items():
+        start = time.perf_counter()
+        matrix = load_embedding_matrix(collection, target, args.embeddings_dir).matrix
+        index = QuantizedIndex.build(matrix, args.method, args.subspaces)
+        index.save(args.out_dir, ARTIFACT_PREFIX[target], source=source_signature(matrix))
+        print(f"{target}: {len(index)} rows, {index.nbytes / len(index) if len(index) else 0:.0f} bytes/row "
+              f"(float32: {matrix.shape[1] * 4}), built in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
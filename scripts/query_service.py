@@ -0,0 +1,422 @@
+"""
+Headless HTTP query service around one shared SmartSearch instance
+
+    python scripts/query_service.py --port 8080 --backend numpy
+    python scripts/query_service.py --port 8080 --backend quantized --quantization pq
+    python scripts/query_service.py --port 8080 --backend numpy --snapshots
+
+Endpoints (GET, JSON responses):
+    /drugs-for-disease?q=<text>&k=10[&bbb=true&lipinski=true&mw_min=&mw_max=&min_trials=]
+                      [&mode=hybrid&fusion=rrf|weighted]
+    /diseases-for-drug?drug=<name>&k=10
+    /similar-drugs?drug=<name>&k=10[&structural=0.5]
+    /resolve?q=<text>&type=drug|disease&limit=10
+    /keyword-search?q=<text>&type=drug|disease&k=10
+    /health
+    /metrics          (Prometheus text format, ?format=json for JSON)
+and POST /drugs-for-disease/batch with {"queries": [...], "k": 10, "filters": {...}},
+where "filters" takes the same property filters as the query string.
+
+Blocking vector work runs on a bounded thread pool. Identical concurrent
+requests share one computation, and once max_pending requests are in
+flight new ones are rejected with 503 so callers back off. With --snapshots
+the active index snapshot is served (see snapshots.py), and a newly activated
+one is loaded in the background and swapped in; requests already running
+finish on the old one.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+from drug_filters import DrugFilter
+from instrumentation import metrics
+from search_utils import SmartSearch
+from snapshots import SNAPSHOTS_DIR, WATCH_INTERVAL, SnapshotWatcher
+from vector_backend import VECTOR_DB_DIR, open_collections
+
+MAX_BODY_BYTES = 1 << 20
+MAX_TOP_K = 100
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.payload = {'error': message, **extra}
+
+
+class QueryService:
+    """Maps HTTP requests onto SmartSearch calls"""
+
+    def __init__(self, smart_search, max_workers=8, max_pending=256, watcher=None):
+        self.smart_search = smart_search
+        self.watcher = watcher
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smart-search")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/drugs-for-disease'): self.drugs_for_disease,
+            ('GET', '/diseases-for-drug'): self.diseases_for_drug,
+            ('GET', '/similar-drugs'): self.similar_drugs,
+            ('GET', '/resolve'): self.resolve,
+            ('GET', '/keyword-search'): self.keyword_search,
+            ('GET', '/metrics'): self.export_metrics,
+            ('POST', '/drugs-for-disease/batch'): self.drugs_for_disease_batch,
+        }
+
+    async def run_blocking(self, key, func, *args):
+        """
+        Run func(*args) on the executor; concurrent calls with the same key
+        await the same result instead of computing it again
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, "Too many requests in flight, retry later")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        self._inflight[key] = future
+        self.pending += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.pending -= 1
+            self._inflight.pop(key, None)
+
+    # --- endpoints -------------------------------------------------------
+
+    async def health(self, params, body):
+        return {
+            'status': 'ok',
+            'backend': self.smart_search.backend.name,
+            'drugs': len(self.smart_search.drug_names),
+            'diseases': len(self.smart_search.disease_names),
+            'pending': self.pending,
+            'coalesced': self.coalesced,
+            'result_cache': self.smart_search.result_cache.stats(),
+            'embedding_cache': self.smart_search.embedding_cache.stats(),
+            'snapshot': self.watcher.snapshot.version if self.watcher else None,
+        }
+
+    async def export_metrics(self, params, body):
+        if params.get('format') == 'json':
+            return metrics.snapshot()
+        # A str payload is sent as-is in the Prometheus text format
+        return metrics.prometheus_text()
+
+    async def drugs_for_disease(self, params, body):
+        query = _required(params, 'q')
+        top_k = _top_k(params)
+        filters = _drug_filter(params)
+        mode = params.get('mode', 'semantic')
+        if mode == 'hybrid':
+            fusion = params.get('fusion', 'rrf')
+            if fusion not in ('rrf', 'weighted'):
+                raise HTTPError(400, "'fusion' must be 'rrf' or 'weighted'")
+            results = await self.run_blocking(
+                ('drugs_for_disease_hybrid', query, top_k, filters, fusion),
+                partial(self.smart_search.search_drugs_hybrid, filters=filters, fusion=fusion), query, top_k
+            )
+        elif mode == 'semantic':
+            results = await self.run_blocking(
+                ('drugs_for_disease', query, top_k, filters), self.smart_search.search_drugs_fuzzy, query, top_k, filters
+            )
+        else:
+            raise HTTPError(400, "'mode' must be 'semantic' or 'hybrid'")
+        return {'query': query, 'mode': mode, 'filters': filters.cache_key(), 'results': results}
+
+    async def drugs_for_disease_batch(self, params, body):
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        queries = payload.get('queries') if isinstance(payload, dict) else None
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise HTTPError(400, "'queries' must be a list of strings")
+        top_k = _top_k({'k': payload.get('k', 10)})
+        if not isinstance(payload.get('filters', {}), dict):
+            raise HTTPError(400, "'filters' must be an object")
+        filters = _drug_filter(payload.get('filters', {}))
+
+        results = await self.run_blocking(
+            ('drugs_for_disease_batch', tuple(queries), top_k, filters),
+            partial(self.smart_search.search_drugs_batch, filters=filters), queries, top_k
+        )
+        return {'results': [{'query': q, 'results': r} for q, r in zip(queries, results)]}
+
+    async def diseases_for_drug(self, params, body):
+        drug_name = self._resolve_drug(_required(params, 'drug'))
+        top_k = _top_k(params)
+        results = await self.run_blocking(
+            ('diseases_for_drug', drug_name, top_k), self.smart_search.diseases_for_drug, drug_name, top_k
+        )
+        return {'drug': drug_name, 'results': results}
+
+    async def similar_drugs(self, params, body):
+        drug_name = self._resolve_drug(_required(params, 'drug'))
+        top_k = _top_k(params)
+        structural = _number(params, 'structural') or 0.0
+        if not 0.0 <= structural <= 1.0:
+            raise HTTPError(400, "'structural' must be between 0 and 1")
+        results = await self.run_blocking(
+            ('similar_drugs', drug_name, top_k, structural), self.smart_search.similar_drugs, drug_name, top_k, structural
+        )
+        return {'drug': drug_name, 'structural_weight': structural, 'results': results}
+
+    async def resolve(self, params, body):
+        query = _required(params, 'q')
+        kind = params.get('type', 'drug')
+        limit = _top_k({'k': params.get('limit', 10)})
+        if kind == 'drug':
+            candidates = self.smart_search.rank_drugs(query, limit=limit)
+        elif kind == 'disease':
+            candidates = self.smart_search.rank_diseases(query, limit=limit)
+        else:
+            raise HTTPError(400, "'type' must be 'drug' or 'disease'")
+        return {'query': query, 'type': kind, 'candidates': candidates}
+
+    async def keyword_search(self, params, body):
+        query = _required(params, 'q')
+        kind = params.get('type', 'drug')
+        if kind not in ('drug', 'disease'):
+            raise HTTPError(400, "'type' must be 'drug' or 'disease'")
+        top_k = _top_k(params)
+        target = "drugs" if kind == 'drug' else "diseases"
+        results = await self.run_blocking(
+            ('keyword_search', target, query, top_k), self.smart_search.lexical_search, target, query, top_k
+        )
+        return {'query': query, 'type': kind, 'results': results}
+
+    def _resolve_drug(self, query):
+        exact_match, suggestions = self.smart_search.find_drug(query)
+        if exact_match is None:
+            raise HTTPError(404, f"Drug '{query}' not found", suggestions=suggestions)
+        return exact_match
+
+    # --- HTTP ------------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                url = urlsplit(target)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                handler = self.routes.get((method, url.path))
+                started = time.perf_counter()
+
+                try:
+                    if handler is None:
+                        if any(path == url.path for _, path in self.routes):
+                            raise HTTPError(405, f"{method} not allowed on {url.path}")
+                        raise HTTPError(404, f"Unknown endpoint {url.path}")
+                    status, payload = 200, await handler(params, body)
+                except HTTPError as e:
+                    status, payload = e.status, e.payload
+                except Exception:
+                    # Details go to the server log, not to the client
+                    logger.exception("%s %s failed", method, url.path)
+                    status, payload = 500, {'error': "Internal server error"}
+
+                endpoint = url.path if handler is not None else 'unknown'
+                metrics.count("http_requests_total", endpoint=endpoint, status=status)
+                metrics.observe("http_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            writer.write(_response(e.status, e.payload, keep_alive=False))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"SmartSearch query service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def _required(params, name):
+    value = params.get(name, '').strip()
+    if not value:
+        raise HTTPError(400, f"Missing query parameter '{name}'")
+    return value
+
+
+def _top_k(params):
+    try:
+        top_k = int(params.get('k', 10))
+    except (TypeError, ValueError):
+        raise HTTPError(400, "'k' must be an integer")
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise HTTPError(400, f"'k' must be between 1 and {MAX_TOP_K}")
+    return top_k
+
+
+def _flag(params, name):
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes'):
+        return True
+    if text in ('0', 'false', 'no'):
+        return False
+    raise HTTPError(400, f"'{name}' must be true or false")
+
+
+def _number(params, name, cast=float):
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{name}' must be a number")
+
+
+def _drug_filter(params):
+    """DrugFilter from bbb, lipinski, mw_min, mw_max and min_trials parameters"""
+    return DrugFilter(
+        bbb_permeable=_flag(params, 'bbb'),
+        passes_lipinski=_flag(params, 'lipinski'),
+        min_molecular_weight=_number(params, 'mw_min'),
+        max_molecular_weight=_number(params, 'mw_max'),
+        min_clinical_trials=_number(params, 'min_trials', int),
+    )
+
+
+async def _read_line(reader):
+    """One request or header line; lines longer than the stream limit are rejected with 413"""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise HTTPError(413, "Request line or header too long")
+
+
+async def _read_request(reader):
+    """Parse one HTTP/1.1 request, None when the client closed the connection"""
+    request_line = await _read_line(reader)
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await _read_line(reader)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be an integer")
+    if length < 0:
+        raise HTTPError(400, "Content-Length must not be negative")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+def _response(status, payload, keep_alive=True):
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), PROMETHEUS_CONTENT_TYPE
+    else:
+        body, content_type = json.dumps(payload).encode(), "application/json"
+    head = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        head.append("Retry-After: 1")
+    return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy", "quantized"])
+    parser.add_argument("--quantization", default="int8", choices=["int8", "pq"], help="Codes of --backend quantized")
+    parser.add_argument("--workers", type=int, default=8, help="Threads for blocking vector work")
+    parser.add_argument("--max-pending", type=int, default=256, help="In-flight requests before answering 503")
+    parser.add_argument("--snapshots", nargs="?", const=str(SNAPSHOTS_DIR), metavar="DIR",
+                        help="Serve the active index snapshot instead of --db-path and hot-swap newer ones")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_INTERVAL, help="Seconds between snapshot checks")
+    args = parser.parse_args()
+
+    backend_options = {'quantization': args.quantization} if args.backend == "quantized" else {}
+    if args.snapshots:
+        def open_snapshot(snapshot):
+            drug_collection, disease_collection = open_collections(snapshot.vector_db)
+            return SmartSearch(drug_collection, disease_collection, backend=args.backend,
+                               **backend_options, **snapshot.search_options(args.backend))
+
+        watcher = SnapshotWatcher(
+            open_snapshot, root=args.snapshots, interval=args.watch_interval,
+            warm_up=lambda smart_search: smart_search.warm_up(),
+            on_swap=lambda smart_search: setattr(service, 'smart_search', smart_search)
+        )
+        service = QueryService(watcher.result(), max_workers=args.workers, max_pending=args.max_pending,
+                               watcher=watcher)
+    else:
+        drug_collection, disease_collection = open_collections(args.db_path)
+        smart_search = SmartSearch(drug_collection, disease_collection, backend=args.backend, **backend_options)
+        service = QueryService(smart_search, max_workers=args.workers, max_pending=args.max_pending)
+        # Load the embedding model and lazy indexes while the server starts accepting requests
+        threading.Thread(target=smart_search.warm_up, name="warm-up", daemon=True).start()
+
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
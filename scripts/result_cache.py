@@ -0,0 +1,78 @@
+"""
+Thread-safe result cache for SmartSearch queries, shared by every session in the process
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from embedding_cache import normalize_query
+
+
+class ResultCache:
+    """
+    TTL + size-bounded LRU cache of ranked result lists
+
+    Entries are keyed on (operation, normalized query) and remember the top_k they
+    were computed for, so a cached top-20 also answers top-5 and top-10 by slicing.
+    """
+
+    def __init__(self, maxsize=1024, ttl=600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(operation, query):
+        return operation, normalize_query(query)
+
+    def get(self, operation, query, top_k):
+        """Cached results for at least top_k, sliced to top_k, or None"""
+        key = self._key(operation, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                computed_k, results, expires = entry
+                if expires <= self.clock():
+                    del self._entries[key]
+                # A shorter list than computed_k means the collection was exhausted
+                elif computed_k >= top_k or len(results) < computed_k:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return results[:top_k]
+            self.misses += 1
+            return None
+
+    def put(self, operation, query, top_k, results):
+        """Store results computed for top_k, unless a live entry already covers more"""
+        key = self._key(operation, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > top_k and entry[2] > self.clock():
+                return
+            self._entries[key] = (top_k, list(results), self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
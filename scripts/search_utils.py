@@ -2,95 +2,719 @@
 Utility functions for intelligent search
 """
 
-from difflib import get_close_matches
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import threading
+import time
+import numpy as np
+from disease_profiles import DISEASE_PROFILES_DIR, PROFILE_MODES, load_disease_profiles
+from embedding_cache import EmbeddingCache, model_identity
+from fingerprint_index import FINGERPRINT_INDEX_DIR, FingerprintIndex
+from instrumentation import metrics
+from lexical_index import LEXICAL_INDEX_DIR, load_lexical_index
+from metadata_snapshot import MetadataSnapshot, collection_version
+from metadata_store import METADATA_STORE_DIR, MetadataStore
+from name_index import NameIndex
+from precompute_scores import PRECOMPUTED_DIR, ScoreMatrix
+from result_cache import ResultCache
+from vector_backend import collection_space, make_backend, pairwise_distances
 import re
 
-class SmartSearch:
-    def __init__(self, drug_collection, disease_collection):
+# Reciprocal rank fusion constant and candidates taken from each list for hybrid search
+RRF_K = 60
+HYBRID_DEPTH = 50
+# Keyword hits below this fraction of the best one only share near-ubiquitous
+# terms with the query (e.g. InChIKey blocks) and would just add noise to the fusion
+LEXICAL_MIN_RELATIVE_SCORE = 0.1
+
+class _SearchState:
+    """
+    What SmartSearch serves from for one version of the collections: names and
+    name indexes, metadata, the backend and the precomputed artifacts
+    
+    A refresh builds a new state and swaps it in with one reference
+    assignment, so a search that took the old state finishes on it with
+    consistent names, rows and metadata. Only what is opened on first use
+    (drug embeddings, keyword indexes, disease profiles) is filled in later.
+    """
+    
+    def __init__(self, version, drug_collection, disease_collection, metadata_store, backend,
+                 scores_dir, fingerprint_index_dir):
+        self.version = version
+        self.metadata_store = metadata_store
+        self.backend = backend
         self.drug_collection = drug_collection
         self.disease_collection = disease_collection
         
-        self._cache_names()
-    
-    def _cache_names(self):
-        """Cache all drug and disease names for fuzzy matching"""
-   
-        all_drugs = self.drug_collection.get(include=["metadatas"])
-        self.drug_names = [m.get('drug_name', '') for m in all_drugs['metadatas']]
+        # A current metadata store replaces the collections' metadata; its
+        # records are decoded lazily, only names are read up front
+        store = metadata_store
+        self.drug_table = store.table_for("drugs", drug_collection) if store else None
+        self.disease_table = store.table_for("diseases", disease_collection) if store else None
+        
+        metrics.count("collection_calls_total", call="get", target="drugs")
+        metrics.count("collection_calls_total", call="get", target="diseases")
+        if self.drug_table is not None:
+            all_drugs = drug_collection.get(include=[])
+            self.drug_metadatas = self.drug_table.records(all_drugs['ids'])
+            self.drug_names = [name or '' for name in self.drug_table.column('drug_name', all_drugs['ids'])]
+        else:
+            all_drugs = drug_collection.get(include=["metadatas"])
+            self.drug_metadatas = all_drugs['metadatas']
+            self.drug_names = [m.get('drug_name', '') for m in all_drugs['metadatas']]
+        self.drug_ids = list(all_drugs['ids'])
+        self.drug_rows_by_id = {record_id: i for i, record_id in enumerate(self.drug_ids)}
+        self.drug_rows = {name: i for i, name in enumerate(self.drug_names)}
         self.drug_names_lower = {name.lower(): name for name in self.drug_names}
+        self.drug_index = NameIndex(self.drug_names)
         
-       
-        all_diseases = self.disease_collection.get(include=["metadatas"])
-        self.disease_names = [m.get('disease_name', '') for m in all_diseases['metadatas']]
+        if self.disease_table is not None:
+            all_diseases = disease_collection.get(include=[])
+            self.disease_metadatas = self.disease_table.records(all_diseases['ids'])
+            self.disease_names = [name or '' for name in self.disease_table.column('disease_name', all_diseases['ids'])]
+        else:
+            all_diseases = disease_collection.get(include=["metadatas"])
+            self.disease_metadatas = all_diseases['metadatas']
+            self.disease_names = [m.get('disease_name', '') for m in all_diseases['metadatas']]
+        self.disease_ids = list(all_diseases['ids'])
+        self.disease_rows_by_id = {record_id: i for i, record_id in enumerate(self.disease_ids)}
+        self.disease_rows = {name: i for i, name in enumerate(self.disease_names)}
         self.disease_names_lower = {name.lower(): name for name in self.disease_names}
+        self.disease_index = NameIndex(self.disease_names)
+        
+        self.scores = ScoreMatrix.load(scores_dir, version)
+        self.fingerprints = FingerprintIndex.load(fingerprint_index_dir)
+        self.lexical_indexes = {}
+        self.disease_profiles = None
+        self._drug_embeddings = None
+        self._lock = threading.Lock()
     
-    def find_drug(self, query):
+    @property
+    def drug_embeddings(self):
         """
-        Find drug with fuzzy matching and case-insensitive search
-        Returns: (exact_match, suggested_names)
+        Stored drug embeddings, row-aligned with drug_ids; fetched on first use so
+        startup only reads ids and names, and drug-anchored searches need no
+        metadata-filtered get(). The in-process backends' memory-mapped matrix is
+        reused when its rows line up, instead of holding a second float copy.
         """
-        query_lower = query.lower().strip()
+        if self._drug_embeddings is None:
+            with self._lock:
+                matrices = getattr(self.backend, 'matrices', None)
+                if self._drug_embeddings is None and matrices and matrices['drugs'].ids == self.drug_ids:
+                    self._drug_embeddings = matrices['drugs'].matrix
+                if self._drug_embeddings is None:
+                    metrics.count("collection_calls_total", call="get", target="drugs")
+                    records = self.drug_collection.get(include=["embeddings"])
+                    matrix = np.asarray(records['embeddings'], dtype=np.float32)
+                    if list(records['ids']) != self.drug_ids:
+                        positions = {record_id: i for i, record_id in enumerate(records['ids'])}
+                        matrix = matrix[[positions[record_id] for record_id in self.drug_ids]]
+                    self._drug_embeddings = matrix
+        return self._drug_embeddings
+
+
+class SmartSearch:
+    def __init__(self, drug_collection, disease_collection, backend="chroma",
+                 scores_dir=PRECOMPUTED_DIR, embedding_cache_size=4096,
+                 embedding_cache_path=None, result_cache_size=1024, result_cache_ttl=600,
+                 version_check_interval=5.0, metadata_store_dir=METADATA_STORE_DIR,
+                 lexical_index_dir=LEXICAL_INDEX_DIR, fingerprint_index_dir=FINGERPRINT_INDEX_DIR,
+                 disease_profiles_dir=DISEASE_PROFILES_DIR, disease_profile_mode="centroid",
+                 **backend_options):
+        """
+        backend: 'chroma' queries the collections directly, 'numpy' searches the
+        persisted embedding matrices in-process (see vector_backend.py)
+        scores_dir: output of precompute_scores.py, used for drug-anchored lookups when current
+        embedding_cache_size / embedding_cache_path: LRU bound and optional .npz file
+        for the query embedding cache
+        result_cache_size / result_cache_ttl: bounds of the shared search result cache
+        version_check_interval: seconds between checks for changed collections
+        metadata_store_dir: metadata store written by ingest.py, read instead of
+        collection metadata while it matches the collections (None disables it)
+        lexical_index_dir: BM25 indexes (lexical_index.py), built there on first use if missing or stale
+        fingerprint_index_dir: Morgan fingerprint index (fingerprint_index.py) for structural similarity
+        disease_profiles_dir: precomputed disease profile vectors (disease_profiles.py) that drug
+        searches for a named disease use instead of a query embedding; built there on first use
+        if missing or stale (None disables them)
+        disease_profile_mode: 'centroid' searches with a profile's centroid, 'multi' with each of
+        its vectors, keeping every drug's smallest distance
         
-        if query_lower in self.drug_names_lower:
-            return self.drug_names_lower[query_lower], []
+        The names, metadata, backend and artifacts in use (drug_names, version,
+        backend, scores, ...) are read through to the current _SearchState.
+        """
+        if disease_profile_mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown disease profile mode '{disease_profile_mode}', expected one of {PROFILE_MODES}")
+        self.drug_collection = drug_collection
+        self.disease_collection = disease_collection
+        self.metadata_store_dir = metadata_store_dir
+        self.lexical_index_dir = lexical_index_dir
+        self.fingerprint_index_dir = fingerprint_index_dir
+        self.disease_profiles_dir = disease_profiles_dir
+        self.disease_profile_mode = disease_profile_mode
+        self.scores_dir = scores_dir
+        self._backend_name = backend
+        self._backend_options = backend_options
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._state = self._build_state()
+        
+        self.embedding_cache = EmbeddingCache(
+            model_identity(self._state.backend.embedding_function),
+            maxsize=embedding_cache_size,
+            path=embedding_cache_path
+        )
+        self.result_cache = ResultCache(maxsize=result_cache_size, ttl=result_cache_ttl)
+        metrics.register_collector("embedding_cache", self.embedding_cache.stats)
+        metrics.register_collector("result_cache", self.result_cache.stats)
+        self.version_check_interval = version_check_interval
+        self._last_version_check = time.monotonic()
+    
+    def __getattr__(self, name):
+        # Only reached for attributes SmartSearch itself lacks: drug_names, version, backend, ...
+        if name.startswith("__") or name == "_state":
+            raise AttributeError(name)
+        return getattr(self._state, name)
+    
+    def _build_state(self):
+        """
+        Cache all drug and disease names and build the name indexes for fuzzy matching,
+        with the metadata store and backend that go with them
+        Drug embeddings are fetched on first use (see _SearchState.drug_embeddings)
+        """
+        # Taken first: a change while the state is built is caught by the next check
+        version = self.current_version()
+        metadata_store = MetadataStore.open(self.metadata_store_dir)
+        backend = make_backend(
+            self._backend_name, self.drug_collection, self.disease_collection,
+            metadata_store=metadata_store, **self._backend_options
+        )
+        return _SearchState(
+            version, self.drug_collection, self.disease_collection, metadata_store, backend,
+            self.scores_dir, self.fingerprint_index_dir
+        )
+    
+    def warm_up(self):
+        """
+        Load what the first searches would otherwise wait for: the embedding
+        model, the drug embeddings, the keyword indexes, the disease profiles and
+        the metadata snapshot
+        Safe to run in a background thread while searches are served.
+        """
+        with metrics.span("warm_up"):
+            state = self._state
+            # Straight to the backend, so the warm-up text never enters the embedding cache
+            state.backend.embed(["warm up"])
+            state.drug_embeddings
+            for target in ("drugs", "diseases"):
+                self._lexical_index(state, target)
+            self._disease_profiles(state)
+            self.metadata_snapshot()
+    
+    def current_version(self):
+        """Version of the underlying collections, see metadata_snapshot.collection_version"""
+        return collection_version(self.drug_collection), collection_version(self.disease_collection)
+    
+    def refresh_if_changed(self):
+        """Re-cache names and metadata when the collections changed, returns True if they did"""
+        with self._lock:
+            if self.current_version() == self._state.version:
+                return False
+            # Searches keep reading the old state until this one assignment
+            self._state = self._build_state()
+            self.result_cache.clear()
+            return True
+    
+    def _check_version(self):
+        """Throttled refresh_if_changed, so cached results never outlive a collection change"""
+        now = time.monotonic()
+        if now - self._last_version_check >= self.version_check_interval:
+            self._last_version_check = now
+            self.refresh_if_changed()
+    
+    def _cached(self, operation, query, top_k, compute, variant=""):
+        """
+        Serve (operation, query, top_k) from the result cache, computing it on a miss
+        compute(state, query, top_k) runs on the state current when the call started
+        variant: extra cache key part for otherwise identical calls (e.g. a filter)
+        """
+        self._check_version()
+        state = self._state
+        cache_operation = f"{operation}[{variant}]" if variant else operation
         
-        for lower_name, actual_name in self.drug_names_lower.items():
-            if query_lower in lower_name or lower_name in query_lower:
-                return actual_name, []
+        with metrics.span(operation):
+            results = self.result_cache.get(cache_operation, query, top_k)
+            metrics.count("result_cache_requests_total", operation=operation, result="miss" if results is None else "hit")
+            if results is None:
+                results = compute(state, query, top_k)
+                # Results of a state replaced meanwhile are returned but not cached
+                if self._state is state:
+                    self.result_cache.put(cache_operation, query, top_k, results)
+            
+            return [dict(r) for r in results]
+    
+    def _query(self, state, target, query_embeddings, n_results, filters=None):
+        """One similarity query against the state's backend, timed and counted"""
+        metrics.count("collection_calls_total", call="query", target=target, backend=state.backend.name)
+        with metrics.span("vector_search"):
+            return state.backend.query(target, query_embeddings=query_embeddings, n_results=n_results, filters=filters)
+    
+    def metadata_snapshot(self):
+        """Typed, columnar metadata snapshot, rebuilt only when the collections change"""
+        with self._lock:
+            self.refresh_if_changed()
+            state = self._state
+            if self._snapshot is None or self._snapshot.version != state.version:
+                drugs = state.drug_metadatas if state.drug_table is None else state.drug_table.frame(state.drug_ids)
+                diseases = state.disease_metadatas if state.disease_table is None else state.disease_table.frame(state.disease_ids)
+                self._snapshot = MetadataSnapshot(drugs, diseases, state.version)
+            return self._snapshot
+    
+    @staticmethod
+    def _resolve(index, query):
+        """Best non-fuzzy candidate, or typo suggestions when there is none"""
+        with metrics.span("resolve_name"):
+            candidates = index.search(query, limit=5)
         
-        suggestions = get_close_matches(query_lower, self.drug_names_lower.keys(), n=5, cutoff=0.6)
-        suggested_names = [self.drug_names_lower[s] for s in suggestions]
+        if candidates and candidates[0]['match'] != 'fuzzy':
+            return candidates[0]['name'], []
         
-        return None, suggested_names
+        return None, [c['name'] for c in candidates]
+    
+    def find_drug(self, query):
+        """
+        Find drug with fuzzy matching and case-insensitive search
+        Returns: (exact_match, suggested_names)
+        """
+        return self._resolve(self._state.drug_index, query)
     
     def find_disease(self, query):
         """
         Find disease with fuzzy matching and case-insensitive search
         Returns: (exact_match, suggested_names)
         """
-        query_lower = query.lower().strip()
+        return self._resolve(self._state.disease_index, query)
+    
+    def rank_drugs(self, query, limit=10):
+        """
+        Ranked drug name candidates for a query
+        Returns: list of {'name', 'score', 'match'} dicts, best first
+        """
+        return self._state.drug_index.search(query, limit=limit)
+    
+    def rank_diseases(self, query, limit=10):
+        """
+        Ranked disease name candidates for a query
+        Returns: list of {'name', 'score', 'match'} dicts, best first
+        """
+        return self._state.disease_index.search(query, limit=limit)
+    
+    def lexical_index(self, target):
+        """BM25 index of 'drugs' or 'diseases', opened (or built) on first use"""
+        return self._lexical_index(self._state, target)
+    
+    def _lexical_index(self, state, target):
+        with self._lock:
+            index = state.lexical_indexes.get(target)
+            if index is None:
+                if target == "drugs":
+                    table, ids, metadatas, version = state.drug_table, state.drug_ids, state.drug_metadatas, state.version[0]
+                else:
+                    table, ids, metadatas, version = state.disease_table, state.disease_ids, state.disease_metadatas, state.version[1]
+                # The state's version, not the live one: rows read before an ingest are never saved as current.
+                # Without the metadata store only the collection's fields can be indexed
+                version = (*version, "store" if table is not None else "collection")
+                index = load_lexical_index(
+                    Path(self.lexical_index_dir) / target, target, ids, metadatas, version, table
+                )
+                state.lexical_indexes[target] = index
+            return index
+    
+    def disease_profiles(self):
+        """Precomputed disease profiles (disease_profiles.py), opened (or built) on first use, None if disabled"""
+        return self._disease_profiles(self._state)
+    
+    def _disease_profiles(self, state):
+        if self.disease_profiles_dir is None:
+            return None
+        with self._lock:
+            if state.disease_profiles is None:
+                state.disease_profiles = load_disease_profiles(
+                    self.disease_profiles_dir, state.disease_collection, state.disease_table, state.backend.embed
+                )
+            return state.disease_profiles
+    
+    def _profile_vectors(self, state, disease_query):
+        """Query vectors of the disease profile disease_query names, None for free text"""
+        profiles = self._disease_profiles(state)
+        profile = profiles.resolve(disease_query) if profiles is not None else None
+        if profile is None:
+            return None
+        metrics.count("disease_profile_queries_total", mode=self.disease_profile_mode)
+        return profiles.query_vectors(profile, self.disease_profile_mode)
+    
+    def _drug_query(self, state, disease_query, n_results, filters=None):
+        """
+        (query embeddings, ids, metadatas, distances) of one drug search: a named
+        disease is searched with its precomputed profile, free text is embedded
+        Several profile vectors are merged, keeping each drug's smallest distance
+        """
+        embeddings = self._profile_vectors(state, disease_query)
+        if embeddings is None:
+            embeddings = self._embed_queries(state, [disease_query])
+        results = self._query(state, "drugs", embeddings, n_results, filters)
+        if len(embeddings) == 1:
+            return embeddings, results['ids'][0], results['metadatas'][0], results['distances'][0]
         
+        best = {}
+        for ids, metadatas, distances in zip(results['ids'], results['metadatas'], results['distances']):
+            for record_id, metadata, distance in zip(ids, metadatas, distances):
+                if record_id not in best or distance < best[record_id][2]:
+                    best[record_id] = (record_id, metadata, distance)
+        merged = sorted(best.values(), key=lambda item: item[2])[:n_results]
+        return embeddings, [m[0] for m in merged], [m[1] for m in merged], [m[2] for m in merged]
+    
+    def lexical_search(self, target, query, limit=10, min_relative_score=0.0):
+        """
+        BM25 keyword search over 'drugs' or 'diseases' (names, formulas, InChIKeys,
+        trial titles, EFO ids, descriptions)
+        Returns: list of {'id', 'name', 'score'} dicts, best first
+        """
+        return self._lexical_search(self._state, target, query, limit, min_relative_score)
+    
+    def _lexical_search(self, state, target, query, limit=10, min_relative_score=0.0):
+        with metrics.span("lexical_search"):
+            hits = self._lexical_index(state, target).search(query, limit, min_relative_score)
+        if target == "drugs":
+            rows, names = state.drug_rows_by_id, state.drug_names
+        else:
+            rows, names = state.disease_rows_by_id, state.disease_names
+        return [
+            {'id': record_id, 'name': names[rows[record_id]], 'score': round(score, 4)}
+            for record_id, score in hits if record_id in rows
+        ]
+    
+    def embed_queries(self, texts):
+        """Query embeddings for texts, served from the LRU embedding cache where possible"""
+        return self._embed_queries(self._state, texts)
+    
+    def _embed_queries(self, state, texts):
+        with metrics.span("embed"):
+            return self.embedding_cache.get_many(texts, state.backend.embed)
+    
+    def search_drugs_fuzzy(self, disease_query, top_k=10, filters=None):
+        """
+        Search for drugs using natural language query
+        No exact disease name needed! A known disease name is searched with its
+        precomputed profile (see disease_profiles.py) without embedding the query.
+        filters: optional drug_filters.DrugFilter, applied while the top_k is selected
+        """
+        return self._cached(
+            "drugs_for_disease", disease_query, top_k,
+            lambda state, query, k: self._search_drugs(state, query, k, filters),
+            variant=filters.cache_key() if filters else ""
+        )
+    
+    def _search_drugs(self, state, disease_query, top_k, filters=None):
+        _, _, metadatas, distances = self._drug_query(state, disease_query, top_k, filters)
         
-        if query_lower in self.disease_names_lower:
-            return self.disease_names_lower[query_lower], []
+        return self._drug_candidates(metadatas, distances)
+    
+    def search_drugs_hybrid(self, disease_query, top_k=10, filters=None, fusion="rrf", lexical_weight=0.3):
+        """
+        Drugs for a query from semantic and BM25 keyword retrieval combined, so
+        formulas, InChIKeys or trial title words in the query find their records
+        fusion: 'rrf' (reciprocal rank fusion) or 'weighted' (lexical_weight times
+        the max-normalized BM25 score plus the rest times the similarity)
+        Candidates carry 'hybrid_score', 'lexical_score' and 'match'
+        ('semantic', 'lexical' or 'both'); 'confidence' stays the vector similarity.
+        """
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion '{fusion}', expected 'rrf' or 'weighted'")
+        variant = f"{fusion}:{lexical_weight}:{filters.cache_key() if filters else ''}"
+        return self._cached(
+            "drugs_hybrid", disease_query, top_k,
+            lambda state, query, k: self._search_drugs_hybrid(state, query, k, filters, fusion, lexical_weight),
+            variant=variant
+        )
+    
+    def _search_drugs_hybrid(self, state, disease_query, top_k, filters, fusion, lexical_weight):
+        depth = max(3 * top_k, HYBRID_DEPTH)
+        embedding, ids, metadatas, distances = self._drug_query(state, disease_query, depth, filters)
+        semantic = {
+            record_id: (rank, metadata, distance)
+            for rank, (record_id, metadata, distance) in enumerate(zip(ids, metadatas, distances), 1)
+        }
         
- 
-        for lower_name, actual_name in self.disease_names_lower.items():
-            if query_lower in lower_name or lower_name in query_lower:
-                return actual_name, []
+        lexical = {}
+        hits = self._lexical_search(state, "drugs", disease_query, 2 * depth if filters else depth, LEXICAL_MIN_RELATIVE_SCORE)
+        for hit in hits:
+            record_id = hit['id']
+            if filters and not filters.matches(state.drug_metadatas[state.drug_rows_by_id[record_id]]):
+                continue
+            lexical[record_id] = (len(lexical) + 1, hit['score'])
+            if len(lexical) == depth:
+                break
         
-   
-        suggestions = get_close_matches(query_lower, self.disease_names_lower.keys(), n=5, cutoff=0.6)
-        suggested_names = [self.disease_names_lower[s] for s in suggestions]
+        # Keyword-only hits get their true vector distance, so confidence means the same everywhere
+        missing = [record_id for record_id in lexical if record_id not in semantic]
+        if missing:
+            rows = [state.drug_rows_by_id[record_id] for record_id in missing]
+            distances = pairwise_distances(
+                embedding, state.drug_embeddings[rows], collection_space(state.drug_collection)
+            ).min(axis=0)
+            for record_id, row, distance in zip(missing, rows, distances):
+                semantic[record_id] = (None, state.drug_metadatas[row], float(distance))
         
-        return None, suggested_names
+        max_lexical = max((score for _, score in lexical.values()), default=0.0) or 1.0
+        fused = []
+        for record_id, (rank, metadata, distance) in semantic.items():
+            lexical_rank, lexical_score = lexical.get(record_id, (None, 0.0))
+            if fusion == "rrf":
+                score = sum(1.0 / (RRF_K + r) for r in (rank, lexical_rank) if r is not None)
+            else:
+                score = (1 - lexical_weight) * (1 - distance) + lexical_weight * lexical_score / max_lexical
+            match = "both" if rank is not None and lexical_rank is not None else ("semantic" if rank is not None else "lexical")
+            fused.append((score, record_id, metadata, distance, lexical_score, match))
+        fused.sort(key=lambda item: -item[0])
+        fused = fused[:top_k]
+        
+        candidates = self._drug_candidates([item[2] for item in fused], [item[3] for item in fused])
+        for candidate, (score, _, _, _, lexical_score, match) in zip(candidates, fused):
+            candidate['hybrid_score'] = round(score, 4)
+            candidate['lexical_score'] = round(lexical_score, 3)
+            candidate['match'] = match
+        return candidates
     
-    def search_drugs_fuzzy(self, disease_query, top_k=10):
+    def search_drugs_batch(self, disease_queries, top_k=10, chunk_size=None, max_workers=1, filters=None):
         """
-        Search for drugs using natural language query
-        No exact disease name needed!
+        Search for drugs for many natural language queries at once
+        All queries are embedded and searched in one collection call, or one call
+        per chunk of chunk_size queries (run in parallel when max_workers > 1).
+        Known disease names are searched with their precomputed profiles instead.
+        filters: optional drug_filters.DrugFilter, as for search_drugs_fuzzy
+        Returns: list of candidate lists, in the same order as disease_queries
+        """
+        self._check_version()
+        state = self._state
+        operation = f"drugs_for_disease[{filters.cache_key()}]" if filters else "drugs_for_disease"
+        
+        # Identical and already cached queries are not embedded or searched again
+        by_query = {}
+        unique_queries = []
+        for query in dict.fromkeys(disease_queries):
+            cached = self.result_cache.get(operation, query, top_k)
+            if cached is None:
+                unique_queries.append(query)
+            else:
+                by_query[query] = cached
+        
+        # Named diseases need no embedding, only free text goes through the batched path
+        profiles = self._disease_profiles(state)
+        computed = unique_queries
+        free_text = []
+        for query in unique_queries:
+            if profiles is None or profiles.resolve(query) is None:
+                free_text.append(query)
+            else:
+                by_query[query] = self._search_drugs(state, query, top_k, filters)
+        unique_queries = free_text
+        
+        chunk_size = max(1, chunk_size or len(unique_queries))
+        chunks = [unique_queries[i:i + chunk_size] for i in range(0, len(unique_queries), chunk_size)]
+        
+        def run_chunk(chunk):
+            results = self._query(state, "drugs", self._embed_queries(state, chunk), top_k, filters)
+            return [
+                self._drug_candidates(metadatas, distances)
+                for metadatas, distances in zip(results['metadatas'], results['distances'])
+            ]
+        
+        if max_workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                chunk_results = list(executor.map(run_chunk, chunks))
+        else:
+            chunk_results = [run_chunk(chunk) for chunk in chunks]
+        
+        for chunk, candidate_lists in zip(chunks, chunk_results):
+            for query, candidates in zip(chunk, candidate_lists):
+                by_query[query] = candidates
+        # Results of a state replaced meanwhile are returned but not cached
+        if self._state is state:
+            for query in computed:
+                self.result_cache.put(operation, query, top_k, by_query[query])
+        
+        return [[dict(c) for c in by_query[q]] for q in disease_queries]
+    
+    def diseases_for_drug(self, drug_name, top_k=10):
         """
-        results = self.drug_collection.query(
-            query_texts=[disease_query],
-            n_results=top_k
+        Diseases closest to a drug (drug_name must be an exact name, e.g. from find_drug)
+        Served from the precomputed score matrix when available
+        """
+        return self._cached("diseases_for_drug", drug_name, top_k, self._diseases_for_drug)
+    
+    def _diseases_for_drug(self, state, drug_name, top_k):
+        with metrics.span("precomputed"):
+            precomputed = state.scores.diseases_for_drug(drug_name, top_k) if state.scores else None
+        if precomputed is not None:
+            return self._disease_candidates(
+                [self._record(state.disease_metadatas, state.disease_rows, name, 'disease_name') for name, _ in precomputed],
+                [distance for _, distance in precomputed]
+            )
+        
+        row = state.drug_rows.get(drug_name)
+        if row is None:
+            return []
+        
+        results = self._query(state, "diseases", [state.drug_embeddings[row]], top_k)
+        return self._disease_candidates(results['metadatas'][0], results['distances'][0])
+    
+    def similar_drugs(self, drug_name, top_k=10, structural_weight=0.0):
+        """
+        Other drugs closest to a drug (drug_name must be an exact name, e.g. from find_drug)
+        Served from the precomputed neighbor lists when available
+        structural_weight: > 0 blends in Morgan fingerprint (Tanimoto) similarity,
+        see similar_drugs_blended
+        """
+        if structural_weight > 0:
+            return self.similar_drugs_blended(drug_name, top_k, structural_weight)
+        return self._cached("similar_drugs", drug_name, top_k, self._similar_drugs)
+    
+    def _similar_drugs(self, state, drug_name, top_k):
+        neighbors = self._drug_neighbors(state, drug_name, top_k)
+        return self._drug_candidates([m for m, _ in neighbors], [d for _, d in neighbors])
+    
+    def _drug_neighbors(self, state, drug_name, top_k):
+        """(metadata, distance) of the top_k drugs closest to a drug in embedding space"""
+        with metrics.span("precomputed"):
+            precomputed = state.scores.similar_drugs(drug_name, top_k) if state.scores else None
+        if precomputed is not None:
+            return [
+                (self._record(state.drug_metadatas, state.drug_rows, name, 'drug_name'), distance)
+                for name, distance in precomputed
+            ]
+        
+        row = state.drug_rows.get(drug_name)
+        if row is None:
+            return []
+        
+        results = self._query(state, "drugs", [state.drug_embeddings[row]], top_k + 1)
+        # Drop the drug itself
+        return [
+            (metadata, distance)
+            for record_id, metadata, distance in zip(results['ids'][0], results['metadatas'][0], results['distances'][0])
+            if record_id != state.drug_ids[row]
+        ][:top_k]
+    
+    def structural_search(self, drug_name, top_k=10):
+        """
+        Drugs with the most similar chemical structure (Tanimoto over Morgan fingerprints)
+        Returns: list of (drug_name, similarity), [] when there is no fingerprint index or drug_name has no fingerprint
+        """
+        return self._structural_search(self._state, drug_name, top_k)
+    
+    def _structural_search(self, state, drug_name, top_k):
+        if state.fingerprints is None:
+            return []
+        with metrics.span("structural_search"):
+            hits = state.fingerprints.search(drug_name, top_k, exclude=drug_name)
+        return [(name, similarity) for name, similarity in hits if name in state.drug_rows]
+    
+    def similar_drugs_blended(self, drug_name, top_k=10, structural_weight=0.5):
+        """
+        Similar drugs ranked by structural_weight * Tanimoto similarity of the
+        Morgan fingerprints + (1 - structural_weight) * embedding similarity,
+        over the best candidates of both
+        Candidates carry 'structural_similarity' (percent, None without a
+        fingerprint) and 'blended_score'; 'confidence' stays the embedding similarity.
+        Candidates without a fingerprint are scored on embedding similarity alone.
+        Without a fingerprint for drug_name this is the plain embedding ranking.
+        """
+        return self._cached(
+            "similar_drugs", drug_name, top_k,
+            lambda state, name, k: self._similar_drugs_blended(state, name, k, structural_weight),
+            variant=f"structural={structural_weight}"
         )
+    
+    def _similar_drugs_blended(self, state, drug_name, top_k, structural_weight):
+        if drug_name not in state.drug_rows:
+            return []
+        depth = max(3 * top_k, HYBRID_DEPTH)
+        semantic = {metadata.get('drug_name'): (metadata, distance) for metadata, distance in self._drug_neighbors(state, drug_name, depth)}
+        structural = dict(self._structural_search(state, drug_name, depth))
+        
+        # Fill in the missing half of each candidate's score
+        names = list(dict.fromkeys([*semantic, *structural]))
+        unscored = [name for name in names if name not in structural]
+        if structural and unscored:
+            structural.update(zip(unscored, state.fingerprints.similarity(drug_name, unscored)))
+        missing = [name for name in names if name not in semantic]
+        if missing:
+            rows = [state.drug_rows[name] for name in missing]
+            query = state.drug_embeddings[[state.drug_rows[drug_name]]]
+            distances = pairwise_distances(query, state.drug_embeddings[rows], collection_space(state.drug_collection))[0]
+            for name, row, distance in zip(missing, rows, distances):
+                semantic[name] = (state.drug_metadatas[row], float(distance))
+        
+        blended = []
+        for name in names:
+            metadata, distance = semantic[name]
+            similarity = structural.get(name)
+            # A drug without a fingerprint is not structurally dissimilar, just unknown:
+            # rank it by its embedding similarity alone rather than as Tanimoto 0
+            if similarity is None:
+                score = 1 - distance
+            else:
+                score = (1 - structural_weight) * (1 - distance) + structural_weight * similarity
+            blended.append((score, metadata, distance, similarity))
+        blended.sort(key=lambda item: -item[0])
+        blended = blended[:top_k]
+        
+        candidates = self._drug_candidates([item[1] for item in blended], [item[2] for item in blended])
+        for candidate, (score, _, _, similarity) in zip(candidates, blended):
+            candidate['structural_similarity'] = round(similarity * 100, 1) if similarity is not None else None
+            candidate['blended_score'] = round(score, 4)
+        return candidates
+    
+    @staticmethod
+    def _record(metadatas, rows, name, name_key):
+        """Metadata of the named record, a stub with just the name if it is unknown"""
+        row = rows.get(name)
+        return metadatas[row] if row is not None else {name_key: name}
+    
+    @staticmethod
+    def _disease_candidates(metadatas, distances):
+        """Turn one query's disease metadatas/distances into ranked candidate dicts"""
+        candidates = []
+        with metrics.span("hydrate"):
+            for i, (metadata, distance) in enumerate(zip(metadatas, distances), 1):
+                candidates.append({
+                    'rank': i,
+                    'disease_name': metadata.get('disease_name', 'Unknown'),
+                    'confidence': round((1 - distance) * 100, 1),
+                    'efo_id': metadata.get('efo_id', 'N/A'),
+                    'known_drugs_count': metadata.get('known_drugs_count', 0),
+                    'targets_count': metadata.get('targets_count', 0)
+                })
         
+        return candidates
+    
+    @staticmethod
+    def _drug_candidates(metadatas, distances):
+        """Turn one query's drug metadatas/distances into ranked candidate dicts"""
         candidates = []
-        for i, (metadata, distance) in enumerate(zip(
-            results['metadatas'][0],
-            results['distances'][0]
-        ), 1):
-            similarity = (1 - distance) * 100
-            
-            candidates.append({
-                'rank': i,
-                'drug_name': metadata.get('drug_name', 'Unknown'),
-                'confidence': round(similarity, 1),
-                'molecular_weight': metadata.get('molecular_weight', 'N/A'),
-                'bbb_permeable': metadata.get('bbb_permeable', False),
-                'passes_lipinski': metadata.get('passes_lipinski', False),
-                'clinical_trials': metadata.get('clinical_trials_count', 0),
-                'pubchem_cid': metadata.get('pubchem_cid')
-            })
+        with metrics.span("hydrate"):
+            for i, (metadata, distance) in enumerate(zip(metadatas, distances), 1):
+                similarity = (1 - distance) * 100
+                
+                candidates.append({
+                    'rank': i,
+                    'drug_name': metadata.get('drug_name', 'Unknown'),
+                    'confidence': round(similarity, 1),
+                    'molecular_weight': metadata.get('molecular_weight', 'N/A'),
+                    'bbb_permeable': metadata.get('bbb_permeable'),
+                    'passes_lipinski': metadata.get('passes_lipinski'),
+                    'clinical_trials': metadata.get('clinical_trials_count', 0),
+                    'pubchem_cid': metadata.get('pubchem_cid')
+                })
         
         return candidates
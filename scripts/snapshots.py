@@ -0,0 +1,431 @@
+"""
+Versioned snapshots of the search data, and hot-swapping servers onto them
+
+    python scripts/snapshots.py create              # publish data/vector_db and its artifacts as a new version
+    python scripts/snapshots.py list
+    python scripts/snapshots.py activate 3          # roll back (or forward) to version 3
+    python scripts/snapshots.py prune --keep 3
+
+A snapshot is a directory data/snapshots/v<version> holding a copy of the
+ChromaDB database plus every artifact SmartSearch reads next to it: the
+exported embedding matrices, the metadata store (which the name indexes are
+built from), the keyword indexes and disease profiles, and the precomputed
+scores, fingerprint index and quantized codes when they match the database.
+It is assembled in a staging directory and renamed into place, and the
+active version is named by the CURRENT file, which is replaced atomically.
+The snapshot tools never rewrite a published snapshot, but it is not
+read-only: servers open its database with ChromaDB, which may update the
+SQLite and index files in place, and build a missing or stale keyword
+index or disease profile set into it on first use.
+
+SnapshotWatcher serves the active snapshot's engine and polls CURRENT. When
+another version becomes active it builds and warms up a new engine in the
+background and then swaps it in. Callers that already hold the old engine
+finish their queries on it. Every watcher keeps a lease file under
+.leases naming the versions it serves or is loading, renewed on each poll,
+and prune_snapshots never deletes a leased version.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from fingerprint_index import FINGERPRINT_INDEX_DIR, FingerprintIndex
+from instrumentation import metrics
+from metadata_snapshot import collection_version
+from metadata_store import METADATA_STORE_DIR, MetadataStore
+from precompute_scores import PRECOMPUTED_DIR, ScoreMatrix
+from quantized_index import MANIFEST as QUANTIZED_MANIFEST, index_dir, refresh_index
+from startup import BackgroundLoader
+from vector_backend import (
+    ARTIFACT_PREFIX, PROJECT_ROOT, QUANTIZED_DIR, TARGETS, VECTOR_DB_DIR, export_embeddings, open_collections
+)
+
+SNAPSHOTS_DIR = PROJECT_ROOT / "data" / "snapshots"
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+KEEP_SNAPSHOTS = 3
+WATCH_INTERVAL = 30.0
+# Watchers' lease files; a lease lasts this many watch intervals, and at least LEASE_MIN_SECONDS
+LEASES = ".leases"
+LEASE_INTERVALS = 3
+LEASE_MIN_SECONDS = 300.0
+
+# Subdirectories of a snapshot
+VECTOR_DB = "vector_db"
+EMBEDDINGS = "embeddings"
+METADATA_STORE = "metadata_store"
+LEXICAL_INDEX = "lexical_index"
+PRECOMPUTED = "precomputed"
+FINGERPRINT_INDEX = "fingerprint_index"
+DISEASE_PROFILES = "disease_profiles"
+QUANTIZED = "quantized"
+
+# Written by ingest.py inside the database directory, not needed to serve it
+INGEST_CHECKPOINT = "ingest_checkpoint.json"
+
+
+def snapshot_name(version):
+    return f"v{version:06d}"
+
+
+def search_options(directory, backend="chroma"):
+    """SmartSearch keyword arguments that point every artifact at the snapshot in directory"""
+    directory = Path(directory)
+    options = {
+        'scores_dir': directory / PRECOMPUTED,
+        'metadata_store_dir': directory / METADATA_STORE,
+        'lexical_index_dir': directory / LEXICAL_INDEX,
+        'fingerprint_index_dir': directory / FINGERPRINT_INDEX,
+        # Snapshots published before disease profiles existed are searched without them
+        'disease_profiles_dir': directory / DISEASE_PROFILES if (directory / DISEASE_PROFILES).is_dir() else None,
+    }
+    if backend in ("numpy", "quantized"):
+        options['embeddings_dir'] = directory / EMBEDDINGS
+    if backend == "quantized":
+        options['quantized_dir'] = directory / QUANTIZED
+    return options
+
+
+class Snapshot:
+    """One published version: a directory of artifacts plus manifest.json"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest['version']
+
+    def __repr__(self):
+        return f"Snapshot({self.path})"
+
+    @property
+    def vector_db(self):
+        return self.path / VECTOR_DB
+
+    def search_options(self, backend="chroma"):
+        """See search_options()"""
+        return search_options(self.path, backend)
+
+
+def list_snapshots(root=SNAPSHOTS_DIR):
+    """Published snapshots under root, oldest first"""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    snapshots = []
+    for path in root.iterdir():
+        if path.name.startswith("v") and (path / MANIFEST).exists():
+            try:
+                snapshots.append(Snapshot(path))
+            except (OSError, ValueError, KeyError):
+                continue
+    return sorted(snapshots, key=lambda snapshot: snapshot.version)
+
+
+def current_snapshot(root=SNAPSHOTS_DIR):
+    """The active snapshot, or None when none was activated (or it is unreadable)"""
+    try:
+        with open(Path(root) / CURRENT) as f:
+            version = json.load(f)['version']
+        return Snapshot(Path(root) / snapshot_name(version))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def activate_snapshot(root, version):
+    """Make version the active snapshot; watching servers swap to it on their next check"""
+    root = Path(root)
+    snapshot = Snapshot(root / snapshot_name(version))
+    tmp_path = root / f"{CURRENT}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': snapshot.version, 'activated_at': datetime.now().isoformat()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, root / CURRENT)
+    return snapshot
+
+
+def leased_versions(root=SNAPSHOTS_DIR):
+    """Versions a running SnapshotWatcher serves or is loading; expired leases are removed"""
+    versions = set()
+    leases = Path(root) / LEASES
+    if not leases.is_dir():
+        return versions
+    now = time.time()
+    for path in leases.glob("*.json"):
+        try:
+            with open(path) as f:
+                lease = json.load(f)
+            if lease['expires'] < now:
+                path.unlink()
+                continue
+        except (OSError, ValueError, KeyError):
+            continue
+        versions.update(lease['versions'])
+    return versions
+
+
+def prune_snapshots(root=SNAPSHOTS_DIR, keep=KEEP_SNAPSHOTS):
+    """
+    Delete all but the newest keep snapshots; never the active one, nor one a
+    running server still serves or loads (e.g. after a failed swap, see
+    leased_versions). Returns the deleted versions.
+    """
+    current = current_snapshot(root)
+    in_use = leased_versions(root)
+    snapshots = list_snapshots(root)
+    removed = []
+    for snapshot in snapshots[:max(len(snapshots) - keep, 0)]:
+        if current is not None and snapshot.version == current.version:
+            continue
+        if snapshot.version in in_use:
+            continue
+        shutil.rmtree(snapshot.path, ignore_errors=True)
+        removed.append(snapshot.version)
+    return removed
+
+
+def create_snapshot(db_path=VECTOR_DB_DIR, root=SNAPSHOTS_DIR, activate=True, keep=KEEP_SNAPSHOTS,
+                    metadata_store_dir=METADATA_STORE_DIR, scores_dir=PRECOMPUTED_DIR,
+                    fingerprint_index_dir=FINGERPRINT_INDEX_DIR, quantized_dir=QUANTIZED_DIR):
+    """
+    Publish the database in db_path, with the artifacts that match it, as the
+    next snapshot version under root; activates it and prunes old versions
+    unless told otherwise. Run it when nothing is writing to db_path (e.g.
+    at the end of ingest.py --snapshot). Returns the Snapshot.
+    """
+    from search_utils import SmartSearch
+
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    version = max((snapshot.version for snapshot in list_snapshots(root)), default=0) + 1
+    staging = root / f".staging-{snapshot_name(version)}-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+
+    try:
+        shutil.copytree(db_path, staging / VECTOR_DB, ignore=shutil.ignore_patterns(INGEST_CHECKPOINT))
+        collections = dict(zip(TARGETS, open_collections(db_path)))
+        artifacts = [VECTOR_DB, EMBEDDINGS]
+        for target, collection in collections.items():
+            export_embeddings(collection, ARTIFACT_PREFIX[target], staging / EMBEDDINGS)
+
+        # Derived artifacts are only carried over while they match the collections
+        store = MetadataStore.open(metadata_store_dir)
+        if store is not None and all(store.table_for(t, c) is not None for t, c in collections.items()):
+            # Only the live generation, as a plain directory
+            shutil.copytree(store.directory, staging / METADATA_STORE)
+            artifacts.append(METADATA_STORE)
+        versions = [collection_version(collection) for collection in collections.values()]
+        scores = ScoreMatrix.load(scores_dir, versions)
+        if scores is not None:
+            shutil.copytree(scores.directory, staging / PRECOMPUTED)
+            artifacts.append(PRECOMPUTED)
+        fingerprints = FingerprintIndex.load(fingerprint_index_dir)
+        if fingerprints is not None:
+            shutil.copytree(fingerprints.directory, staging / FINGERPRINT_INDEX)
+            artifacts.append(FINGERPRINT_INDEX)
+        quantized_prefixes = [prefix for prefix in ARTIFACT_PREFIX.values()
+                              if (index_dir(quantized_dir, prefix) / QUANTIZED_MANIFEST).exists()]
+        for prefix in quantized_prefixes:
+            # Codes are tied to the exact matrix file, so they are rebuilt with their own config
+            shutil.copytree(index_dir(quantized_dir, prefix), staging / QUANTIZED / prefix)
+            matrix = np.load(staging / EMBEDDINGS / f"{prefix}_embeddings.npy", mmap_mode='r')
+            refresh_index(staging / QUANTIZED, prefix, matrix)
+        if quantized_prefixes:
+            artifacts.append(QUANTIZED)
+
+        # Keyword indexes and disease profiles are built the way SmartSearch opens
+        # them, so no server ever has to write into a published snapshot
+        options = {**search_options(staging), 'disease_profiles_dir': staging / DISEASE_PROFILES}
+        smart_search = SmartSearch(collections["drugs"], collections["diseases"], result_cache_size=0, **options)
+        for target in TARGETS:
+            smart_search.lexical_index(target)
+        smart_search.disease_profiles()
+        artifacts += [LEXICAL_INDEX, DISEASE_PROFILES]
+
+        manifest = {
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'source': str(db_path),
+            'collections': {
+                target: {'id': str(collection.id), 'count': collection.count()}
+                for target, collection in collections.items()
+            },
+            'artifacts': artifacts,
+        }
+        with open(staging / MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        # Fails rather than overwrites if another process published this version first
+        os.rename(staging, root / snapshot_name(version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    snapshot = Snapshot(root / snapshot_name(version))
+    if activate:
+        activate_snapshot(root, version)
+    if keep:
+        prune_snapshots(root, keep)
+    return snapshot
+
+
+class SnapshotWatcher:
+    """
+    Serve the engine built from the active snapshot and swap in a new one
+    whenever another snapshot is activated
+
+        watcher = SnapshotWatcher(lambda snapshot: build_engine(snapshot), warm_up=...)
+        engine = watcher.result()        # the newest engine that finished loading
+
+    It has BackgroundLoader's interface (ready, wait, result, value, error) for
+    the initial load, which starts at once. New engines are loaded and warmed
+    up on the watcher thread before they replace the old one, and on_swap(engine)
+    is called after each swap. A snapshot that fails to load is skipped and the
+    old engine keeps serving. The lease file (see leased_versions) is removed
+    by stop().
+    """
+
+    def __init__(self, factory, root=SNAPSHOTS_DIR, interval=WATCH_INTERVAL, warm_up=None, on_swap=None,
+                 name="search_engine"):
+        snapshot = current_snapshot(root)
+        if snapshot is None:
+            raise FileNotFoundError(f"No active snapshot in {root}, create one with scripts/snapshots.py create")
+        self.root = Path(root)
+        self.interval = interval
+        self.name = name
+        self.snapshot = snapshot
+        self.swaps = 0
+        self.failed_version = None
+        self.last_error = None
+        self._factory = factory
+        self._warm_up = warm_up
+        self._on_swap = on_swap
+        self._lease_path = self.root / LEASES / f"{os.getpid()}-{id(self)}.json"
+        self._renew_lease()
+        self._loader = BackgroundLoader(partial(factory, snapshot), warm_up=warm_up, name=name)
+        self._stop = threading.Event()
+        metrics.register_collector("snapshot", lambda: {'version': self.snapshot.version, 'swaps': self.swaps})
+        self._thread = threading.Thread(target=self._watch, name=f"{name}-watcher", daemon=True)
+        self._thread.start()
+
+    # BackgroundLoader's interface, for the engine currently served
+
+    @property
+    def value(self):
+        return self._loader.value
+
+    @property
+    def error(self):
+        return self._loader.error
+
+    def ready(self):
+        return self._loader.ready()
+
+    def wait(self, timeout=None):
+        return self._loader.wait(timeout)
+
+    def result(self, timeout=None):
+        return self._loader.result(timeout)
+
+    def check(self):
+        """Load and swap in the active snapshot if it is not the one served; True when swapped"""
+        snapshot = current_snapshot(self.root)
+        if snapshot is None or snapshot.version in (self.snapshot.version, self.failed_version):
+            return False
+
+        self._renew_lease(snapshot.version)
+        loader = BackgroundLoader(partial(self._factory, snapshot), warm_up=self._warm_up, name=self.name)
+        loader.wait_warm()
+        if loader.error is not None:
+            self.failed_version, self.last_error = snapshot.version, loader.error
+            metrics.count("snapshot_swaps_total", result="failed")
+            self._renew_lease()
+            return False
+
+        # One reference assignment: requests that already took the old engine keep using it
+        self._loader, self.snapshot = loader, snapshot
+        self._renew_lease()
+        self.swaps += 1
+        metrics.count("snapshot_swaps_total", result="swapped")
+        if self._on_swap is not None:
+            self._on_swap(loader.value)
+        return True
+
+    def _renew_lease(self, loading=None):
+        """Claim the served version (and one being loaded) against prune_snapshots"""
+        versions = [self.snapshot.version] + ([loading] if loading is not None else [])
+        lease = {
+            'versions': versions,
+            'pid': os.getpid(),
+            'expires': time.time() + max(LEASE_INTERVALS * self.interval, LEASE_MIN_SECONDS),
+        }
+        self._lease_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._lease_path.with_name(self._lease_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(lease, f)
+        os.replace(tmp_path, self._lease_path)
+
+    def _watch(self):
+        self._loader.wait_warm()
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+                self._renew_lease()
+            except Exception as e:
+                # A half-written or deleted snapshot directory must not stop the watcher
+                self.last_error = e
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self._lease_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=str(SNAPSHOTS_DIR), help="Snapshots directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Publish the database as a new snapshot")
+    create.add_argument("--db-path", default=str(VECTOR_DB_DIR), help="ChromaDB directory")
+    create.add_argument("--no-activate", action="store_true", help="Publish without making it the active snapshot")
+    create.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS, help="Snapshots kept (0 keeps all)")
+    commands.add_parser("list", help="List the snapshots")
+    activate = commands.add_parser("activate", help="Make a snapshot the active one")
+    activate.add_argument("version", type=int)
+    prune = commands.add_parser("prune", help="Delete old snapshots")
+    prune.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    args = parser.parse_args()
+
+    if args.command == "create":
+        snapshot = create_snapshot(args.db_path, args.root, activate=not args.no_activate, keep=args.keep)
+        counts = ", ".join(f"{c['count']} {t}" for t, c in snapshot.manifest['collections'].items())
+        print(f"Published snapshot {snapshot.version} ({counts}) to {snapshot.path}"
+              + ("" if args.no_activate else ", now active"))
+    elif args.command == "list":
+        current = current_snapshot(args.root)
+        for snapshot in list_snapshots(args.root):
+            active = "*" if current is not None and snapshot.version == current.version else " "
+            counts = ", ".join(f"{c['count']} {t}" for t, c in snapshot.manifest['collections'].items())
+            print(f"{active} {snapshot.version:>4}  {snapshot.manifest['created_at']}  {counts}  "
+                  f"[{', '.join(snapshot.manifest['artifacts'])}]")
+    elif args.command == "activate":
+        snapshot = activate_snapshot(args.root, args.version)
+        print(f"Snapshot {snapshot.version} is now active")
+    else:
+        removed = prune_snapshots(args.root, args.keep)
+        print(f"Deleted snapshots {', '.join(map(str, removed))}" if removed else "Nothing to delete")
+
+
+if __name__ == "__main__":
+    main()
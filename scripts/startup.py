@@ -0,0 +1,82 @@
+"""
+Background loading for a fast cold start
+
+    loader = BackgroundLoader(open_search_engine, warm_up=lambda engine: engine.warm_up())
+    ...                               # render the page chrome meanwhile
+    engine = loader.result()          # blocks only if loading is still running
+
+The factory runs on a daemon thread as soon as the loader is created, and the
+optional warm-up hook runs on the same thread right after it, so the first
+searches do not pay for model loading either. Durations are exported as
+startup_seconds{phase=load|warm_up} (see instrumentation.py).
+"""
+
+import threading
+import time
+
+from instrumentation import metrics
+
+
+class BackgroundLoader:
+    """Build a value on a background thread, then optionally warm it up"""
+
+    def __init__(self, factory, warm_up=None, name="search_engine"):
+        self.name = name
+        self.value = None
+        self.error = None
+        self.warm_up_error = None
+        self.load_seconds = None
+        self.warm_up_seconds = None
+        self._factory = factory
+        self._warm_up = warm_up
+        self._loaded = threading.Event()
+        self._warmed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{name}-loader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.value = self._factory()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.load_seconds = time.perf_counter() - start
+            metrics.observe("startup_seconds", self.load_seconds, phase="load", loader=self.name)
+            self._loaded.set()
+
+        if self.error is None and self._warm_up is not None:
+            start = time.perf_counter()
+            try:
+                self._warm_up(self.value)
+            except Exception as e:
+                # A failed warm-up only means the first searches load lazily
+                self.warm_up_error = e
+            finally:
+                self.warm_up_seconds = time.perf_counter() - start
+                metrics.observe("startup_seconds", self.warm_up_seconds, phase="warm_up", loader=self.name)
+        self._warmed.set()
+
+    def ready(self):
+        """Whether the value (or its error) is available"""
+        return self._loaded.is_set()
+
+    def warmed_up(self):
+        """Whether the warm-up hook has finished too"""
+        return self._warmed.is_set()
+
+    def wait(self, timeout=None):
+        """Block until loaded (or timeout seconds), returns ready()"""
+        return self._loaded.wait(timeout)
+
+    def wait_warm(self, timeout=None):
+        """Block until warmed up (or timeout seconds), returns warmed_up()"""
+        return self._warmed.wait(timeout)
+
+    def result(self, timeout=None):
+        """The loaded value; re-raises the factory's exception, TimeoutError if still loading"""
+        if not self.wait(timeout):
+            raise TimeoutError(f"{self.name} still loading after {timeout} s")
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -0,0 +1,417 @@
+"""
+Similarity search backends for SmartSearch
+
+All backends answer the same query() call and return ChromaDB-shaped results
+({'ids', 'metadatas', 'distances'}, one list per query), so callers can switch
+between them per deployment.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from drug_filters import PropertyBitmaps
+from metadata_snapshot import collection_version
+
+PROJECT_ROOT = Path(__file__).parent.parent.absolute()
+VECTOR_DB_DIR = PROJECT_ROOT / "data" / "vector_db"
+# Exports are a cache of the collections, kept apart from the shipped data/processed/embeddings
+EMBEDDINGS_DIR = PROJECT_ROOT / "data" / "cache" / "embeddings"
+QUANTIZED_DIR = PROJECT_ROOT / "data" / "processed" / "quantized"
+
+TARGETS = ("drugs", "diseases")
+ARTIFACT_PREFIX = {"drugs": "drug", "diseases": "disease"}
+NAME_KEY = {"drugs": "drug_name", "diseases": "disease_name"}
+
+
+def open_collections(db_path=VECTOR_DB_DIR, create=False):
+    """Open the persisted ChromaDB 'drugs' and 'diseases' collections (creating them if asked)"""
+    import chromadb
+    from chromadb.config import Settings
+
+    client = chromadb.PersistentClient(
+        path=str(db_path),
+        settings=Settings(anonymized_telemetry=False)
+    )
+    if create:
+        return client.get_or_create_collection("drugs"), client.get_or_create_collection("diseases")
+    return client.get_collection("drugs"), client.get_collection("diseases")
+
+
+def resolve_embedding_function(collection):
+    """Embedding function the collection was created with (Chroma's default otherwise)"""
+    embedding_function = getattr(collection, '_embedding_function', None)
+    if embedding_function is None:
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        embedding_function = DefaultEmbeddingFunction()
+    return embedding_function
+
+
+def collection_space(collection):
+    """Distance space of a collection ('l2', 'ip' or 'cosine'), Chroma defaults to l2"""
+    # The configuration keeps the space after modify() replaced the metadata (see bump_content_generation)
+    configuration = getattr(collection, 'configuration_json', None) or {}
+    space = (configuration.get('hnsw') or {}).get('space')
+    if space:
+        return space
+    metadata = getattr(collection, 'metadata', None) or {}
+    return metadata.get('hnsw:space', 'l2')
+
+
+def export_embeddings(collection, prefix, out_dir=EMBEDDINGS_DIR):
+    """
+    Write a collection's embeddings, ids and metadata as row-aligned files
+    <prefix>_embeddings.npy, <prefix>_ids.json and <prefix>_metadata.json,
+    plus the collection_version they were exported at in <prefix>_version.json
+
+    Each file is replaced atomically, the matrix and then the version last,
+    so processes exporting and loading the same directory concurrently never
+    read a partial file or take an older export for a current one.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    version = collection_version(collection)
+    records = collection.get(include=["embeddings", "metadatas"])
+    matrix = np.asarray(records['embeddings'], dtype=np.float32)
+
+    def replace(filename, write):
+        tmp_path = out_dir / f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb' if filename.endswith('.npy') else 'w') as f:
+            write(f)
+        os.replace(tmp_path, out_dir / filename)
+
+    replace(f"{prefix}_ids.json", lambda f: json.dump(list(records['ids']), f))
+    replace(f"{prefix}_metadata.json", lambda f: json.dump(list(records['metadatas']), f, indent=2))
+    replace(f"{prefix}_embeddings.npy", lambda f: np.save(f, matrix))
+    replace(f"{prefix}_version.json", lambda f: json.dump(list(version), f))
+
+    return matrix.shape
+
+
+def exported_version(embeddings_dir, prefix):
+    """collection_version (as a list) the files in embeddings_dir were exported at, None if unknown"""
+    try:
+        with open(Path(embeddings_dir) / f"{prefix}_version.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _Backend:
+    """Shared query-embedding and metadata-store support"""
+
+    embedding_function = None
+
+    def embed(self, texts):
+        """Embed query texts with the collections' embedding function"""
+        return np.asarray(self.embedding_function(list(texts)), dtype=np.float32)
+
+    @staticmethod
+    def _store_tables(metadata_store, collections):
+        """Metadata store tables that still match their collections (see metadata_store.py)"""
+        if metadata_store is None:
+            return {}
+        tables = {target: metadata_store.table_for(target, collection) for target, collection in collections.items()}
+        return {target: table for target, table in tables.items() if table is not None}
+
+
+class ChromaBackend(_Backend):
+    """Send every query to the ChromaDB collections (HNSW search)"""
+
+    name = "chroma"
+
+    def __init__(self, drug_collection, disease_collection, metadata_store=None):
+        self.collections = {"drugs": drug_collection, "diseases": disease_collection}
+        self.embedding_function = resolve_embedding_function(drug_collection)
+        self.tables = self._store_tables(metadata_store, self.collections)
+
+    def query(self, target, query_texts=None, query_embeddings=None, n_results=10, filters=None):
+        collection = self.collections[target]
+        table = self.tables.get(target)
+        # With a current metadata store only ids and distances come back from Chroma
+        include = ["distances"] if table is not None else ["metadatas", "distances"]
+        # Chroma applies the where clause inside the HNSW search
+        where = filters.where() if filters else None
+        if query_embeddings is not None:
+            results = collection.query(
+                query_embeddings=list(query_embeddings), n_results=n_results, where=where, include=include
+            )
+        else:
+            results = collection.query(query_texts=list(query_texts), n_results=n_results, where=where, include=include)
+        if table is not None:
+            results['metadatas'] = [table.records(ids) for ids in results['ids']]
+        return results
+
+
+def top_k_smallest(distances, k):
+    """Column indices and values of the k smallest entries in each row, ascending"""
+    k = min(k, distances.shape[1])
+    if k <= 0:
+        empty = np.empty((len(distances), 0))
+        return empty.astype(np.int64), empty
+
+    if k < distances.shape[1]:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(distances.shape[1]), (len(distances), 1))
+    part_distances = np.take_along_axis(distances, part, axis=1)
+
+    order = np.argsort(part_distances, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_distances, order, axis=1)
+
+
+def pairwise_distances(queries, matrix, space, sq_norms=None, norms=None):
+    """
+    Distances from every query row to every matrix row in a Chroma distance
+    space, same formulas as hnswlib (sq_norms/norms: precomputed row norms)
+    """
+    return distances_from_dots(queries @ matrix.T, queries, space, sq_norms, norms, matrix)
+
+
+def distances_from_dots(dots, queries, space, sq_norms=None, norms=None, matrix=None):
+    """
+    Distances in a Chroma distance space from query x row dot products and the
+    rows' norms (computed from matrix when not given)
+    """
+    if space == 'ip':
+        return 1.0 - dots
+    if sq_norms is None:
+        sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+    if space == 'cosine':
+        q_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms = np.sqrt(sq_norms) if norms is None else norms
+        return 1.0 - dots / np.maximum(q_norms * norms, 1e-12)
+
+    q_sq_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+    return np.maximum(q_sq_norms + sq_norms - 2.0 * dots, 0.0)
+
+
+class EmbeddingMatrix:
+    """Memory-mapped embedding matrix with its row-aligned ids and metadata"""
+
+    def __init__(self, matrix, ids, metadatas, space, metadata_table=None):
+        self.matrix = matrix
+        self.ids = ids
+        self.metadatas = metadatas
+        self.space = space
+        self.metadata_table = metadata_table
+        self._bitmaps = None
+        self.sq_norms = self._row_sq_norms()
+        self.norms = np.sqrt(self.sq_norms)
+
+    def _row_sq_norms(self):
+        rows = np.asarray(self.matrix, dtype=np.float32)
+        return np.einsum('ij,ij->i', rows, rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, queries, rows=None):
+        """Distances from every query row to every stored row (or just rows), same formulas as hnswlib"""
+        if rows is None:
+            return pairwise_distances(queries, self.matrix, self.space, self.sq_norms, self.norms)
+        return pairwise_distances(queries, self.matrix[rows], self.space, self.sq_norms[rows], self.norms[rows])
+
+    def property_bitmaps(self):
+        """PropertyBitmaps over the rows, built on first use"""
+        if self._bitmaps is None:
+            if self.metadata_table is not None:
+                self._bitmaps = PropertyBitmaps.from_table(self.metadata_table, self.ids)
+            else:
+                self._bitmaps = PropertyBitmaps.from_metadatas(self.metadatas)
+        return self._bitmaps
+
+    def top_k(self, queries, k, mask=None):
+        """
+        Indices and distances of the k nearest rows for each query, nearest first
+        mask: optional boolean row mask, only rows where it is True are ranked
+        """
+        if mask is None:
+            return top_k_smallest(self.distances(queries), k)
+
+        rows = np.flatnonzero(mask)
+        k = min(k, len(rows))
+        if 2 * len(rows) < len(mask):
+            # Selective filter: score only the passing rows
+            indices, distances = top_k_smallest(self.distances(queries, rows), k)
+            return rows[indices], distances
+
+        distances = self.distances(queries)
+        distances[:, ~mask] = np.inf
+        return top_k_smallest(distances, k)
+
+
+def load_embedding_matrix(collection, target, embeddings_dir=EMBEDDINGS_DIR, metadata_table=None,
+                          matrix_cls=EmbeddingMatrix, **options):
+    """
+    Memory-map the persisted embedding matrix for target ('drugs' or 'diseases'),
+    exporting it from the collection first when the files are missing or stale.
+    With a current metadata_table (metadata_store.py), row metadata is read from
+    it lazily instead of from <prefix>_metadata.json.
+    matrix_cls / options: EmbeddingMatrix subclass to wrap it in, and its extra arguments
+    """
+    embeddings_dir = Path(embeddings_dir)
+    prefix = ARTIFACT_PREFIX[target]
+    matrix_path = embeddings_dir / f"{prefix}_embeddings.npy"
+    ids_path = embeddings_dir / f"{prefix}_ids.json"
+    metadata_path = embeddings_dir / f"{prefix}_metadata.json"
+
+    if not (matrix_path.exists() and metadata_path.exists()) \
+            or exported_version(embeddings_dir, prefix) != list(collection_version(collection)):
+        export_embeddings(collection, prefix, embeddings_dir)
+
+    matrix = np.load(matrix_path, mmap_mode='r')
+
+    if ids_path.exists():
+        with open(ids_path) as f:
+            ids = json.load(f)
+        if metadata_table is not None:
+            return matrix_cls(
+                matrix, ids, metadata_table.records(ids), collection_space(collection), metadata_table, **options
+            )
+
+    with open(metadata_path) as f:
+        metadatas = json.load(f)
+
+    if not ids_path.exists():
+        # Shipped matrices (e.g. disease_embeddings.npy) have no ids file; match rows by name
+        records = collection.get(include=["metadatas"])
+        name_key = NAME_KEY[target]
+        id_by_name = {m.get(name_key): record_id for record_id, m in zip(records['ids'], records['metadatas'])}
+        ids = [id_by_name.get(m.get(name_key)) for m in metadatas]
+
+    return matrix_cls(matrix, ids, metadatas, collection_space(collection), **options)
+
+
+class QuantizedMatrix(EmbeddingMatrix):
+    """
+    EmbeddingMatrix ranked on int8 or product-quantized codes (quantized_index.py)
+
+    The codes pick the rerank_factor * k rows with the smallest approximate
+    distances, then those rows alone are read from the memory-mapped float32
+    matrix and ranked by their exact distances. Returned distances are the
+    float32 ones, so confidence only differs from NumpyBackend when a true
+    top-k row was not among the candidates.
+    """
+
+    def __init__(self, matrix, ids, metadatas, space, metadata_table=None, index_dir=QUANTIZED_DIR, prefix=None,
+                 quantization="int8", subspaces=None, rerank_factor=None, index=None):
+        """
+        index_dir / prefix: where the codes are persisted (rebuilt when missing or
+        stale); index_dir=None quantizes in memory
+        quantization: 'int8' or 'pq'; subspaces: PQ subspaces (bytes per row)
+        rerank_factor: candidates re-ranked exactly per requested result
+        index: an already built QuantizedIndex for matrix, used as is
+        """
+        from quantized_index import PQ_SUBSPACES, RERANK_FACTOR, QuantizedIndex, load_or_build_index
+
+        subspaces = PQ_SUBSPACES if subspaces is None else subspaces
+        if index is not None:
+            self.index = index
+        elif index_dir is None:
+            self.index = QuantizedIndex.build(matrix, quantization, subspaces)
+        else:
+            self.index = load_or_build_index(index_dir, prefix, matrix, quantization, subspaces)
+        self.rerank_factor = RERANK_FACTOR if rerank_factor is None else rerank_factor
+        super().__init__(matrix, ids, metadatas, space, metadata_table)
+
+    def _row_sq_norms(self):
+        # Stored with the codes, so loading never reads the whole float matrix
+        return self.index.sq_norms
+
+    def top_k(self, queries, k, mask=None):
+        rows = None if mask is None else np.flatnonzero(mask)
+        k = min(k, len(self) if rows is None else len(rows))
+        candidates = self.index.candidates(queries, max(k * self.rerank_factor, k), self.space, rows)
+
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k))
+        for i, (query, candidate_rows) in enumerate(zip(queries, candidates)):
+            # Sorted, so the float rows are read in file order
+            candidate_rows = np.sort(candidate_rows)
+            order, exact = top_k_smallest(self.distances(query[None], candidate_rows), k)
+            indices[i], distances[i] = candidate_rows[order[0]], exact[0]
+        return indices, distances
+
+
+class NumpyBackend(_Backend):
+    """
+    Brute-force in-process search over the persisted embedding matrices
+
+    Matrices are loaded from EMBEDDINGS_DIR with np.load(mmap_mode='r'); a target
+    whose files are missing or stale is exported from its collection first.
+    """
+
+    name = "numpy"
+
+    def __init__(self, drug_collection, disease_collection, embeddings_dir=EMBEDDINGS_DIR, metadata_store=None):
+        self.collections = {"drugs": drug_collection, "diseases": disease_collection}
+        self.embeddings_dir = Path(embeddings_dir)
+        self.embedding_function = resolve_embedding_function(drug_collection)
+        tables = self._store_tables(metadata_store, self.collections)
+        self.matrices = {target: self._load_matrix(target, tables.get(target)) for target in TARGETS}
+
+    def _load_matrix(self, target, metadata_table):
+        return load_embedding_matrix(self.collections[target], target, self.embeddings_dir, metadata_table)
+
+    def query(self, target, query_texts=None, query_embeddings=None, n_results=10, filters=None):
+        if query_embeddings is None:
+            queries = self.embed(query_texts)
+        else:
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = np.atleast_2d(queries)
+
+        store = self.matrices[target]
+        mask = store.property_bitmaps().mask(filters) if filters else None
+        indices, distances = store.top_k(queries, n_results, mask)
+
+        return {
+            'ids': [[store.ids[i] for i in row] for row in indices],
+            'metadatas': [[store.metadatas[i] for i in row] for row in indices],
+            'distances': [row.tolist() for row in distances],
+        }
+
+
+class QuantizedBackend(NumpyBackend):
+    """
+    NumpyBackend that keeps int8 (4x smaller) or product-quantized (e.g. 32x
+    smaller) codes in memory and re-ranks their best candidates exactly
+    against the memory-mapped float32 matrices (see QuantizedMatrix). Codes
+    live in QUANTIZED_DIR and are rebuilt when the matrices change.
+    """
+
+    name = "quantized"
+
+    def __init__(self, drug_collection, disease_collection, embeddings_dir=EMBEDDINGS_DIR, metadata_store=None,
+                 quantization="int8", subspaces=None, rerank_factor=None, quantized_dir=QUANTIZED_DIR):
+        """
+        quantization: 'int8' (one byte per dimension) or 'pq' (one byte per subspace)
+        subspaces: PQ subspaces, must divide the embedding dimension
+        rerank_factor: exactly re-ranked candidates per requested result
+        """
+        self.matrix_options = {
+            'index_dir': quantized_dir, 'quantization': quantization,
+            'subspaces': subspaces, 'rerank_factor': rerank_factor,
+        }
+        super().__init__(drug_collection, disease_collection, embeddings_dir, metadata_store)
+
+    def _load_matrix(self, target, metadata_table):
+        return load_embedding_matrix(
+            self.collections[target], target, self.embeddings_dir, metadata_table,
+            matrix_cls=QuantizedMatrix, prefix=ARTIFACT_PREFIX[target], **self.matrix_options
+        )
+
+
+BACKENDS = {backend.name: backend for backend in (ChromaBackend, NumpyBackend, QuantizedBackend)}
+
+
+def make_backend(name, drug_collection, disease_collection, **kwargs):
+    """Build the named backend ('chroma', 'numpy' or 'quantized')"""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown search backend '{name}', expected one of {sorted(BACKENDS)}")
+    return backend_cls(drug_collection, disease_collection, **kwargs)
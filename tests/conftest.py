@@ -0,0 +1,15 @@
+"""
+Shared setup for the test suite
+
+    python -m pytest tests
+
+The modules under scripts/ import each other by bare name (they are run as
+scripts), so the directory goes on sys.path here the same way.
+"""
+
+import sys
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
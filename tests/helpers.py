@@ -0,0 +1,37 @@
+"""Test doubles shared by several test modules"""
+
+import hashlib
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+
+class HashEmbedding(EmbeddingFunction):
+    """Deterministic unit vectors from a text hash; raises on the texts in fail_on"""
+
+    def __init__(self, fail_on=(), dim=16):
+        self.fail_on = set(fail_on)
+        self.dim = dim
+        self.embedded = []
+
+    def __call__(self, input):
+        if self.fail_on & set(input):
+            raise RuntimeError("embedding service went away")
+        self.embedded.extend(input)
+        vectors = []
+        for text in input:
+            rng = np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+    @staticmethod
+    def name():
+        return "test-hash"
+
+    def get_config(self):
+        return {'dim': self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbedding(dim=config.get('dim', 16))
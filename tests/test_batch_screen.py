@@ -0,0 +1,100 @@
+import argparse
+import json
+
+import pytest
+
+import batch_screen
+from batch_screen import JsonlWriter, progress_path, read_queries, run_settings, screen
+from drug_filters import DrugFilter
+
+
+class FakeEngine:
+    """Two deterministic candidates per query; raises on the query named in fail_on"""
+
+    fail_on = None
+
+    def search_drugs_batch(self, queries, top_k, filters=None):
+        if FakeEngine.fail_on in queries:
+            raise RuntimeError("interrupted")
+        return [
+            [{'rank': rank, 'drug_name': f"{query} drug {rank}", 'confidence': 1.0 / rank, 'bbb_permeable': None}
+             for rank in range(1, 3)]
+            for query in queries
+        ]
+
+    def disease_profiles(self):
+        return None
+
+
+@pytest.fixture
+def queries_file(tmp_path):
+    path = tmp_path / "queries.csv"
+    path.write_text("query\n" + "".join(f"disease {i}\n" for i in range(25)))
+    return path
+
+
+def run(queries_file, out, state=None, done=0, rows_written=0):
+    """screen() the way main() drives it, checkpointing to out.progress.json"""
+    def progress(queries_done, rows, writer_state):
+        batch_screen._replace_json(progress_path(out), {
+            'queries_done': queries_done, 'rows_written': rows, 'writer': writer_state,
+        })
+
+    queries = read_queries(queries_file)
+    for _ in range(done):
+        next(queries, None)
+    return screen(queries, JsonlWriter(out, state), FakeEngine, top_k=2, chunk_size=4,
+                  progress=progress, done=done, rows_written=rows_written, log_every=0)
+
+
+def test_resume_after_an_interrupted_run_matches_a_clean_run(queries_file, tmp_path, monkeypatch):
+    clean = tmp_path / "clean.jsonl"
+    run(queries_file, clean)
+
+    out = tmp_path / "resumed.jsonl"
+    monkeypatch.setattr(FakeEngine, "fail_on", "disease 13")
+    with pytest.raises(RuntimeError):
+        run(queries_file, out)
+    checkpoint = json.loads(progress_path(out).read_text())
+    assert checkpoint['queries_done'] == 12
+    assert checkpoint['writer']['bytes'] == out.stat().st_size
+
+    # Rows written after the checkpoint (a crash mid-chunk) are dropped on resume
+    with open(out, 'ab') as f:
+        f.write(b'{"query_id": "partial", "query": "disea')
+    monkeypatch.setattr(FakeEngine, "fail_on", None)
+    report = run(queries_file, out, checkpoint['writer'], checkpoint['queries_done'], checkpoint['rows_written'])
+    assert report['queries'] == 13
+    assert report['queries_total'] == 25
+    assert report['rows_total'] == 50
+    assert out.read_bytes() == clean.read_bytes()
+    assert json.loads(progress_path(out).read_text())['queries_done'] == 25
+
+
+def test_rows_keep_input_order_and_unknown_flags(queries_file, tmp_path):
+    out = tmp_path / "out.jsonl"
+    run(queries_file, out)
+    rows = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [row['query'] for row in rows[::2]] == [f"disease {i}" for i in range(25)]
+    assert [row['rank'] for row in rows[:2]] == [1, 2]
+    assert rows[0]['bbb_permeable'] is None
+    assert rows[-1]['query_id'] == "24"
+
+
+def test_settings_cover_every_option_that_changes_the_rows(queries_file, tmp_path):
+    args = argparse.Namespace(
+        input=str(queries_file), out=str(tmp_path / "out.jsonl"), query_column=None, id_column=None, top_k=10,
+        mode="semantic", db_path=str(tmp_path / "db"), backend="numpy", quantization="int8", subspaces=None,
+        rerank_factor=None,
+    )
+    settings = run_settings(args, DrugFilter())
+    assert settings['db_path'] == str((tmp_path / "db").resolve())
+    # Quantization options only matter to the quantized backend
+    assert run_settings(argparse.Namespace(**{**vars(args), 'quantization': "pq"}), DrugFilter()) == settings
+
+    for option, value in [('id_column', "efo_id"), ('db_path', str(tmp_path / "other")), ('backend', "quantized")]:
+        assert run_settings(argparse.Namespace(**{**vars(args), option: value}), DrugFilter()) != settings
+    quantized = argparse.Namespace(**{**vars(args), 'backend': "quantized"})
+    for option, value in [('quantization', "pq"), ('subspaces', 48), ('rerank_factor', 5)]:
+        changed = argparse.Namespace(**{**vars(quantized), option: value})
+        assert run_settings(changed, DrugFilter()) != run_settings(quantized, DrugFilter())
@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+import pytest
+
+from drug_filters import DrugFilter, PropertyBitmaps
+
+FILTERS = [
+    DrugFilter(bbb_permeable=True),
+    DrugFilter(bbb_permeable=False, passes_lipinski=True),
+    DrugFilter(min_molecular_weight=200, max_molecular_weight=500),
+    DrugFilter(max_molecular_weight=300.5),
+    DrugFilter(min_clinical_trials=3),
+    DrugFilter(bbb_permeable=True, passes_lipinski=False, min_molecular_weight=150, min_clinical_trials=1),
+]
+
+
+@pytest.fixture(scope="module")
+def metadatas():
+    rng = random.Random(5)
+    flags = [True, False, None, np.True_, np.False_]
+    records = []
+    for _ in range(3001):
+        metadata = {
+            'bbb_permeable': rng.choice(flags),
+            'passes_lipinski': rng.choice(flags),
+            'molecular_weight': rng.choice([rng.uniform(50, 900), rng.randint(50, 900), None, True, "n/a"]),
+            'clinical_trials_count': rng.choice([rng.randint(0, 10), None, False]),
+        }
+        # Missing keys behave like None
+        records.append({key: value for key, value in metadata.items() if value is not None or rng.random() < 0.5})
+    records[7] = None
+    return records
+
+
+@pytest.mark.parametrize("drug_filter", FILTERS, ids=repr)
+def test_bitmaps_match_the_row_by_row_filter(metadatas, drug_filter):
+    bitmaps = PropertyBitmaps.from_metadatas(metadatas)
+    expected = [drug_filter.matches(_plain(metadata or {})) for metadata in metadatas]
+    assert bitmaps.mask(drug_filter).tolist() == expected
+    assert len(bitmaps.packed(drug_filter)) == (len(metadatas) + 7) // 8
+
+
+def test_empty_filter():
+    bitmaps = PropertyBitmaps.from_metadatas([{'molecular_weight': 100.0}])
+    assert not DrugFilter()
+    assert bitmaps.mask(DrugFilter()) is None
+    assert DrugFilter().where() is None
+    assert DrugFilter().cache_key() == ""
+
+
+def test_where_clause_and_cache_key():
+    drug_filter = DrugFilter(bbb_permeable=1, max_molecular_weight=500)
+    assert drug_filter.where() == {'$and': [
+        {'bbb_permeable': {'$eq': True}}, {'molecular_weight': {'$lte': 500.0}}
+    ]}
+    assert drug_filter.cache_key() == "bbb=1;mw=None-500.0"
+    assert drug_filter == DrugFilter(bbb_permeable=True, max_molecular_weight=500.0)
+
+
+def _plain(metadata):
+    """NumPy booleans as the Python ones ChromaDB returns"""
+    return {key: bool(value) if isinstance(value, np.bool_) else value for key, value in metadata.items()}
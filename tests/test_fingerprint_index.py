@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import fingerprint_index
+from artifact_dir import CURRENT
+from fingerprint_index import FingerprintIndex, build_fingerprint_index, popcount_rows
+
+N_BITS = 2048
+
+
+def random_fingerprints(rng, n, low, high):
+    """Sparse random bit rows, a few of them near copies of the first one"""
+    bits = np.zeros((n, N_BITS), dtype=bool)
+    for row in range(n):
+        bits[row, rng.choice(N_BITS, rng.integers(low, high), replace=False)] = True
+    for row in range(1, 30):
+        bits[row] = bits[0]
+        bits[row, rng.choice(N_BITS, row, replace=False)] ^= True
+    return bits
+
+
+def brute_force(bits, query, k, exclude=None, min_similarity=0.0):
+    common = (bits & query).sum(axis=1)
+    union = bits.sum(axis=1) + query.sum() - common
+    scores = np.divide(common, union, out=np.zeros(len(bits)), where=union > 0)
+    ranked = [(score, row) for row, score in enumerate(scores) if row != exclude and score > 0
+              and score >= min_similarity]
+    ranked.sort(key=lambda item: -item[0])
+    return ranked[:k]
+
+
+def assert_same_top_k(results, expected, names):
+    assert [score for _, score in results] == pytest.approx([score for score, _ in expected])
+    cutoff = expected[-1][0] + 1e-12 if expected else 0
+    assert {name for name, score in results if score > cutoff} == {names[row] for score, row in expected if score > cutoff}
+
+
+@pytest.fixture(scope="module", params=[(20, 80), (600, 900)], ids=["sparse", "dense"])
+def fingerprints(request, tmp_path_factory):
+    rng = np.random.default_rng(11)
+    bits = random_fingerprints(rng, 6000, *request.param)
+    names = [f"drug_{row}" for row in range(len(bits))]
+    directory = tmp_path_factory.mktemp("fingerprints")
+    build_fingerprint_index(directory, names, np.packbits(bits, axis=1), N_BITS)
+    return FingerprintIndex(directory), bits, names
+
+
+def test_popcounts_and_packing(fingerprints):
+    index, bits, names = fingerprints
+    rows = [index.rows[name] for name in names]
+    assert np.array_equal(index.popcounts[rows], bits.sum(axis=1))
+    assert np.array_equal(popcount_rows(index.fingerprints), index.popcounts)
+    assert np.all(np.diff(index.popcounts) >= 0)
+
+
+@pytest.mark.parametrize("seed_rows", [fingerprint_index.SEED_ROWS, 64])
+@pytest.mark.parametrize("k", [1, 10, 40])
+def test_search_matches_brute_force(fingerprints, monkeypatch, seed_rows, k):
+    index, bits, names = fingerprints
+    # A small seed leaves most of the work to the popcount band and the postings
+    monkeypatch.setattr(fingerprint_index, "SEED_ROWS", seed_rows)
+    monkeypatch.setattr(fingerprint_index, "BLOCK_ROWS", 1000)
+    for row in (0, 5, 100, 4000):
+        results = index.search(names[row], k=k, exclude=names[row])
+        assert_same_top_k(results, brute_force(bits, bits[row], k, exclude=row), names)
+
+
+def test_search_by_words_and_min_similarity(fingerprints):
+    index, bits, names = fingerprints
+    words = np.packbits(bits[0]).view(np.uint64)
+    results = index.search(words, k=50, min_similarity=0.5)
+    assert_same_top_k(results, brute_force(bits, bits[0], 50, min_similarity=0.5), names)
+    assert results[0] == (names[0], 1.0)
+
+
+def test_similarity_and_unknown_names(fingerprints):
+    index, bits, names = fingerprints
+    scores = index.similarity(names[0], [names[1], "unknown", names[0]])
+    expected = brute_force(bits[[1]], bits[0], 1)[0][0]
+    assert scores == [pytest.approx(expected), None, 1.0]
+    assert index.search("unknown") == []
+    assert index.similarity("unknown", [names[0]]) == [None]
+
+
+def test_rebuild_publishes_a_new_generation(tmp_path):
+    rng = np.random.default_rng(4)
+    bits = random_fingerprints(rng, 200, 20, 80)
+    names = [f"drug_{row}" for row in range(len(bits))]
+    build_fingerprint_index(tmp_path, names, np.packbits(bits, axis=1), N_BITS)
+    old = FingerprintIndex.load(tmp_path)
+
+    # Other rows under the same names: a reader of the old build must never mix the two
+    build_fingerprint_index(tmp_path, names[::-1][:150], np.packbits(bits[:150], axis=1), N_BITS)
+    new = FingerprintIndex.load(tmp_path)
+    assert new.directory != old.directory
+    assert new.directory.name == (tmp_path / CURRENT).read_text()
+    assert len(new) == len(new.fingerprints) == 150
+    assert_same_top_k(old.search(names[0], k=5), brute_force(bits, bits[0], 5), names)
+    assert_same_top_k(new.search(names[-1], k=5), brute_force(bits[:150], bits[0], 5), names[::-1])
@@ -0,0 +1,72 @@
+import chromadb
+import pytest
+from chromadb.config import Settings
+
+from helpers import HashEmbedding
+from ingest import Checkpoint, ingest_collection
+from metadata_snapshot import collection_version
+
+
+def entries(count=8, texts=None):
+    texts = texts or {}
+    return [(f"Drug {i}", texts.get(i, f"text {i}"), {'drug_name': f"Drug {i}", 'molecular_weight': 100.0 + i})
+            for i in range(count)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path / "db"), settings=Settings(anonymized_telemetry=False))
+
+    def collection(embedding_function):
+        return client.get_or_create_collection("drugs", embedding_function=embedding_function)
+    return collection
+
+
+def ingest(collection, checkpoint, records):
+    return ingest_collection(collection, "drugs", records, checkpoint, batch_size=2, workers=1)
+
+
+def test_interrupted_run_resumes_from_the_checkpoint(db, tmp_path):
+    path = tmp_path / "checkpoint.json"
+    with pytest.raises(RuntimeError):
+        ingest(db(HashEmbedding(fail_on={"text 4"})), Checkpoint(path, "model", interval=0), entries())
+
+    # The batches that landed were checkpointed; the rest is embedded on the next run
+    checkpoint = Checkpoint(path, "model", interval=0)
+    assert len(checkpoint.records("drugs")) == 4
+    embedding_function = HashEmbedding()
+    stats = ingest(db(embedding_function), checkpoint, entries())
+    assert stats == {'embedded': 4, 'updated': 0, 'deleted': 0, 'unchanged': 4}
+    assert sorted(embedding_function.embedded) == [f"text {i}" for i in range(4, 8)]
+    assert db(embedding_function).count() == 8
+
+    again = ingest(db(embedding_function), Checkpoint(path, "model", interval=0), entries())
+    assert again == {'embedded': 0, 'updated': 0, 'deleted': 0, 'unchanged': 8}
+
+
+def test_changes_are_classified(db, tmp_path):
+    path = tmp_path / "checkpoint.json"
+    embedding_function = HashEmbedding()
+    ingest(db(embedding_function), Checkpoint(path, "model", interval=0), entries())
+    before = collection_version(db(embedding_function))
+
+    records = entries(7, texts={0: "new text 0"})
+    records[1][2]['molecular_weight'] = 1.0
+    embedding_function.embedded.clear()
+    stats = ingest(db(embedding_function), Checkpoint(path, "model", interval=0), records)
+    assert stats == {'embedded': 1, 'updated': 1, 'deleted': 1, 'unchanged': 5}
+    assert embedding_function.embedded == ["new text 0"]
+
+    collection = db(embedding_function)
+    stored = collection.get(where={'drug_name': "Drug 1"})
+    assert stored['metadatas'][0]['molecular_weight'] == 1.0
+    assert collection.count() == 7
+    # Same count as before would not do: the content generation moved on
+    assert collection_version(collection) != before
+
+
+def test_checkpoint_of_another_model_is_ignored(db, tmp_path):
+    path = tmp_path / "checkpoint.json"
+    ingest(db(HashEmbedding()), Checkpoint(path, "model", interval=0), entries())
+    assert Checkpoint(path, "other model").records("drugs") == {}
+    assert len(Checkpoint(path, "model").records("drugs")) == 8
@@ -0,0 +1,118 @@
+import math
+from collections import Counter
+
+import chromadb
+import numpy as np
+import pytest
+from chromadb.config import Settings
+
+from helpers import HashEmbedding
+from lexical_index import B, K1, LexicalIndex, build_lexical_index, tokenize
+from search_utils import SmartSearch
+
+WORDS = ["tumor", "glioma", "kinase", "inhibitor", "receptor", "antagonist", "amyloid", "plaque",
+         "insulin", "statin", "opioid", "agonist", "cancer", "fibrosis", "asthma", "migraine"]
+
+
+def brute_force(texts, query, limit):
+    """Okapi BM25 with the Lucene idf, scored document by document"""
+    documents = [Counter(tokenize(text)) for text in texts]
+    lengths = [sum(counts.values()) for counts in documents]
+    avgdl = sum(lengths) / len(lengths)
+    terms = list(dict.fromkeys(tokenize(query)))
+    df = {term: sum(term in counts for counts in documents) for term in terms}
+    scores = []
+    for doc, counts in enumerate(documents):
+        score = 0.0
+        for term in terms:
+            tf = counts.get(term, 0)
+            if tf:
+                idf = math.log1p((len(texts) - df[term] + 0.5) / (df[term] + 0.5))
+                score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[doc] / avgdl))
+        if score > 0:
+            scores.append((score, doc))
+    scores.sort(key=lambda item: -item[0])
+    return scores[:limit]
+
+
+def assert_same_ranking(results, expected, ids):
+    assert [score for _, score in results] == pytest.approx([score for score, _ in expected], rel=1e-5)
+    # Ties may come back in either order, anything scoring above the last one must match
+    cutoff = expected[-1][0] * (1 + 1e-5)
+    assert {i for i, score in results if score > cutoff} == {ids[doc] for score, doc in expected if score > cutoff}
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = np.random.default_rng(3)
+    texts = []
+    for doc in range(20000):
+        # Common words everywhere, in long documents; a few short documents repeat them
+        words = list(rng.choice(WORDS, size=rng.integers(5, 40), p=np.linspace(2, 0.5, len(WORDS)) / 20))
+        if doc % 500 == 0:
+            words = ["tumor", "kinase"] * int(rng.integers(2, 5)) + words[:3]
+        texts.append(" ".join(words))
+    ids = [f"doc_{doc}" for doc in range(len(texts))]
+    directory = tmp_path_factory.mktemp("lexical")
+    build_lexical_index(directory, ids, texts, version=("v", 1))
+    return LexicalIndex(directory), texts, ids
+
+
+def test_threshold_algorithm_matches_brute_force(corpus, monkeypatch):
+    index, texts, ids = corpus
+
+    def exhaustive(*args):
+        raise AssertionError("expected the threshold algorithm to settle")
+
+    # The skewed query terms settle early, so the exhaustive sum must not be needed
+    monkeypatch.setattr(index, "_exhaustive", exhaustive)
+    results = index.search("tumor kinase", limit=10)
+    assert len(results) == 10
+    assert_same_ranking(results, brute_force(texts, "tumor kinase", 10), ids)
+
+
+@pytest.mark.parametrize("query", ["glioma", "amyloid plaque", "insulin statin opioid", "migraine asthma tumor"])
+@pytest.mark.parametrize("limit", [1, 10, 50])
+def test_search_matches_brute_force(corpus, query, limit):
+    index, texts, ids = corpus
+    assert_same_ranking(index.search(query, limit=limit), brute_force(texts, query, limit), ids)
+
+
+def test_min_relative_score_and_misses(corpus):
+    index, texts, ids = corpus
+    results = index.search("tumor kinase", limit=100, min_relative_score=0.9)
+    assert results and all(score >= 0.9 * results[0][1] for _, score in results)
+    assert index.search("nonexistentterm") == []
+    assert index.search("the and of") == []
+    assert index.search("tumor", limit=0) == []
+
+
+def test_open_checks_the_version(corpus, tmp_path):
+    index, _, _ = corpus
+    directory = index.directory.parent
+    assert LexicalIndex.open(directory, ("v", 1)) is not None
+    assert LexicalIndex.open(directory, ("v", 2)) is None
+    assert LexicalIndex.open(tmp_path / "missing") is None
+
+
+def test_smart_search_stamps_the_index_with_its_state_version(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path / "db"), settings=Settings(anonymized_telemetry=False))
+    drugs = client.create_collection("drugs", embedding_function=HashEmbedding())
+    diseases = client.create_collection("diseases", embedding_function=HashEmbedding())
+    drugs.add(ids=["drug_0", "drug_1"], documents=["a", "b"],
+              metadatas=[{'drug_name': "Aspirin"}, {'drug_name': "Ibuprofen"}])
+    diseases.add(ids=["disease_0"], documents=["c"], metadatas=[{'disease_name': "Asthma"}])
+    smart_search = SmartSearch(
+        drugs, diseases, result_cache_size=0, version_check_interval=3600, metadata_store_dir=None,
+        scores_dir=tmp_path / "scores", lexical_index_dir=tmp_path / "lexical",
+        fingerprint_index_dir=tmp_path / "fingerprints", disease_profiles_dir=None,
+    )
+    state_version = smart_search.version[0]
+
+    # An ingest lands after the state was read, before its index is first built
+    drugs.add(ids=["drug_2"], documents=["d"], metadatas=[{'drug_name': "Zebrafix"}])
+    assert smart_search.lexical_index("drugs").search("zebrafix") == []
+    assert LexicalIndex.open(tmp_path / "lexical" / "drugs").version == (*state_version, "collection")
+
+    assert smart_search.refresh_if_changed()
+    assert smart_search.lexical_index("drugs").search("zebrafix")[0][0] == "drug_2"
@@ -0,0 +1,65 @@
+import random
+import string
+
+import pytest
+
+from name_index import NameIndex
+
+NAMES = ["Aspirin", "Aspirin Lysine", "Acetaminophen", "Donepezil", "Donepezil Hydrochloride",
+         "Memantine", "Galantamine", "Rivastigmine", "Ibuprofen", "Naproxen", "Metformin"]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NameIndex(NAMES + ["aspirin", "", None])
+
+
+def test_duplicates_and_blanks_are_dropped(index):
+    assert len(index) == len(NAMES)
+    assert index.names[index.keys.index("aspirin")] == "Aspirin"
+
+
+def test_exact_lookup_is_case_and_space_insensitive(index):
+    assert index.get("  DONEPEZIL ") == "Donepezil"
+    assert index.get("donepez") is None
+    assert index.search("memantine") == [{'name': "Memantine", 'score': 1.0, 'match': 'exact'}]
+
+
+def test_prefix_beats_substring(index):
+    results = index.search("donep")
+    assert [r['name'] for r in results] == ["Donepezil", "Donepezil Hydrochloride"]
+    assert {r['match'] for r in results} == {'prefix'}
+
+    results = index.search("tamine")
+    assert {r['name'] for r in results} == {"Galantamine"}
+    assert results[0]['match'] == 'substring'
+
+
+def test_name_contained_in_query(index):
+    results = index.search("aspirin 81 mg tablets")
+    assert results[0]['name'] == "Aspirin"
+    assert results[0]['match'] == 'contained'
+
+
+def test_typos_fall_back_to_fuzzy(index):
+    results = index.search("ibuprofin")
+    assert results[0]['name'] == "Ibuprofen"
+    assert results[0]['match'] == 'fuzzy'
+    assert index.search("zzzzzz") == []
+    assert index.search("   ") == []
+
+
+def test_limit_and_ordering(index):
+    results = index.search("a", limit=3)
+    assert len(results) == 3
+    assert [r['score'] for r in results] == sorted((r['score'] for r in results), reverse=True)
+
+
+def test_substring_matches_a_linear_scan():
+    rng = random.Random(7)
+    names = ["".join(rng.choice("abcde") for _ in range(rng.randint(3, 12))) for _ in range(2000)]
+    index = NameIndex(names)
+    for _ in range(200):
+        query = "".join(rng.choice(string.ascii_lowercase[:5]) for _ in range(rng.randint(1, 5)))
+        expected = sorted(i for i, key in enumerate(index.keys) if query in key)
+        assert sorted(index._substring_ids(query)) == expected
@@ -0,0 +1,64 @@
+import chromadb
+import numpy as np
+import pytest
+from chromadb.config import Settings
+
+from artifact_dir import CURRENT
+from helpers import HashEmbedding
+from metadata_snapshot import collection_version
+from precompute_scores import MANIFEST, ScoreMatrix, build_score_matrix
+
+
+@pytest.fixture
+def collections(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path / "db"), settings=Settings(anonymized_telemetry=False))
+    embedding_function = HashEmbedding()
+    drugs = client.create_collection("drugs", embedding_function=embedding_function)
+    diseases = client.create_collection("diseases", embedding_function=embedding_function)
+    names = [f"Drug {i}" for i in range(40)]
+    drugs.add(ids=[f"drug_{i}" for i in range(40)], documents=names, metadatas=[{'drug_name': n} for n in names])
+    names = [f"Disease {i}" for i in range(12)]
+    diseases.add(ids=[f"disease_{i}" for i in range(12)], documents=names,
+                 metadatas=[{'disease_name': n} for n in names])
+    return drugs, diseases
+
+
+def build(collections, tmp_path):
+    return build_score_matrix(*collections, tmp_path / "precomputed", neighbors=5, disease_top_k=4, chunk_size=16,
+                              embeddings_dir=tmp_path / "embeddings")
+
+
+def test_scores_match_brute_force(collections, tmp_path):
+    build(collections, tmp_path)
+    drugs, diseases = (c.get(include=["embeddings", "metadatas"]) for c in collections)
+    scores = ScoreMatrix.load(tmp_path / "precomputed", [collection_version(c) for c in collections])
+
+    distances = ((drugs['embeddings'][:, None] - diseases['embeddings'][None]) ** 2).sum(axis=2)
+    row = [m['drug_name'] for m in drugs['metadatas']].index("Drug 7")
+    expected = [(diseases['metadatas'][i]['disease_name'], distances[row, i]) for i in np.argsort(distances[row])]
+    for top_k in (4, 10):
+        results = scores.diseases_for_drug("Drug 7", top_k)
+        assert [name for name, _ in results] == [name for name, _ in expected[:top_k]]
+        assert [d for _, d in results] == pytest.approx([d for _, d in expected[:top_k]], rel=1e-4, abs=1e-5)
+
+    similar = scores.similar_drugs("Drug 7", 5)
+    assert "Drug 7" not in [name for name, _ in similar]
+    assert scores.similar_drugs("Drug 7", 6) is None
+    assert scores.diseases_for_drug("unknown") is None
+
+
+def test_rebuild_publishes_a_new_generation(collections, tmp_path):
+    build(collections, tmp_path)
+    old = ScoreMatrix.load(tmp_path / "precomputed")
+    drugs, _ = collections
+    drugs.add(ids=["drug_new"], documents=["Drug new"], metadatas=[{'drug_name': "Drug new"}])
+    assert ScoreMatrix.load(tmp_path / "precomputed", [collection_version(c) for c in collections]) is None
+
+    build(collections, tmp_path)
+    new = ScoreMatrix.load(tmp_path / "precomputed", [collection_version(c) for c in collections])
+    assert new.directory != old.directory
+    assert new.directory.name == (tmp_path / "precomputed" / CURRENT).read_text()
+    # A reader that opened the previous build keeps a consistent one
+    assert len(old.drug_names) == old.disease_distances.shape[0] == 40
+    assert len(new.drug_names) == new.disease_distances.shape[0] == 41
+    assert (old.directory / MANIFEST).exists()
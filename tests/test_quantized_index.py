@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import quantized_index
+from quantized_index import QuantizedIndex, ScalarQuantizer, load_or_build_index, source_signature
+from vector_backend import QuantizedMatrix
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    # Clustered rows, like sentence embeddings, so neighbours are well separated
+    rng = np.random.default_rng(2)
+    centers = rng.standard_normal((40, 64)).astype(np.float32)
+    rows = centers[rng.integers(0, len(centers), 3000)] + 0.3 * rng.standard_normal((3000, 64)).astype(np.float32)
+    return rows.astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def queries(matrix):
+    rng = np.random.default_rng(9)
+    return (matrix[rng.integers(0, len(matrix), 20)] + 0.1 * rng.standard_normal((20, 64))).astype(np.float32)
+
+
+def exact_top_k(matrix, queries, k):
+    distances = (queries ** 2).sum(axis=1)[:, None] + (matrix ** 2).sum(axis=1) - 2 * queries @ matrix.T
+    return np.argsort(distances, axis=1, kind='stable')[:, :k], distances
+
+
+def test_int8_dots_match_decoded_rows(matrix, queries, monkeypatch):
+    quantizer = ScalarQuantizer.fit(matrix)
+    codes = quantizer.encode(matrix)
+    decoded = quantizer.center + quantizer.scale * codes.astype(np.float32)
+    # Rows are converted in slices of DECODE_ROWS, including a partial last one
+    monkeypatch.setattr(quantized_index, "DECODE_ROWS", 700)
+    assert np.allclose(quantizer.dots(queries, codes), queries @ decoded.T, rtol=1e-4, atol=1e-3)
+    assert np.abs(decoded - matrix).max() <= quantizer.scale.max() / 2 + 1e-6
+
+
+@pytest.mark.parametrize("method, max_error", [("int8", 0.01), ("pq", 0.5)])
+def test_approximate_distances(matrix, queries, method, max_error):
+    index = QuantizedIndex.build(matrix, method, subspaces=16)
+    _, exact = exact_top_k(matrix, queries, 1)
+    approximate = index.approximate_distances(queries, 'l2', slice(0, len(matrix)))
+    assert np.median(np.abs(approximate - exact) / exact) < max_error
+    assert np.allclose(index.sq_norms, (matrix ** 2).sum(axis=1), rtol=1e-5)
+
+
+@pytest.mark.parametrize("method", ["int8", "pq"])
+def test_candidates_contain_the_exact_top_k(matrix, queries, method, monkeypatch):
+    index = QuantizedIndex.build(matrix, method, subspaces=16)
+    expected, _ = exact_top_k(matrix, queries, 10)
+    # Blocks of candidates are merged across CHUNK_ROWS boundaries
+    monkeypatch.setattr(quantized_index, "CHUNK_ROWS", 1000)
+    candidates = index.candidates(queries, 200, 'l2')
+    recall = np.mean([len(set(e) & set(c)) / len(e) for e, c in zip(expected, candidates)])
+    assert recall >= (1.0 if method == "int8" else 0.95)
+
+    mask = np.zeros(len(matrix), dtype=bool)
+    mask[::3] = True
+    rows = np.flatnonzero(mask)
+    candidates = index.candidates(queries, 50, 'l2', rows)
+    assert np.isin(candidates, rows).all()
+
+
+@pytest.mark.parametrize("method", ["int8", "pq"])
+def test_reranked_top_k_is_exact(matrix, queries, method):
+    backend = QuantizedMatrix(matrix, [f"row_{i}" for i in range(len(matrix))], None, 'l2', index_dir=None,
+                              quantization=method, subspaces=16)
+    indices, distances = backend.top_k(queries, 10)
+    expected, exact = exact_top_k(matrix, queries, 10)
+    if method == "int8":
+        assert np.array_equal(indices, expected)
+    assert np.allclose(distances, np.take_along_axis(exact, indices, axis=1), rtol=1e-4, atol=1e-4)
+
+
+def test_saved_index_is_reused_until_the_source_changes(matrix, tmp_path):
+    index = load_or_build_index(tmp_path, "drug", matrix, "pq", subspaces=16)
+    loaded = QuantizedIndex.load(tmp_path, "drug")
+    assert np.array_equal(loaded.codes, index.codes)
+    assert loaded.manifest['source'] == source_signature(matrix)
+    assert loaded.config == {'method': 'pq', 'subspaces': 16}
+
+    again = load_or_build_index(tmp_path, "drug", matrix, "pq", subspaces=16)
+    assert again.manifest['created_at'] == loaded.manifest['created_at']
+    rebuilt = load_or_build_index(tmp_path, "drug", matrix[:-1], "pq", subspaces=16)
+    assert len(rebuilt) == len(matrix) - 1
+    assert load_or_build_index(tmp_path, "drug", matrix[:-1], "int8").config == {'method': 'int8'}
+    assert QuantizedIndex.load(tmp_path, "missing") is None
+
+
+def test_rebuild_publishes_a_new_generation(matrix, tmp_path):
+    load_or_build_index(tmp_path, "drug", matrix, "pq", subspaces=16)
+    old_dir = quantized_index.index_dir(tmp_path, "drug")
+    rebuilt = load_or_build_index(tmp_path, "drug", matrix[:-1], "int8")
+
+    new_dir = quantized_index.index_dir(tmp_path, "drug")
+    assert new_dir != old_dir and new_dir.parent == tmp_path / "drug"
+    # The previous generation is kept whole for readers still opening it
+    assert np.load(old_dir / quantized_index.CODES).shape == (len(matrix), 16)
+    loaded = QuantizedIndex.load(tmp_path, "drug")
+    assert loaded.config == {'method': 'int8'}
+    assert np.array_equal(loaded.codes, rebuilt.codes)
@@ -0,0 +1,57 @@
+from result_cache import ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_larger_top_k_answers_smaller_by_slicing():
+    cache = ResultCache()
+    cache.put("drugs", "Alzheimer", 20, list(range(20)))
+    assert cache.get("drugs", "  Alzheimer ", 5) == [0, 1, 2, 3, 4]
+    assert cache.get("drugs", "Alzheimer", 20) == list(range(20))
+    assert cache.get("drugs", "Alzheimer", 21) is None
+    assert cache.get("diseases", "Alzheimer", 5) is None
+    assert cache.stats()['hits'] == 2
+
+
+def test_short_list_means_the_collection_was_exhausted():
+    cache = ResultCache()
+    cache.put("drugs", "rare", 10, [1, 2, 3])
+    assert cache.get("drugs", "rare", 50) == [1, 2, 3]
+
+
+def test_smaller_result_does_not_replace_a_larger_one():
+    cache = ResultCache()
+    cache.put("drugs", "asthma", 20, list(range(20)))
+    cache.put("drugs", "asthma", 5, list(range(5)))
+    assert cache.get("drugs", "asthma", 10) == list(range(10))
+
+
+def test_expiry_and_lru_eviction():
+    clock = Clock()
+    cache = ResultCache(maxsize=2, ttl=10, clock=clock)
+    cache.put("drugs", "a", 5, [1])
+    cache.put("drugs", "b", 5, [2])
+    assert cache.get("drugs", "a", 5) == [1]
+    cache.put("drugs", "c", 5, [3])
+    assert cache.get("drugs", "b", 5) is None
+    assert cache.get("drugs", "a", 5) == [1]
+
+    clock.now = 11
+    assert cache.get("drugs", "a", 5) is None
+    # An expired larger entry no longer blocks a smaller one
+    cache.put("drugs", "c", 2, [3])
+    assert cache.get("drugs", "c", 2) == [3]
+
+
+def test_cached_results_are_a_copy():
+    cache = ResultCache()
+    results = [1, 2, 3]
+    cache.put("drugs", "copy", 3, results)
+    results.append(4)
+    assert cache.get("drugs", "copy", 3) == [1, 2, 3]
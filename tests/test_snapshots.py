@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import snapshots
+from snapshots import (
+    SnapshotWatcher, activate_snapshot, current_snapshot, leased_versions, list_snapshots, prune_snapshots,
+    snapshot_name
+)
+
+
+def publish(root, version):
+    """A minimal published snapshot: its directory and manifest"""
+    path = root / snapshot_name(version)
+    path.mkdir(parents=True)
+    (path / snapshots.MANIFEST).write_text(json.dumps({'version': version}))
+
+
+class Engine:
+    def __init__(self, snapshot):
+        if (snapshot.path / "broken").exists():
+            raise RuntimeError(f"cannot load {snapshot}")
+        self.version = snapshot.version
+        self.warm = False
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "snapshots"
+    for version in (1, 2, 3):
+        publish(root, version)
+    activate_snapshot(root, 1)
+    return root
+
+
+@pytest.fixture
+def watcher(root):
+    swapped = []
+    # Checked by hand: the watcher thread never polls within a test
+    watcher = SnapshotWatcher(Engine, root, interval=3600, warm_up=lambda e: setattr(e, 'warm', True),
+                              on_swap=swapped.append)
+    watcher.swapped = swapped
+    watcher.result()
+    yield watcher
+    watcher.stop()
+
+
+def test_listing_and_activation(root):
+    assert [snapshot.version for snapshot in list_snapshots(root)] == [1, 2, 3]
+    assert current_snapshot(root).version == 1
+    activate_snapshot(root, 3)
+    assert current_snapshot(root).version == 3
+    with pytest.raises(OSError):
+        activate_snapshot(root, 4)
+
+
+def test_swap_to_the_activated_snapshot(root, watcher):
+    old = watcher.value
+    assert watcher.check() is False
+
+    activate_snapshot(root, 2)
+    assert watcher.check() is True
+    assert watcher.value.version == 2 and watcher.value.warm
+    assert watcher.swapped == [watcher.value]
+    assert watcher.snapshot.version == 2
+    # Callers holding the old engine keep a working one
+    assert old.version == 1
+    assert leased_versions(root) == {2}
+
+
+def test_failed_swap_keeps_serving_and_the_served_version(root, watcher):
+    (root / snapshot_name(2) / "broken").touch()
+    activate_snapshot(root, 2)
+    assert watcher.check() is False
+    assert watcher.value.version == 1
+    assert watcher.failed_version == 2
+    assert isinstance(watcher.last_error, RuntimeError)
+    # Not retried until another version is activated
+    assert watcher.check() is False
+
+    activate_snapshot(root, 3)
+    assert prune_snapshots(root, keep=0) == [2]
+    assert [snapshot.version for snapshot in list_snapshots(root)] == [1, 3]
+
+    watcher.stop()
+    assert leased_versions(root) == set()
+    assert prune_snapshots(root, keep=0) == [1]
+
+
+def test_expired_leases_are_ignored_and_removed(root):
+    leases = root / snapshots.LEASES
+    leases.mkdir()
+    (leases / "1-1.json").write_text(json.dumps({'versions': [1], 'pid': 1, 'expires': 0}))
+    (leases / "2-2.json").write_text(json.dumps({'versions': [2], 'pid': 2, 'expires': 2 ** 40}))
+    activate_snapshot(root, 3)
+    assert leased_versions(root) == {2}
+    assert not (leases / "1-1.json").exists()
+    assert prune_snapshots(root, keep=1) == [1]
+
+
+def test_watcher_needs_an_active_snapshot(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        SnapshotWatcher(Engine, tmp_path)